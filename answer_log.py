@@ -0,0 +1,269 @@
+"""Registro colunar das respostas dos alunos e consultas agregadas para o professor.
+
+Cada resposta vira uma ou mais linhas (uma por etapa do ``Trajeto`` cobrada)
+acumuladas em memória; uma thread em segundo plano as grava em lote em
+arquivos Arrow IPC (formato stream), trocando de arquivo quando ele passa de
+um tamanho limite. As consultas abrem os arquivos por mmap e agregam com os
+``group_by`` vetorizados do Arrow, sem laços em Python por resposta.
+
+Os ids só valem para o índice que os gerou, então cada arquivo guarda nos
+metadados as chaves estáveis daquele índice (chave do órgão, nome da via e
+nome da estrutura). Depois de uma edição do ``data.json``, as respostas
+antigas são traduzidas para os ids atuais por essas chaves.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.ipc as ipc
+
+from background import guarded_step
+
+logger = logging.getLogger(__name__)
+
+LOG_SUFFIX = ".arrows"
+
+SCHEMA = pa.schema([
+    ("ts", pa.timestamp("ms")),
+    ("student", pa.string()),
+    ("kind", pa.string()),
+    ("organ", pa.int16()),
+    ("route", pa.int32()),
+    ("step", pa.int16()),
+    ("node", pa.int32()),
+    ("correct", pa.bool_()),
+])
+
+
+def _index_keys(index):
+    """Chaves estáveis dos ids do índice: órgãos, (órgão, via) e estruturas."""
+    return {
+        "organs": list(index.organ_keys),
+        "routes": [[index.organ_keys[index.route_organs[r]], index.route_names[r]] for r in range(index.num_routes)],
+        "nodes": list(index.node_names),
+    }
+
+
+class AnswerLogWriter:
+    """Acumula linhas de respostas e as grava em lote, em uma thread própria.
+
+    ``append`` só adiciona à lista pendente; o disco é tocado apenas pela
+    thread de gravação. Os arquivos levam o ``fingerprint`` e as chaves
+    estáveis do índice nos metadados do schema, pois os ids só valem para
+    aquele conjunto de dados. ``failures`` conta os lotes cuja gravação
+    falhou (eles voltam à fila).
+    """
+
+    def __init__(self, directory, index, rotate_bytes=64 * 1024 * 1024, flush_interval=2.0):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.flush_interval = flush_interval
+        self.schema = SCHEMA.with_metadata({
+            "fingerprint": index.fingerprint,
+            "keys": json.dumps(_index_keys(index), ensure_ascii=False),
+        })
+        self._pending = []
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._sink = None
+        self._writer = None
+        self._sequence = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="answer-log-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, student, kind, organ, route, rows, ts=None):
+        """Enfileira as linhas (etapa, estrutura, acerto) de uma resposta."""
+        ts = int((time.time() if ts is None else ts) * 1000)
+        with self._lock:
+            self._pending.extend((ts, student, kind, organ, route, step, node, correct)
+                                 for step, node, correct in rows)
+
+    def flush(self):
+        """Grava imediatamente as linhas pendentes como um único lote."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        columns = list(zip(*rows))
+        batch = pa.record_batch(
+            [pa.array(col, type=field.type) for col, field in zip(columns, self.schema)],
+            schema=self.schema
+        )
+        try:
+            with self._io_lock:
+                if self._writer is None:
+                    self._open()
+                self._writer.write_batch(batch)
+                self._sink.flush()
+                if self._sink.tell() >= self.rotate_bytes:
+                    self._close_file()
+        except Exception:
+            # O arquivo atual pode ter ficado incompleto: as linhas voltam à fila e vão para outro arquivo
+            with self._io_lock:
+                self._writer = self._sink = None
+            with self._lock:
+                self._pending[:0] = rows
+            raise
+
+    def close(self):
+        """Grava o que estiver pendente e fecha o arquivo atual."""
+        self.flush()
+        with self._io_lock:
+            self._close_file()
+
+    def _open(self):
+        # Outro gravador do mesmo processo (de outra versão do índice) pode ter
+        # criado o mesmo nome no mesmo segundo: o arquivo nunca é sobrescrito
+        while True:
+            self._sequence += 1
+            name = f"answers-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence}{LOG_SUFFIX}"
+            try:
+                self._sink = open(os.path.join(self.directory, name), "xb")
+                break
+            except FileExistsError:
+                continue
+        self._writer = ipc.new_stream(self._sink, self.schema)
+
+    def _close_file(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            self._writer = self._sink = None
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            # Se falhar, as linhas voltam à fila para o próximo ciclo
+            guarded_step(self, self.flush, logger, "Falha ao gravar o registro de respostas em %s", self.directory)
+
+
+def _read_log(path):
+    """Lê os lotes completos de um arquivo; o último pode estar sendo gravado."""
+    batches = []
+    with pa.memory_map(path) as source:
+        try:
+            reader = ipc.open_stream(source)
+            for batch in reader:
+                batches.append(batch)
+        except (pa.ArrowInvalid, OSError):
+            pass
+    if not batches:
+        return None
+    return pa.Table.from_batches(batches)
+
+
+class _KeyMap:
+    """Ids atuais de cada chave estável do índice, para traduzir arquivos de outras versões."""
+
+    def __init__(self, index):
+        self.organs = {key: i for i, key in enumerate(index.organ_keys)}
+        self.routes = {(index.organ_keys[index.route_organs[r]], index.route_names[r]): r
+                       for r in range(index.num_routes)}
+        self.nodes = {name: i for i, name in enumerate(index.node_names)}
+        # Posição de cada estrutura em cada via, ordenada pela chave via * num_nodes + estrutura
+        self.num_nodes = index.num_nodes
+        positions = sorted((r * index.num_nodes + n, step)
+                           for r in range(index.num_routes) for step, n in enumerate(index.route(r)))
+        self.pairs = np.array([p for p, _ in positions], dtype=np.int64)
+        self.steps = np.array([step for _, step in positions], dtype=np.int64)
+
+    @staticmethod
+    def _lookup(old_keys, new_ids, old_ids):
+        """Ids atuais dos ids antigos ``old_ids`` (-1 se a chave não existe mais no índice)."""
+        table = np.array([new_ids.get(key, -1) for key in old_keys], dtype=np.int64)
+        return table[old_ids]
+
+    def remap(self, table, keys):
+        """Traduz os ids de um arquivo de outra versão do índice; retorna (tabela, linhas descartadas).
+
+        A etapa é recalculada como a posição da estrutura na via atual, de modo
+        que uma via editada continua agrupada pela estrutura cobrada. Linhas cujo
+        órgão, via ou estrutura não existem mais (ou a estrutura saiu da via) são
+        descartadas.
+        """
+        organs = self._lookup(keys["organs"], self.organs, table["organ"].to_numpy())
+        routes = self._lookup([tuple(k) for k in keys["routes"]], self.routes, table["route"].to_numpy())
+        nodes = self._lookup(keys["nodes"], self.nodes, table["node"].to_numpy())
+        wanted = routes * self.num_nodes + nodes
+        found = np.minimum(np.searchsorted(self.pairs, wanted), len(self.pairs) - 1)
+        keep = (organs >= 0) & (routes >= 0) & (nodes >= 0) & (self.pairs[found] == wanted)
+
+        mask = pa.array(keep)
+        remapped = pa.table({
+            "ts": table["ts"].filter(mask),
+            "student": table["student"].filter(mask),
+            "kind": table["kind"].filter(mask),
+            "organ": pa.array(organs[keep], pa.int16()),
+            "route": pa.array(routes[keep], pa.int32()),
+            "step": pa.array(self.steps[found[keep]], pa.int16()),
+            "node": pa.array(nodes[keep], pa.int32()),
+            "correct": table["correct"].filter(mask),
+        }, schema=SCHEMA)
+        return remapped, table.num_rows - remapped.num_rows
+
+
+def load_answers(directory, index):
+    """Junta em uma tabela todas as respostas registradas, com os ids do índice indicado.
+
+    Retorna (tabela, linhas ocultas). Arquivos de outras versões do conjunto
+    de dados são traduzidos pelas chaves estáveis; as linhas que não puderem
+    ser associadas ao índice atual, inclusive as de arquivos gravados sem as
+    chaves, são contadas em vez de exibidas.
+    """
+    tables, hidden, key_map = [], 0, None
+    for path in sorted(glob.glob(os.path.join(directory, f"*{LOG_SUFFIX}"))):
+        table = _read_log(path)
+        if table is None:
+            continue
+        metadata = table.schema.metadata or {}
+        table = table.replace_schema_metadata(None)
+        if metadata.get(b"fingerprint") != index.fingerprint.encode():
+            if b"keys" not in metadata:
+                hidden += table.num_rows
+                continue
+            key_map = key_map or _KeyMap(index)
+            table, dropped = key_map.remap(table, json.loads(metadata[b"keys"]))
+            hidden += dropped
+        tables.append(table)
+    if not tables:
+        return SCHEMA.empty_table(), hidden
+    return pa.concat_tables(tables), hidden
+
+
+def _error_rates(table, keys):
+    """Agrupa por ``keys`` e calcula respostas, erros e taxa de erro."""
+    errors = pc.cast(pc.invert(table["correct"]), pa.int64())
+    grouped = (table.select(keys).append_column("errors", errors)
+               .group_by(keys).aggregate([("errors", "count"), ("errors", "sum")])
+               .rename_columns(keys + ["answers", "errors"]))
+    rate = pc.divide(pc.cast(grouped["errors"], pa.float64()), grouped["answers"])
+    return grouped.append_column("error_rate", rate)
+
+
+def error_rate_by_step(table):
+    """Taxa de erro por etapa de cada ``Trajeto`` (via, etapa), da pior para a melhor."""
+    return _error_rates(table, ["route", "step", "node"]).sort_by(
+        [("error_rate", "descending"), ("answers", "descending")])
+
+
+def error_rate_by_organ(table):
+    """Taxa de erro por órgão e modo de jogo."""
+    return _error_rates(table, ["organ", "kind"]).sort_by([("organ", "ascending"), ("kind", "ascending")])
+
+
+def error_rate_over_time(table, unit="day"):
+    """Taxa de erro por período (``unit`` aceito por ``pyarrow.compute.floor_temporal``)."""
+    period = pc.floor_temporal(table["ts"], unit=unit)
+    periods = pa.table({"period": period, "correct": table["correct"]})
+    return _error_rates(periods, ["period"]).sort_by("period")
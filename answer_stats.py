@@ -0,0 +1,89 @@
+"""Estatísticas incrementais de acerto por estrutura, transição, órgão e modo de jogo.
+
+Cada resposta atualiza contadores (tentativas, erros) em O(1); as visões de
+desempenho leem esses agregados prontos em vez de reprocessar o histórico.
+"""
+
+import heapq
+import threading
+
+# Dimensões agregadas
+NODE = "node"
+EDGE = "edge"
+ORGAN = "organ"
+MODE = "mode"
+DIMENSIONS = (NODE, EDGE, ORGAN, MODE)
+
+
+class AnswerStats:
+    """Contadores [tentativas, erros] por dimensão, seguros entre threads."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {dim: {} for dim in DIMENSIONS}
+
+    def record(self, dim, key, correct):
+        """Soma uma tentativa (e um erro, se for o caso) à chave da dimensão."""
+        with self._lock:
+            entry = self._counts[dim].get(key)
+            if entry is None:
+                entry = self._counts[dim][key] = [0, 0]
+            entry[0] += 1
+            if not correct:
+                entry[1] += 1
+
+    def record_answer(self, mode, organ_id, correct, nodes=(), edges=()):
+        """Registra uma resposta: modo e órgão, mais cada (estrutura, acerto) e ((a, b), acerto)."""
+        self.record(MODE, mode, correct)
+        self.record(ORGAN, organ_id, correct)
+        for node, node_correct in nodes:
+            self.record(NODE, node, node_correct)
+        for edge, edge_correct in edges:
+            self.record(EDGE, edge, edge_correct)
+
+    def counts(self, dim, key):
+        """(tentativas, erros) da chave, em O(1)."""
+        with self._lock:
+            attempts, errors = self._counts[dim].get(key, (0, 0))
+        return attempts, errors
+
+    def accuracy(self, dim, key):
+        """Taxa de acerto da chave, ou None sem tentativas."""
+        attempts, errors = self.counts(dim, key)
+        return (attempts - errors) / attempts if attempts else None
+
+    def weakest(self, dim, k=5, min_attempts=2):
+        """As k chaves com maior taxa de erro entre as que têm tentativas suficientes."""
+        with self._lock:
+            items = [(key, a, e) for key, (a, e) in self._counts[dim].items() if a >= min_attempts and e]
+        return heapq.nlargest(k, items, key=lambda item: (item[2] / item[1], item[1]))
+
+    def to_dict(self):
+        """Forma serializável em JSON (chaves de arestas viram "a-b")."""
+        with self._lock:
+            data = {dim: {self._encode(key): list(v) for key, v in table.items()}
+                    for dim, table in self._counts.items()}
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for dim in DIMENSIONS:
+            for key, value in data.get(dim, {}).items():
+                stats._counts[dim][cls._decode(dim, key)] = list(value)
+        return stats
+
+    @staticmethod
+    def _encode(key):
+        if isinstance(key, tuple):
+            return f"{key[0]}-{key[1]}"
+        return str(key)
+
+    @staticmethod
+    def _decode(dim, key):
+        if dim == EDGE:
+            a, b = key.split("-")
+            return int(a), int(b)
+        if dim in (NODE, ORGAN):
+            return int(key)
+        return key
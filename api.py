@@ -0,0 +1,273 @@
+"""API HTTP (ASGI) com as perguntas e as vias de drenagem, fora do loop do Streamlit.
+
+Um app ASGI puro, sem framework: cada requisição chama diretamente o núcleo
+de ``questions.py``, sem rerun de script nem estado de sessão. A pergunta
+viaja dentro de um token assinado (``question_tokens.py``), então qualquer
+processo com o mesmo ``DRENAGEM_API_SECRET`` corrige qualquer resposta.
+
+Rotas (todas aceitam ``?regiao=<chave>`` do registro de conjuntos de dados):
+
+    GET  /v1/organs                   órgãos e suas vias
+    GET  /v1/routes/<id>              trajeto completo de uma via
+    GET  /v1/questions?kind=quiz&n=5  perguntas novas (quiz, clinical ou sequence);
+                                      &difficulty=0..1 troca distratores uniformes por próximos
+    POST /v1/grade                    {"token": ..., "answer": ...} ou uma lista deles
+
+Uso (requer ``uvicorn``):
+    python api.py --host 0.0.0.0 --port 8000 --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import secrets
+from urllib.parse import parse_qs
+
+from dataset import DatasetError, DatasetRegistry
+from question_tokens import InvalidTokenError, QuestionTokens, StaleTokenError
+from questions import (
+    CLINICAL_CASE, QUICK_QUIZ, SEQUENCE, NoEligibleQuestionsError, generate_batch, grade, question_payload
+)
+
+DATASETS_FILE = os.environ.get("DRENAGEM_DATASETS", "datasets.json")
+DATA_MODE = os.environ.get("DRENAGEM_DATA_MODE", "json")
+DATA_POLL_INTERVAL = float(os.environ.get("DRENAGEM_DATA_POLL_INTERVAL", "2"))
+DATASET_CACHE_MB = float(os.environ.get("DRENAGEM_DATASET_CACHE_MB", "256"))
+SHARED_DIR = os.environ.get("DRENAGEM_SHARED_DIR", "")
+
+# Segredo dos tokens; sem ele, cada processo sorteia o seu e os tokens só
+# valem no processo que os emitiu
+API_SECRET = os.environ.get("DRENAGEM_API_SECRET", "")
+TOKEN_TTL = float(os.environ.get("DRENAGEM_API_TOKEN_TTL", str(24 * 3600)))
+
+MAX_QUESTIONS = 50
+MAX_BODY_BYTES = 256 * 1024
+KINDS = (QUICK_QUIZ, CLINICAL_CASE, SEQUENCE)
+
+
+class HTTPError(Exception):
+    """Erro devolvido ao cliente como ``{"error": ...}`` com o status indicado."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _node(index, node_id):
+    return {"id": node_id, "name": index.node_names[node_id]}
+
+
+def _is_id(value):
+    """Id de estrutura vindo do JSON: inteiro, mas não ``true``/``false``."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class DrainageAPI:
+    """Aplicação ASGI; ``registry`` fornece os conjuntos de dados e ``tokens`` assina as perguntas."""
+
+    def __init__(self, registry, tokens):
+        self.registry = registry
+        self.tokens = tokens
+        self.routes = {
+            ("GET", "organs"): self.organs,
+            ("GET", "routes"): self.route,
+            ("GET", "questions"): self.questions,
+            ("POST", "grade"): self.grade,
+        }
+
+    @classmethod
+    def from_env(cls):
+        registry = DatasetRegistry.from_file(
+            DATASETS_FILE, mode=DATA_MODE, poll_interval=DATA_POLL_INTERVAL,
+            max_bytes=int(DATASET_CACHE_MB * 1024 * 1024),
+            shared_dir=os.path.join(SHARED_DIR, "index") if SHARED_DIR else None
+        )
+        return cls(registry, QuestionTokens(API_SECRET or secrets.token_bytes(32), max_age=TOKEN_TTL))
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        try:
+            parts = scope["path"].strip("/").split("/")
+            if len(parts) < 2 or parts[0] != "v1":
+                raise HTTPError(404, "Rota inexistente.")
+            handler = self.routes.get((scope["method"], parts[1]))
+            if handler is None:
+                known = {name for _, name in self.routes}
+                raise HTTPError(405 if parts[1] in known else 404, "Rota ou método inexistente.")
+            query = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+            body = await self._read_body(receive) if scope["method"] == "POST" else None
+            # Compilar o conjunto de dados e gerar ou corrigir perguntas bloqueia:
+            # roda em uma thread para não parar as outras requisições do processo
+            loop = asyncio.get_running_loop()
+            status, payload = 200, await loop.run_in_executor(None, self._handle, handler, parts[2:], query, body)
+        except HTTPError as e:
+            status, payload = e.status, {"error": e.message}
+
+        data = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json; charset=utf-8"),
+            (b"content-length", str(len(data)).encode("ascii")),
+        ]})
+        await send({"type": "http.response.body", "body": data})
+
+    async def _read_body(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            chunk = message.get("body", b"")
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, "Corpo da requisição grande demais.")
+            chunks.append(chunk)
+            if not message.get("more_body"):
+                break
+        try:
+            return json.loads(b"".join(chunks))
+        except ValueError:
+            raise HTTPError(400, "O corpo deve ser JSON.") from None
+
+    def _handle(self, handler, args, query, body):
+        return handler(self._index(query), args, query, body)
+
+    def _index(self, query):
+        key = query.get("regiao", self.registry.default_key)
+        if key not in self.registry.entries:
+            raise HTTPError(404, f"Conjunto de dados desconhecido: {key}")
+        try:
+            return self.registry.get(key).index
+        except (OSError, DatasetError) as e:
+            raise HTTPError(503, f"Conjunto de dados indisponível: {e}") from None
+
+    # ------------------------------------------------------------------
+    # Rotas
+    # ------------------------------------------------------------------
+
+    def organs(self, index, args, query, body):
+        return [
+            {
+                "key": organ_key,
+                "name": index.organ_names[index.organ_id(organ_key)],
+                "routes": [
+                    {"id": r, "name": index.route_names[r], "steps": len(index.route(r))}
+                    for r in index.organ_routes(organ_key)
+                ],
+            }
+            for organ_key in index.organ_keys
+        ]
+
+    def route(self, index, args, query, body):
+        try:
+            route_id = int(args[0])
+        except (IndexError, ValueError):
+            raise HTTPError(400, "Informe o id numérico da via: /v1/routes/<id>.") from None
+        if not 0 <= route_id < index.num_routes:
+            raise HTTPError(404, f"Via inexistente: {route_id}")
+        return {
+            "id": route_id,
+            "organ": index.organ_names[index.route_organs[route_id]],
+            "name": index.route_names[route_id],
+            "trajeto": [_node(index, n) for n in index.route(route_id)],
+        }
+
+    def questions(self, index, args, query, body):
+        kind = query.get("kind", QUICK_QUIZ)
+        if kind not in KINDS:
+            raise HTTPError(400, f"Tipo de pergunta inválido; use um de: {', '.join(KINDS)}")
+        try:
+            n = min(max(int(query.get("n", "1")), 1), MAX_QUESTIONS)
+        except ValueError:
+            raise HTTPError(400, "O parâmetro n deve ser um número inteiro.") from None
+        try:
+            difficulty = min(max(float(query.get("difficulty", "0")), 0.0), 1.0)
+        except ValueError:
+            raise HTTPError(400, "O parâmetro difficulty deve ser um número entre 0 e 1.") from None
+        try:
+            batch = generate_batch(index, kind, n, difficulty=difficulty)
+        except NoEligibleQuestionsError as e:
+            raise HTTPError(404, str(e)) from None
+        return [self._question(index, q) for q in batch]
+
+    def _question(self, index, question):
+        """Pergunta para o cliente, sem a resposta: ela só existe cifrada no token."""
+        payload = question_payload(index, question)
+        out = {"token": self.tokens.encode(question, index.fingerprint), "kind": question.kind}
+        if question.kind == SEQUENCE:
+            route = index.route(question.route_id)
+            out.update(organ=payload["organ"], route=payload["route"],
+                       items=[_node(index, route[i]) for i in question.order])
+        else:
+            out.update(prompt=payload["prompt"], options=[_node(index, n) for n in question.options])
+        return out
+
+    def grade(self, index, args, query, body):
+        if isinstance(body, list):
+            if len(body) > MAX_QUESTIONS:
+                raise HTTPError(413, f"No máximo {MAX_QUESTIONS} respostas por requisição.")
+            return [self._grade_one(index, item) for item in body]
+        return self._grade_one(index, body)
+
+    def _grade_one(self, index, item):
+        if not isinstance(item, dict) or not isinstance(item.get("token"), str) or "answer" not in item:
+            raise HTTPError(400, 'Cada resposta deve ser {"token": ..., "answer": ...}.')
+        try:
+            question = self.tokens.decode(item["token"], index.fingerprint)
+        except StaleTokenError as e:
+            raise HTTPError(409, str(e)) from None
+        except InvalidTokenError as e:
+            raise HTTPError(400, str(e)) from None
+
+        answer = item["answer"]
+        route = index.route(question.route_id)
+        if question.kind == SEQUENCE:
+            if not isinstance(answer, list) or not all(_is_id(n) for n in answer):
+                raise HTTPError(400, "A resposta da sequência deve ser a lista de ids na ordem escolhida.")
+            try:
+                result = grade(index, question, answer)
+            except ValueError as e:
+                raise HTTPError(400, str(e)) from None
+            return {
+                "correct": result.correct,
+                "credit": round(result.credit, 4),
+                "correct_sequence": [_node(index, n) for n in route],
+                "steps": [correct for _, correct in result.steps],
+            }
+        if not _is_id(answer):
+            raise HTTPError(400, "A resposta deve ser o id da estrutura escolhida.")
+        result = grade(index, question, answer)
+        return {"correct": result.correct, "correct_answer": _node(index, question.answer)}
+
+
+app = DrainageAPI.from_env()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="API HTTP das perguntas de drenagem linfática.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processos; com mais de um, defina DRENAGEM_API_SECRET.")
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        parser.exit(1, "A API precisa do uvicorn (pip install uvicorn) ou de outro servidor ASGI.\n")
+    if args.workers > 1 and not API_SECRET:
+        parser.exit(1, "Com mais de um processo, defina DRENAGEM_API_SECRET para que todos aceitem os mesmos tokens.\n")
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers,
+                log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
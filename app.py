@@ -1,8 +1,150 @@
 import streamlit as st
-import graphviz
-import json
+from streamlit.errors import StreamlitAPIException
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.state import SessionStateProxy
+import base64
+import os
 import random
+import re
+import threading
+import time
+import uuid
+from contextlib import nullcontext
 from datetime import datetime
+from functools import wraps
+
+from answer_stats import EDGE, MODE, NODE, ORGAN, AnswerStats
+from dataset import DatasetError, DatasetRegistry
+from exams import (
+    RESULTS_FILE, Exam, ExamClosedError, ExamStartedError, build_exam, close_exam, list_exams, valid_student_id
+)
+from instrumentation import Profiler, RerunTimings, count_item_access, start_metrics_server
+from progress_store import WriteBehindWriter, open_progress_store
+from question_bank import QuestionBank
+from questions import (
+    ADAPTIVE_LOW, CLINICAL_CASE, QUICK_QUIZ, SEQUENCE, NoEligibleQuestionsError, eligible_questions,
+    difficulty_for, generate_batch, generate_for_items, grade, question_payload, sequence_credit
+)
+from scheduler import ReviewScheduler
+from sessions import IdleSessionReaper, deep_sizeof
+from static_site import full_diagram, load_manifest, organ_diagram, route_diagram, study_page
+from graph_render import (
+    DEFAULT_STYLE, GRAPH_STYLES, RenderCache, build_merged_graph, build_route_graph,
+    highlight_for_node, highlight_for_route, highlight_rendered, merged_scope
+)
+
+# Modo de carregamento dos dados: "json" (dicionário original) ou "dag"
+# (trajetos fundidos em um DAG com troncos compartilhados)
+DATA_MODE = os.environ.get("DRENAGEM_DATA_MODE", "json")
+
+# Intervalo (s) entre as verificações de alteração do data.json (0 desativa a recarga)
+DATA_POLL_INTERVAL = float(os.environ.get("DRENAGEM_DATA_POLL_INTERVAL", "2"))
+
+# Registro dos conjuntos de dados (regiões) publicados; sem ele, só o data.json.
+# Cada conjunto é carregado na primeira escolha e os menos usados saem da
+# memória quando o total passa do limite (MB)
+DATASETS_FILE = os.environ.get("DRENAGEM_DATASETS", "datasets.json")
+DATASET_CACHE_MB = float(os.environ.get("DRENAGEM_DATASET_CACHE_MB", "256"))
+
+# Implantação com vários processos: diretório (de preferência em /dev/shm)
+# onde o índice compilado e os SVGs dos fluxogramas são gravados uma vez e
+# mapeados/lidos por todos os processos; vazio mantém tudo em cada processo
+SHARED_DIR = os.environ.get("DRENAGEM_SHARED_DIR", "")
+
+# Navegação: "lazy" executa apenas a seção ativa a cada rerun; "tabs" usa
+# st.tabs, que executa todas as abas. Com a instrumentação ou a chave do
+# professor, pode ser sobrescrito com ?nav=tabs na URL.
+NAV_MODES = ("tabs", "lazy")
+NAV_MODE = os.environ.get("DRENAGEM_NAV_MODE", "lazy")
+
+# Seções da aplicação
+SECTIONS = {
+    "vias": "🗺️ Vias de Drenagem",
+    "estudo": "📚 Estudo",
+    "jogos": "🎮 Jogos Interativos",
+}
+
+# Painel do professor: aparece apenas com ?professor=<chave> na URL, e só se
+# DRENAGEM_INSTRUCTOR_KEY estiver definida
+INSTRUCTOR_SECTION = ("professor", "👩‍🏫 Painel do Professor")
+INSTRUCTOR_KEY = os.environ.get("DRENAGEM_INSTRUCTOR_KEY", "")
+
+# Prefixos das chaves de widgets cujo valor deve sobreviver à troca de seção
+SECTION_STATE_PREFIXES = ("pathway_", "merged_", "game_mode_selection")
+
+# Perguntas pré-geradas por sessão: tamanho de cada lote e nível mínimo do
+# estoque antes de reabastecer ao final do rerun
+QUESTION_POOL_SIZE = int(os.environ.get("DRENAGEM_QUESTION_POOL_SIZE", "8"))
+QUESTION_POOL_LOW = 2
+
+# Banco de perguntas pré-compilado (python question_bank.py build); se ausente
+# ou compilado a partir de outros dados, as perguntas são geradas na hora
+QUESTION_BANK_DIR = os.environ.get("DRENAGEM_QUESTION_BANK", "question_bank")
+
+# Pacote estático (python static_site.py build): diretório local onde ele foi
+# gerado e URL pública de onde o navegador baixa os fluxogramas e as páginas
+# de estudo. Sem a URL, ou sem pacote para os dados atuais, tudo é gerado aqui
+STATIC_SITE_DIR = os.environ.get("DRENAGEM_STATIC_DIR", "static_site")
+STATIC_SITE_URL = os.environ.get("DRENAGEM_STATIC_URL", "").rstrip("/")
+
+# Progresso dos alunos: banco SQLite (ou diretório JSON de reserva) e
+# intervalo (s) entre as gravações em lote
+PROGRESS_DB = os.environ.get("DRENAGEM_PROGRESS_DB", "progress.sqlite3")
+PROGRESS_FLUSH_INTERVAL = float(os.environ.get("DRENAGEM_PROGRESS_FLUSH_INTERVAL", "2"))
+
+# Registro colunar das respostas (Arrow IPC) e tamanho (MB) de cada arquivo
+ANSWER_LOG_DIR = os.environ.get("DRENAGEM_ANSWER_LOG", "answer_log")
+ANSWER_LOG_ROTATE_MB = float(os.environ.get("DRENAGEM_ANSWER_LOG_ROTATE_MB", "64"))
+
+# Provas com formulários fixos: diretório das provas geradas no painel do
+# professor; o aluno abre a sua com ?prova=<id>
+EXAMS_DIR = os.environ.get("DRENAGEM_EXAMS", "exams")
+
+# Revisão espaçada (SM-2) no quiz rápido: "1" ativa, "0" volta ao sorteio uniforme
+SRS_ENABLED = os.environ.get("DRENAGEM_SRS", "1") == "1"
+
+# Distratores adaptativos: "1" troca distratores uniformes por estruturas
+# próximas da resposta à medida que o acerto recente do aluno sobe
+ADAPTIVE_ENABLED = os.environ.get("DRENAGEM_ADAPTIVE", "1") == "1"
+# Peso de cada nova resposta na média móvel exponencial do acerto
+ACCURACY_SMOOTHING = 0.2
+
+# Contadores de pontuação persistidos por aluno
+PROGRESS_COUNTERS = (
+    "total_score", "total_questions", "quiz_score", "quiz_total",
+    "clinical_score", "clinical_total", "sequence_score", "sequence_total", "sequence_points"
+)
+
+# Conquistas, na ordem dos bits da máscara guardada na sessão
+ACHIEVEMENTS = ("primeira_decena", "meio_centenario", "expert", "mestre", "perfeito")
+
+# Sessões sem reruns por mais que este tempo (s) são encerradas depois de
+# gravar o progresso (0 desativa), e tamanho esperado do estado de cada sessão
+SESSION_IDLE_TIMEOUT = float(os.environ.get("DRENAGEM_SESSION_IDLE_TIMEOUT", "1800"))
+SESSION_BYTES_BUDGET = int(os.environ.get("DRENAGEM_SESSION_BYTES_BUDGET", "65536"))
+
+# Chaves da sessão que referenciam ids do índice; descartadas quando o data.json é recarregado
+INDEX_STATE_KEYS = (
+    "quiz_question", "quiz_answer", "quiz_item", "study_question", "study_answer",
+    "clinical_question", "clinical_answer", "sequence_question", "sequence_answer",
+    "review_scheduler", "review_fingerprint", "answer_stats", "stats_fingerprint"
+)
+
+# Modos de visualização da aba de vias de drenagem
+PATHWAY_VIEWS = ["Via individual", "Órgão completo", "Abdome completo"]
+
+# Cache de fluxogramas: número máximo de entradas e tempo limite do layout (s)
+RENDER_CACHE_SIZE = int(os.environ.get("DRENAGEM_RENDER_CACHE_SIZE", "256"))
+DOT_TIMEOUT = float(os.environ.get("DRENAGEM_DOT_TIMEOUT", "5"))
+
+# Instrumentação opcional: tempos das funções de renderização, acessos ao
+# session_state, tamanho das mensagens e endpoint /metrics local (Prometheus)
+INSTRUMENTATION = os.environ.get("DRENAGEM_INSTRUMENTATION", "0") == "1"
+METRICS_PORT = int(os.environ.get("DRENAGEM_METRICS_PORT", "9464"))
+
+# CSS e trechos de HTML estáticos
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets")
 
 # Configuração da página
 st.set_page_config(
@@ -12,94 +154,171 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+@st.cache_resource(show_spinner=False)
+def static_html(name: str):
+    """Conteúdo de ``assets/<name>`` pronto para st.markdown, lido e compactado uma vez por processo."""
+    with open(os.path.join(ASSETS_DIR, name), "r", encoding="utf-8") as f:
+        text = f.read()
+    if name.endswith(".css"):
+        text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+        text = re.sub(r"\s*([{};:,>])\s*", r"\1", text)
+        return "<style>" + re.sub(r"\s+", " ", text).replace(";}", "}").strip() + "</style>"
+    return " ".join(line.strip() for line in text.splitlines() if line.strip())
+
 # CSS customizado para melhorar a aparência
-st.markdown("""
-<style>
-    .main-header {
-        text-align: center;
-        color: #1e3a8a;
-        font-size: 2.5rem;
-        font-weight: bold;
-        margin-bottom: 0.5rem;
-    }
-    .subtitle {
-        text-align: center;
-        color: #64748b;
-        font-size: 1.1rem;
-        margin-bottom: 2rem;
-    }
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 8px;
-        background-color: #f8fafc;
-        padding: 10px;
-        border-radius: 10px;
-    }
-    .stTabs [data-baseweb="tab"] {
-        height: 50px;
-        background-color: white;
-        border-radius: 8px;
-        padding: 10px 20px;
-        font-weight: 600;
-        border: 2px solid #e2e8f0;
-    }
-    .stTabs [aria-selected="true"] {
-        background-color: #1e3a8a !important;
-        color: white !important;
-        border-color: #1e3a8a !important;
-    }
-    .organ-card {
-        background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        padding: 20px;
-        border-radius: 12px;
-        color: white;
-        margin: 10px 0;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-    }
-    .pathway-info {
-        background-color: #f0f9ff;
-        padding: 15px;
-        border-radius: 8px;
-        border-left: 4px solid #0284c7;
-        margin: 10px 0;
-    }
-    .score-card {
-        background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
-        padding: 20px;
-        border-radius: 12px;
-        color: white;
-        text-align: center;
-        box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-    }
-    .achievement-badge {
-        background: linear-gradient(135deg, #ffd89b 0%, #19547b 100%);
-        padding: 10px 20px;
-        border-radius: 20px;
-        color: white;
-        display: inline-block;
-        margin: 5px;
-        font-weight: bold;
-    }
-    .game-mode-card {
-        background-color: white;
-        padding: 25px;
-        border-radius: 12px;
-        border: 2px solid #e2e8f0;
-        margin: 10px 0;
-        transition: all 0.3s;
-    }
-    .game-mode-card:hover {
-        border-color: #3b82f6;
-        box-shadow: 0 8px 16px rgba(0,0,0,0.1);
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(static_html("style.css"), unsafe_allow_html=True)
+
+# Instrumentação
+@st.cache_resource
+def get_profiler():
+    """Profiler do processo; conta os acessos ao session_state quando a instrumentação está ativa."""
+    profiler = Profiler()
+    if INSTRUMENTATION:
+        count_item_access(SessionStateProxy, profiler, "session_state_ops")
+    return profiler
+
+@st.cache_resource
+def get_metrics_server(port: int):
+    """Endpoint /metrics em 127.0.0.1, ou None se a porta estiver ocupada."""
+    try:
+        return start_metrics_server(get_profiler(), port=port)
+    except OSError:
+        return None
+
+def profiled(name):
+    """Cronometra a função decorada quando a instrumentação está ativa; caso contrário, não a altera."""
+    if not INSTRUMENTATION:
+        return lambda func: func
+    return get_profiler().timed(name)
+
+def measure(name):
+    """Cronometra um bloco ``with`` quando a instrumentação está ativa."""
+    return get_profiler().measure(name) if INSTRUMENTATION else nullcontext()
+
+def instrument_messages():
+    """Conta o número e o tamanho das mensagens enviadas ao navegador por esta sessão."""
+    ctx = get_script_run_ctx()
+    if ctx is None or getattr(ctx._enqueue, "profiled", False):
+        return
+    enqueue, profiler = ctx._enqueue, get_profiler()
+
+    def counted_enqueue(msg):
+        kind = msg.WhichOneof("type") or "other"
+        profiler.count("forward_msgs", kind)
+        profiler.count("forward_msg_bytes", kind, msg.ByteSize())
+        enqueue(msg)
+
+    counted_enqueue.profiled = True
+    ctx._enqueue = counted_enqueue
 
 # Cache para carregar dados
-@st.cache_data
-def load_data(path: str):
-    """Carrega os dados dos órgãos de um arquivo JSON."""
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+@st.cache_resource
+def get_dataset_registry(path: str):
+    """Registro dos conjuntos de dados; nenhum deles é lido antes de ser escolhido."""
+    return DatasetRegistry.from_file(
+        path, mode=DATA_MODE, poll_interval=DATA_POLL_INTERVAL,
+        max_bytes=int(DATASET_CACHE_MB * 1024 * 1024),
+        shared_dir=os.path.join(SHARED_DIR, "index") if SHARED_DIR else None
+    )
+
+@profiled("load_data")
+def load_data(dataset_key: str):
+    """Instantâneo atual do conjunto de dados (órgãos e índice compilado), validado e compilado uma vez.
+
+    Deve ser lido uma única vez por rerun: uma recarga publicada no meio do
+    rerun só aparece no próximo.
+    """
+    return get_dataset_registry(DATASETS_FILE).get(dataset_key)
+
+# Recursos derivados do índice são criados por versão do conjunto de dados
+# (chave ``fingerprint``); as versões antigas saem do cache após uma recarga
+@st.cache_resource(max_entries=2)
+def get_render_cache(fingerprint: str, _index):
+    """Cria o cache de fluxogramas e o aquece em segundo plano com todas as vias.
+
+    Com ``SHARED_DIR``, o aquecimento só grava os SVGs que faltam no
+    diretório compartilhado; cada processo guarda na memória apenas os que exibiu.
+    """
+    if SHARED_DIR:
+        cache = RenderCache(maxsize=RENDER_CACHE_SIZE, timeout=DOT_TIMEOUT,
+                            shared_dir=os.path.join(SHARED_DIR, "graphs"))
+        threading.Thread(target=cache.warm_shared, args=(_index,), daemon=True).start()
+        return cache
+    cache = RenderCache(maxsize=RENDER_CACHE_SIZE, timeout=DOT_TIMEOUT)
+    threading.Thread(target=cache.warm, args=(_index,), daemon=True).start()
+    return cache
+
+@st.cache_resource(max_entries=2)
+def load_question_bank(directory: str, fingerprint: str, _index):
+    """Abre o banco de perguntas mapeado em memória, ou None se não houver um válido."""
+    try:
+        return QuestionBank.open(directory, _index)
+    except (OSError, ValueError):
+        return None
+
+@st.cache_resource(max_entries=2)
+def load_static_site(directory: str, fingerprint: str):
+    """Manifesto do pacote estático gerado para estes dados, ou None."""
+    return load_manifest(directory, fingerprint)
+
+def static_url(index, path, style=None):
+    """URL pública de um arquivo do pacote estático, ou None se ele não for usado.
+
+    ``style`` é o estilo do diagrama em ``path``; o pacote pode ter sido
+    gerado só com alguns estilos.
+    """
+    if not STATIC_SITE_URL:
+        return None
+    manifest = load_static_site(STATIC_SITE_DIR, index.fingerprint)
+    if manifest is None or (path.endswith(".svg") and "svg" not in manifest["formats"]):
+        return None
+    if style is not None and style not in manifest["styles"]:
+        return None
+    return f"{STATIC_SITE_URL}/{manifest['root']}/{path}"
+
+@st.cache_resource(max_entries=8)
+def load_exam(directory: str, exam_id: str):
+    """Formulários e gabarito de uma prova, lidos uma vez por processo; None se ela não existir."""
+    try:
+        return Exam.open(os.path.join(directory, exam_id))
+    except (OSError, ValueError):
+        return None
+
+@st.cache_resource
+def get_progress_writer(path: str):
+    """Gravador em lote do progresso dos alunos, compartilhado pelo processo."""
+    return WriteBehindWriter(open_progress_store(path), flush_interval=PROGRESS_FLUSH_INTERVAL)
+
+@st.cache_resource(max_entries=2)
+def get_answer_log(directory: str, fingerprint: str, _index):
+    """Gravador em lote do registro colunar de respostas, compartilhado pelo processo."""
+    # O pyarrow só é importado na primeira resposta, fora do caminho da primeira página
+    from answer_log import AnswerLogWriter
+
+    return AnswerLogWriter(
+        directory, _index,
+        rotate_bytes=int(ANSWER_LOG_ROTATE_MB * 1024 * 1024),
+        flush_interval=PROGRESS_FLUSH_INTERVAL
+    )
+
+@st.cache_resource
+def get_session_reaper():
+    """Libera as sessões ociosas e desconectadas do processo, gravando antes o progresso pendente."""
+    return IdleSessionReaper(
+        SESSION_IDLE_TIMEOUT,
+        persist=get_progress_writer(PROGRESS_DB).flush,
+        close=close_idle_session
+    )
+
+@st.cache_resource(max_entries=2)
+def get_class_stats(fingerprint: str):
+    """Estatísticas de acerto agregadas de todos os alunos do processo."""
+    return AnswerStats()
+
+@st.cache_resource
+def get_rerun_timings():
+    """Acumulador de tempos de rerun compartilhado pelo processo."""
+    return RerunTimings()
 
 # Inicialização do estado da sessão
 def init_session_state():
@@ -109,7 +328,7 @@ def init_session_state():
     if 'total_questions' not in st.session_state:
         st.session_state.total_questions = 0
     if 'achievements' not in st.session_state:
-        st.session_state.achievements = set()
+        st.session_state.achievements = 0
     if 'quiz_score' not in st.session_state:
         st.session_state.quiz_score = 0
     if 'quiz_total' not in st.session_state:
@@ -122,40 +341,255 @@ def init_session_state():
         st.session_state.sequence_score = 0
     if 'sequence_total' not in st.session_state:
         st.session_state.sequence_total = 0
+    if 'sequence_points' not in st.session_state:
+        st.session_state.sequence_points = 0
+    if 'running_accuracy' not in st.session_state:
+        st.session_state.running_accuracy = ADAPTIVE_LOW
+    if 'question_pools' not in st.session_state:
+        st.session_state.question_pools = {QUICK_QUIZ: [], CLINICAL_CASE: [], SEQUENCE: []}
+        st.session_state.question_seed = random.getrandbits(32)
+        st.session_state.question_batches = 0
+    if 'student_id' not in st.session_state:
+        st.session_state.student_id = get_student_id()
+        saved = get_progress_writer(PROGRESS_DB).load(st.session_state.student_id)
+        if saved:
+            restore_progress(saved)
+
+# ============================================================================
+# PROGRESSO DO ALUNO
+# ============================================================================
+
+def get_student_id():
+    """Identifica o aluno pelo parâmetro ?aluno= da URL, criando um código novo se ausente."""
+    student_id = st.query_params.get("aluno")
+    if not student_id:
+        student_id = uuid.uuid4().hex[:12]
+        st.query_params["aluno"] = student_id
+    return student_id
+
+def progress_snapshot():
+    """Instantâneo serializável das pontuações e conquistas da sessão."""
+    snapshot = {key: st.session_state[key] for key in PROGRESS_COUNTERS}
+    snapshot["achievements"] = achievement_list()
+    if 'review_scheduler' in st.session_state:
+        snapshot["srs"] = {
+            "fingerprint": st.session_state.review_fingerprint,
+            "state": base64.b64encode(st.session_state.review_scheduler.to_bytes()).decode("ascii"),
+        }
+    elif st.session_state.get('saved_srs'):
+        snapshot["srs"] = st.session_state.saved_srs
+    if 'answer_stats' in st.session_state:
+        snapshot["stats"] = {
+            "fingerprint": st.session_state.stats_fingerprint,
+            "counts": st.session_state.answer_stats.to_dict(),
+        }
+    elif st.session_state.get('saved_stats'):
+        snapshot["stats"] = st.session_state.saved_stats
+    return snapshot
+
+def restore_progress(saved):
+    """Restaura na sessão o progresso salvo do aluno."""
+    for key in PROGRESS_COUNTERS:
+        st.session_state[key] = saved.get(key, 0)
+    st.session_state.achievements = 0
+    for name in saved.get("achievements", []):
+        add_achievement(name)
+    # O agendador e as estatísticas só são reconstruídos quando o índice estiver disponível
+    st.session_state.saved_srs = saved.get("srs")
+    st.session_state.saved_stats = saved.get("stats")
+
+def save_progress():
+    """Enfileira o progresso atual para gravação em lote, sem esperar pelo disco."""
+    get_progress_writer(PROGRESS_DB).put(st.session_state.student_id, progress_snapshot())
+
+def close_idle_session(session_id):
+    """Encerra a sessão e descarta o seu estado; quem voltar recupera o progresso pelo link ?aluno=."""
+    if not Runtime.exists():
+        return
+    runtime = Runtime.instance()
+    # close_session só pode rodar no loop de eventos do servidor, que o
+    # Streamlit não expõe por uma API pública
+    runtime._get_async_objs().eventloop.call_soon_threadsafe(runtime.close_session, session_id)
+
+def touch_session():
+    """Marca a sessão atual como ativa; chamada em main() e nos fragmentos, cujos reruns não passam por main()."""
+    ctx = get_script_run_ctx()
+    if SESSION_IDLE_TIMEOUT > 0 and ctx is not None:
+        get_session_reaper().touch(ctx.session_id)
+
+def session_footprint():
+    """Bytes ocupados pelo estado desta sessão (valores do session_state e tudo o que referenciam)."""
+    return deep_sizeof({key: st.session_state[key] for key in st.session_state.keys()})
+
+def select_dataset():
+    """Conjunto de dados escolhido na barra lateral (ou por ?regiao= na URL)."""
+    names = get_dataset_registry(DATASETS_FILE).names()
+    if 'dataset_key' not in st.session_state or st.session_state.dataset_key not in names:
+        requested = st.query_params.get("regiao")
+        st.session_state.dataset_key = requested if requested in names else next(iter(names))
+    if len(names) > 1:
+        st.sidebar.selectbox(
+            "Região:",
+            options=list(names),
+            format_func=names.get,
+            key="dataset_key"
+        )
+    return st.session_state.dataset_key
+
+def sync_dataset(index):
+    """Descarta da sessão tudo o que guarda ids de outra versão do conjunto de dados."""
+    previous = st.session_state.get('dataset_fingerprint')
+    if previous is not None and previous != index.fingerprint:
+        for key in INDEX_STATE_KEYS:
+            st.session_state.pop(key, None)
+        for pool in st.session_state.question_pools.values():
+            pool.clear()
+        st.session_state.study_quiz_active = False
+    st.session_state.dataset_fingerprint = index.fingerprint
+
+def get_answer_stats(index):
+    """Estatísticas de acerto do aluno, restauradas do progresso salvo quando compatíveis com o índice."""
+    if 'answer_stats' not in st.session_state:
+        saved = st.session_state.pop('saved_stats', None)
+        if saved and saved.get("fingerprint") == index.fingerprint:
+            stats = AnswerStats.from_dict(saved["counts"])
+        else:
+            stats = AnswerStats()
+        st.session_state.answer_stats = stats
+        st.session_state.stats_fingerprint = index.fingerprint
+    return st.session_state.answer_stats
+
+def record_answer(index, kind, route_id, correct, steps, edges=()):
+    """Registra uma resposta: estatísticas do aluno e da turma em O(1) e linhas no registro colunar.
+
+    ``steps`` lista (etapa do trajeto cobrada, acerto); ``edges``, ((a, b), acerto).
+    """
+    organ_id = index.route_organs[route_id]
+    route = index.route(route_id)
+    nodes = [(route[step], step_correct) for step, step_correct in steps]
+    if kind != SEQUENCE:
+        # Só as perguntas com distratores ajustam a dificuldade
+        st.session_state.running_accuracy += ACCURACY_SMOOTHING * (correct - st.session_state.running_accuracy)
+    for stats in (get_answer_stats(index), get_class_stats(index.fingerprint)):
+        stats.record_answer(kind, organ_id, correct, nodes, edges)
+    get_answer_log(ANSWER_LOG_DIR, index.fingerprint, index).append(
+        st.session_state.student_id, kind, organ_id, route_id,
+        [(step, route[step], step_correct) for step, step_correct in steps]
+    )
+
+def rerun_game(new_achievements):
+    """Reexecuta após uma resposta: só o fragmento do jogo, ou o app inteiro se o placar compartilhado mudou.
+
+    Os cartões de pontuação total e a lista de conquistas ficam fora dos
+    fragmentos dos jogos; eles são atualizados por um rerun completo quando
+    uma conquista é desbloqueada e em qualquer outro rerun do app.
+    """
+    if new_achievements:
+        st.rerun()
+    rerun_fragment()
+
+def rerun_fragment():
+    """Reexecuta apenas o fragmento atual; fora de um rerun de fragmento, o app inteiro."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def has_achievement(name):
+    return bool(st.session_state.achievements >> ACHIEVEMENTS.index(name) & 1)
+
+def add_achievement(name):
+    if name in ACHIEVEMENTS:
+        st.session_state.achievements |= 1 << ACHIEVEMENTS.index(name)
+
+def achievement_list():
+    """Nomes das conquistas desbloqueadas, na ordem de ``ACHIEVEMENTS``."""
+    return [name for name in ACHIEVEMENTS if has_achievement(name)]
 
 def check_achievements():
     """Verifica e adiciona conquistas baseadas no desempenho."""
     achievements = []
 
     # Conquistas por número de questões
-    if st.session_state.total_questions >= 10 and 'primeira_decena' not in st.session_state.achievements:
-        st.session_state.achievements.add('primeira_decena')
+    if st.session_state.total_questions >= 10 and not has_achievement('primeira_decena'):
+        add_achievement('primeira_decena')
         achievements.append("🎯 Primeira Dezena - Completou 10 questões!")
 
-    if st.session_state.total_questions >= 50 and 'meio_centenario' not in st.session_state.achievements:
-        st.session_state.achievements.add('meio_centenario')
+    if st.session_state.total_questions >= 50 and not has_achievement('meio_centenario'):
+        add_achievement('meio_centenario')
         achievements.append("🏆 Meio Centenário - Completou 50 questões!")
 
     # Conquistas por precisão
     if st.session_state.total_questions >= 10:
         accuracy = (st.session_state.total_score / st.session_state.total_questions) * 100
-        if accuracy >= 80 and 'expert' not in st.session_state.achievements:
-            st.session_state.achievements.add('expert')
+        if accuracy >= 80 and not has_achievement('expert'):
+            add_achievement('expert')
             achievements.append("⭐ Expert - Alcançou 80% de acerto!")
-        if accuracy >= 90 and 'mestre' not in st.session_state.achievements:
-            st.session_state.achievements.add('mestre')
+        if accuracy >= 90 and not has_achievement('mestre'):
+            add_achievement('mestre')
             achievements.append("👨‍⚕️ Mestre - Alcançou 90% de acerto!")
-        if accuracy == 100 and 'perfeito' not in st.session_state.achievements:
-            st.session_state.achievements.add('perfeito')
+        if accuracy == 100 and not has_achievement('perfeito'):
+            add_achievement('perfeito')
             achievements.append("💎 Perfeição - 100% de acerto!")
 
+    if achievements:
+        save_progress()
+
     return achievements
 
+# ============================================================================
+# ESTOQUE DE PERGUNTAS
+# ============================================================================
+
+def current_difficulty():
+    """Fração de distratores próximos da resposta para o acerto recente do aluno."""
+    return difficulty_for(st.session_state.running_accuracy) if ADAPTIVE_ENABLED else 0.0
+
+def refill_question_pool(index, kind):
+    """Obtém um novo lote de perguntas (do banco ou do gerador) com a semente da sessão."""
+    seed = (st.session_state.question_seed, st.session_state.question_batches)
+    st.session_state.question_batches += 1
+    bank = load_question_bank(QUESTION_BANK_DIR, index.fingerprint, index)
+    if bank is not None:
+        batch = bank.sample(kind, QUESTION_POOL_SIZE, seed=seed, difficulty=current_difficulty())
+    else:
+        batch = generate_batch(index, kind, QUESTION_POOL_SIZE, seed=seed, difficulty=current_difficulty())
+    st.session_state.question_pools[kind][:0] = batch
+
+def next_question(index, kind):
+    """Retira uma pergunta pronta do estoque da sessão, gerando um lote só se estiver vazio."""
+    pool = st.session_state.question_pools[kind]
+    if not pool:
+        refill_question_pool(index, kind)
+    return pool.pop()
+
+def prefetch_questions(index):
+    """Reabastece os estoques baixos depois que a página já foi enviada ao navegador."""
+    for kind, pool in st.session_state.question_pools.items():
+        if len(pool) < QUESTION_POOL_LOW:
+            try:
+                refill_question_pool(index, kind)
+            except NoEligibleQuestionsError:
+                continue
+
+def prefetching(render):
+    """Reabastece os estoques ao fim de cada execução do fragmento decorado.
+
+    Os reruns de fragmento não passam pelo fim de ``main()``; sem isto, o
+    estoque só seria refeito quando esvaziasse, no clique do aluno.
+    """
+    @wraps(render)
+    def wrapper(index, *args, **kwargs):
+        render(index, *args, **kwargs)
+        prefetch_questions(index)
+    return wrapper
+
 # ============================================================================
 # ABA 1: VIAS DE DRENAGEM
 # ============================================================================
 
-def render_drainage_pathways_tab(organs):
+@profiled("render_drainage_pathways_tab")
+def render_drainage_pathways_tab(index, render_cache):
     """Renderiza a aba de visualização das vias de drenagem."""
     st.markdown('<p class="main-header">🔍 Vias de Drenagem Linfática Abdominal</p>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">Visualize os trajetos anatômicos completos da drenagem linfática</p>', unsafe_allow_html=True)
@@ -164,64 +598,79 @@ def render_drainage_pathways_tab(organs):
 
     with col1:
         st.markdown("### 📋 Seleção de Estrutura")
-        organ_key = st.selectbox(
-            "Selecione o órgão:",
-            options=list(organs.keys()),
-            format_func=lambda k: f"{get_organ_emoji(k)} {organs[k]['nome']}",
-            key="pathway_organ"
+        view = st.radio(
+            "Visualização:",
+            PATHWAY_VIEWS,
+            horizontal=True,
+            key="pathway_view"
         )
-        organ = organs[organ_key]
 
-        # Informações sobre o órgão
-        st.markdown(f"""
-        <div class="pathway-info">
-            <h4>{organs[organ_key]['nome']}</h4>
-            <p><strong>Número de vias:</strong> {len(organ['rotas'])}</p>
-            <p><strong>Relevância clínica:</strong> Compreender a drenagem linfática é essencial para avaliar disseminação neoplásica e processos inflamatórios.</p>
-        </div>
-        """, unsafe_allow_html=True)
+        if view != "Abdome completo":
+            organ_key = st.selectbox(
+                "Selecione o órgão:",
+                options=index.organ_keys,
+                format_func=lambda k: f"{get_organ_emoji(k)} {index.organ_names[index.organ_id(k)]}",
+                key="pathway_organ"
+            )
+            route_ids = index.organ_routes(organ_key)
+
+            # Informações sobre o órgão
+            st.markdown(f"""
+            <div class="pathway-info">
+                <h4>{index.organ_names[index.organ_id(organ_key)]}</h4>
+                <p><strong>Número de vias:</strong> {len(route_ids)}</p>
+                <p><strong>Relevância clínica:</strong> Compreender a drenagem linfática é essencial para avaliar disseminação neoplásica e processos inflamatórios.</p>
+            </div>
+            """, unsafe_allow_html=True)
 
         # Seleção de rota
-        if len(organ["rotas"]) > 1:
-            rota_index = st.selectbox(
-                "Selecione a via de drenagem:",
-                options=list(range(len(organ["rotas"]))),
-                format_func=lambda i: f"Via {i+1}: {organ['rotas'][i]['Rota']}",
-                key="pathway_route"
-            )
-        else:
-            rota_index = 0
-            st.info(f"**Via única:** {organ['rotas'][0]['Rota']}")
+        if view == "Via individual":
+            if len(route_ids) > 1:
+                rota_index = st.selectbox(
+                    "Selecione a via de drenagem:",
+                    options=list(range(len(route_ids))),
+                    format_func=lambda i: f"Via {i+1}: {index.route_names[route_ids[i]]}",
+                    key="pathway_route"
+                )
+            else:
+                rota_index = 0
+                st.info(f"**Via única:** {index.route_names[route_ids[0]]}")
+
+        style = st.radio(
+            "Orientação do fluxograma:",
+            options=list(GRAPH_STYLES),
+            format_func=str.capitalize,
+            index=list(GRAPH_STYLES).index(DEFAULT_STYLE),
+            horizontal=True,
+            key="pathway_style"
+        )
 
     with col2:
-        rota = organ["rotas"][rota_index]
-        caminho = rota["Trajeto"]
-
-        st.markdown(f"### 🗺️ Fluxograma: {rota['Rota']}")
-        st.markdown(f"*Sequência de {len(caminho)} estruturas anatômicas*")
+        if view == "Órgão completo":
+            render_merged_pathways(index, render_cache, (organ_key,), style)
+            return
+        if view == "Abdome completo":
+            render_merged_pathways(index, render_cache, index.organ_keys, style)
+            return
 
-        # Criação do gráfico com cores aprimoradas
-        graph = graphviz.Digraph()
-        graph.attr('node', shape='box', style='rounded,filled', fontname='Arial', fontsize='11')
-        graph.attr('edge', color='#475569', penwidth='2', arrowsize='0.8')
-        graph.attr(rankdir='TB', splines='ortho', nodesep='0.5', ranksep='0.8')
-
-        # Cores diferentes para diferentes tipos de nós
-        for i, etapa in enumerate(caminho):
-            if i == 0:
-                # Primeiro nó (origem) - azul
-                graph.node(str(i), etapa, fillcolor='#dbeafe', color='#1e40af', fontcolor='#1e3a8a', penwidth='3')
-            elif i == len(caminho) - 1:
-                # Último nó (destino final) - verde
-                graph.node(str(i), etapa, fillcolor='#d1fae5', color='#059669', fontcolor='#065f46', penwidth='3')
-            else:
-                # Nós intermediários - cinza claro
-                graph.node(str(i), etapa, fillcolor='#f1f5f9', color='#64748b', fontcolor='#334155')
+        route_id = route_ids[rota_index]
+        caminho = index.trajeto(route_id)
 
-            if i > 0:
-                graph.edge(str(i - 1), str(i))
+        st.markdown(f"### 🗺️ Fluxograma: {index.route_names[route_id]}")
+        st.markdown(f"*Sequência de {len(caminho)} estruturas anatômicas*")
 
-        st.graphviz_chart(graph, use_container_width=True)
+        # Fluxograma do pacote estático ou, sem ele, com layout em cache; sem
+        # SVG, o DOT é desenhado no navegador
+        url = static_url(index, route_diagram(route_id, style), style)
+        if url is not None:
+            show_static_graph(url)
+        else:
+            with measure("render_cache_get"):
+                rendered = render_cache.get(
+                    (organ_key, rota_index, style),
+                    lambda: build_route_graph(caminho, style)
+                )
+            show_rendered_graph(rendered)
 
         # Lista detalhada do trajeto
         with st.expander("📝 Visualizar trajeto em lista"):
@@ -233,11 +682,79 @@ def render_drainage_pathways_tab(organs):
                 else:
                     st.markdown(f"**{i}.** ⚪ {etapa}")
 
+def render_merged_pathways(index, render_cache, organ_keys, style):
+    """Renderiza todas as vias dos órgãos em um único grafo, com estruturas comuns fundidas.
+
+    O layout fica em cache por (escopo, estilo); trocar o destaque apenas
+    reestiliza o resultado, sem executar o Graphviz novamente.
+    """
+    route_ids, nodes, edges = merged_scope(index, organ_keys)
+    scope = organ_keys[0] if len(organ_keys) == 1 else "*"
+    title = index.organ_names[index.organ_id(scope)] if scope != "*" else "Abdome completo"
+
+    st.markdown(f"### 🕸️ Grafo unificado: {title}")
+    st.markdown(f"*{len(route_ids)} vias e {len(nodes)} estruturas anatômicas*")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        highlight_route = st.selectbox(
+            "Destacar via:",
+            options=[None] + route_ids,
+            format_func=lambda r: "Nenhuma" if r is None else f"{index.organ_names[index.route_organs[r]]}: {index.route_names[r]}",
+            key=f"merged_route_{scope}"
+        )
+    with col2:
+        highlight_node = st.selectbox(
+            "Destacar estrutura:",
+            options=[None] + nodes,
+            format_func=lambda n: "Nenhuma" if n is None else index.node_names[n],
+            key=f"merged_node_{scope}"
+        )
+
+    hl_nodes, hl_edges = set(), set()
+    if highlight_route is not None:
+        route_nodes, route_edges = highlight_for_route(index, highlight_route)
+        hl_nodes |= route_nodes
+        hl_edges |= route_edges
+    if highlight_node is not None:
+        node_nodes, node_edges = highlight_for_node(highlight_node, edges)
+        hl_nodes |= node_nodes
+        hl_edges |= node_edges
+
+    # Sem destaque, o grafo é o mesmo para todos e pode vir do pacote estático
+    if not hl_nodes and not hl_edges:
+        path = full_diagram(style) if scope == "*" else organ_diagram(index.organ_id(scope), style)
+        url = static_url(index, path, style)
+        if url is not None:
+            show_static_graph(url)
+            return
+
+    with measure("render_cache_get"):
+        rendered = render_cache.get(
+            ("merged", scope, style),
+            lambda: build_merged_graph(index, organ_keys, style)
+        )
+    show_rendered_graph(highlight_rendered(rendered, hl_nodes, hl_edges))
+
+def show_static_graph(url):
+    """Exibe um fluxograma do pacote estático; o navegador o baixa direto da CDN."""
+    with measure("graphviz_chart"):
+        st.image(url, use_container_width=True)
+
+def show_rendered_graph(rendered):
+    """Exibe um fluxograma do cache: SVG pronto ou DOT desenhado no navegador."""
+    with measure("graphviz_chart"):
+        if rendered.kind == "svg":
+            st.image(rendered.content, use_container_width=True)
+        else:
+            st.graphviz_chart(rendered.content, use_container_width=True)
+
 # ============================================================================
 # ABA 2: ESTUDO
 # ============================================================================
 
-def render_study_tab(organs):
+@profiled("render_study_tab")
+def render_study_tab(index):
     """Renderiza a aba de estudo com informações detalhadas."""
     st.markdown('<p class="main-header">📚 Modo Estudo</p>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">Aprenda sobre anatomia da drenagem linfática abdominal</p>', unsafe_allow_html=True)
@@ -247,17 +764,23 @@ def render_study_tab(organs):
 
     # Cria grid de órgãos
     cols = st.columns(2)
-    for idx, (organ_key, organ_data) in enumerate(organs.items()):
+    # Lido direto do índice, sem montar os dicionários de cada órgão
+    for idx, organ_key in enumerate(index.organ_keys):
+        route_ids = index.organ_routes(organ_key)
         with cols[idx % 2]:
-            with st.expander(f"{get_organ_emoji(organ_key)} {organ_data['nome']}", expanded=False):
-                st.markdown(f"**Número de vias de drenagem:** {len(organ_data['rotas'])}")
-
-                for i, rota in enumerate(organ_data['rotas'], 1):
-                    st.markdown(f"**Via {i}:** {rota['Rota']}")
-                    st.markdown(f"- Etapas: {len(rota['Trajeto'])}")
-                    st.markdown(f"- Primeiro linfonodo: *{rota['Trajeto'][0]}*")
-                    st.markdown(f"- Destino final: *{rota['Trajeto'][-1]}*")
-                    if i < len(organ_data['rotas']):
+            with st.expander(f"{get_organ_emoji(organ_key)} {index.organ_names[idx]}", expanded=False):
+                st.markdown(f"**Número de vias de drenagem:** {len(route_ids)}")
+                url = static_url(index, study_page(idx))
+                if url is not None:
+                    st.markdown(f"[📄 Página de estudo com os fluxogramas]({url})")
+
+                for i, route_id in enumerate(route_ids, 1):
+                    route = index.route(route_id)
+                    st.markdown(f"**Via {i}:** {index.route_names[route_id]}")
+                    st.markdown(f"- Etapas: {len(route)}")
+                    st.markdown(f"- Primeiro linfonodo: *{index.node_names[route[0]]}*")
+                    st.markdown(f"- Destino final: *{index.node_names[route[-1]]}*")
+                    if i < len(route_ids):
                         st.markdown("---")
 
     # Informações gerais
@@ -299,28 +822,39 @@ def render_study_tab(organs):
 
     if st.button("📝 Iniciar Quiz Rápido de Estudo", use_container_width=True):
         st.session_state.study_quiz_active = True
-        setup_quick_quiz_question(organs, 'study')
+        # A pergunta é sorteada dentro do fragmento, que exibe o aviso se não houver itens
+        st.session_state.study_question = None
 
     if 'study_quiz_active' in st.session_state and st.session_state.study_quiz_active:
-        render_embedded_quiz(organs, 'study')
+        render_embedded_quiz(index, 'study')
 
-def render_embedded_quiz(organs, mode='study'):
+@st.fragment
+@prefetching
+@profiled("render_embedded_quiz")
+def render_embedded_quiz(index, mode='study'):
     """Renderiza um quiz embutido na aba de estudo."""
-    quiz_key = f'{mode}_quiz'
+    touch_session()
+    quiz_key, answer_key = f'{mode}_question', f'{mode}_answer'
 
-    if quiz_key not in st.session_state or st.session_state[quiz_key] is None:
-        setup_quick_quiz_question(organs, mode)
+    if st.session_state.get(quiz_key) is None:
+        # O fragmento exibe as próprias exceções, então o aviso precisa ser dado aqui
+        try:
+            setup_quick_quiz_question(index, mode)
+        except NoEligibleQuestionsError as e:
+            st.warning(f"⚠️ {e}")
+            return
 
     question = st.session_state[quiz_key]
+    payload = question_payload(index, question)
 
     st.markdown("---")
-    st.markdown(question['prompt'])
+    st.markdown(payload['prompt'])
 
-    if question['submitted_answer']:
-        user_answer = question['submitted_answer']
-        correct_answer = question['correct_answer']
+    if st.session_state[answer_key] is not None:
+        user_answer = st.session_state[answer_key]
+        correct_answer = payload['correct_answer']
 
-        if user_answer == correct_answer:
+        if user_answer == question.answer:
             st.success(f"✅ Correto! A resposta é **{correct_answer}**.")
         else:
             st.error(f"❌ Incorreto. A resposta correta é **{correct_answer}**.")
@@ -328,8 +862,9 @@ def render_embedded_quiz(organs, mode='study'):
         col1, col2 = st.columns(2)
         with col1:
             if st.button("➡️ Próxima Pergunta", key=f"next_{mode}"):
-                setup_quick_quiz_question(organs, mode)
-                st.rerun()
+                # Sem itens elegíveis, a próxima execução do fragmento mostra o aviso
+                st.session_state[quiz_key] = None
+                rerun_fragment()
         with col2:
             if st.button("🔚 Encerrar Quiz", key=f"end_{mode}"):
                 st.session_state.study_quiz_active = False
@@ -337,22 +872,24 @@ def render_embedded_quiz(organs, mode='study'):
     else:
         user_answer = st.radio(
             "Selecione a próxima estrutura:",
-            question['options'],
+            question.options,
+            format_func=index.node_names.__getitem__,
             key=f"radio_{mode}_{st.session_state.get(f'{mode}_quiz_count', 0)}"
         )
         if st.button("Confirmar Resposta", key=f"submit_{mode}"):
-            st.session_state[quiz_key]['submitted_answer'] = user_answer
+            st.session_state[answer_key] = user_answer
             if mode not in ['study']:
-                if user_answer == question['correct_answer']:
+                if user_answer == question.answer:
                     st.session_state[f'{mode}_score'] += 1
                 st.session_state[f'{mode}_total'] += 1
-            st.rerun()
+            rerun_fragment()
 
 # ============================================================================
 # ABA 3: JOGOS INTERATIVOS
 # ============================================================================
 
-def render_games_tab(organs):
+@profiled("render_games_tab")
+def render_games_tab(index):
     """Renderiza a aba de jogos interativos."""
     st.markdown('<p class="main-header">🎮 Jogos Interativos</p>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">Aprenda de forma divertida e interativa</p>', unsafe_allow_html=True)
@@ -373,7 +910,7 @@ def render_games_tab(organs):
     with col2:
         st.markdown(f"""
         <div class="score-card">
-            <h2>{len(st.session_state.achievements)}</h2>
+            <h2>{len(achievement_list())}</h2>
             <p>Conquistas Desbloqueadas</p>
         </div>
         """, unsafe_allow_html=True)
@@ -388,7 +925,11 @@ def render_games_tab(organs):
             st.session_state.clinical_total = 0
             st.session_state.sequence_score = 0
             st.session_state.sequence_total = 0
-            st.session_state.achievements = set()
+            st.session_state.sequence_points = 0
+            st.session_state.achievements = 0
+            st.session_state.answer_stats = AnswerStats()
+            st.session_state.stats_fingerprint = index.fingerprint
+            save_progress()
             st.rerun()
 
     # Conquistas
@@ -401,10 +942,12 @@ def render_games_tab(organs):
             'mestre': '👨‍⚕️ Mestre',
             'perfeito': '💎 Perfeição'
         }
-        for ach in st.session_state.achievements:
+        for ach in achievement_list():
             st.markdown(f'<span class="achievement-badge">{achievement_names.get(ach, ach)}</span>', unsafe_allow_html=True)
         st.markdown("---")
 
+    render_weak_spots(index)
+
     # Seleção de modo de jogo
     st.markdown("### 🎯 Escolha o Modo de Jogo")
 
@@ -418,51 +961,107 @@ def render_games_tab(organs):
     st.markdown("---")
 
     if game_mode == "Quiz Rápido":
-        render_quick_quiz_mode(organs)
+        render_quick_quiz_mode(index)
     elif game_mode == "Casos Clínicos":
-        render_clinical_cases_mode(organs)
+        render_clinical_cases_mode(index)
     else:  # Sequência Completa
-        render_sequence_game_mode(organs)
+        render_sequence_game_mode(index)
+
+def render_weak_spots(index):
+    """Mostra as estruturas, transições e órgãos com mais erros, lidos dos agregados prontos."""
+    with st.expander("📉 Pontos Fracos"):
+        scope = st.radio(
+            "Estatísticas de:",
+            ["Minhas respostas", "Toda a turma"],
+            horizontal=True,
+            key="weak_spots_scope"
+        )
+        stats = get_answer_stats(index) if scope == "Minhas respostas" else get_class_stats(index.fingerprint)
+
+        mode_names = {QUICK_QUIZ: "Quiz Rápido", CLINICAL_CASE: "Casos Clínicos", SEQUENCE: "Sequência Completa"}
+        cols = st.columns(len(mode_names))
+        for col, (kind, name) in zip(cols, mode_names.items()):
+            accuracy = stats.accuracy(MODE, kind)
+            col.metric(name, f"{accuracy * 100:.0f}%" if accuracy is not None else "—",
+                       f"{stats.counts(MODE, kind)[0]} respostas", delta_color="off")
+
+        sections = [
+            ("**Transições mais erradas:**", EDGE,
+             lambda e: f"{index.node_names[e[0]]} → {index.node_names[e[1]]}"),
+            ("**Estruturas mais erradas:**", NODE, lambda n: index.node_names[n]),
+            ("**Órgãos com mais erros:**", ORGAN,
+             lambda o: f"{get_organ_emoji(index.organ_keys[o])} {index.organ_names[o]}"),
+        ]
+        empty = True
+        for title, dim, label in sections:
+            weakest = stats.weakest(dim)
+            if not weakest:
+                continue
+            empty = False
+            st.markdown(title)
+            for key, attempts, errors in weakest:
+                st.markdown(f"- {label(key)}: {errors}/{attempts} erros ({errors / attempts * 100:.0f}%)")
+        if empty:
+            st.caption("Ainda não há respostas suficientes (mínimo de 2 por item) para apontar pontos fracos.")
 
 # ============================================================================
 # MODO QUIZ RÁPIDO
 # ============================================================================
 
-def setup_quick_quiz_question(organs, mode='quiz'):
-    """Prepara uma pergunta de quiz rápido."""
-    organ_key = random.choice(list(organs.keys()))
-    organ = organs[organ_key]
-    rota = random.choice(organ["rotas"])
-    caminho = rota["Trajeto"]
-
-    if len(caminho) < 2:
-        return setup_quick_quiz_question(organs, mode)
-
-    step_index = random.randint(0, len(caminho) - 2)
-
-    question_prompt = f"A linfa do órgão **{organ['nome']}** (via: *{rota['Rota']}*) está na estrutura **{caminho[step_index]}**. Para qual estrutura ela segue?"
-    correct_answer = caminho[step_index + 1]
-
-    # Distratores
-    all_nodes = list(set(node for org_data in organs.values() for r in org_data['rotas'] for node in r['Trajeto']))
-    all_nodes.remove(correct_answer)
-    if caminho[step_index] in all_nodes:
-        all_nodes.remove(caminho[step_index])
-
-    distractors = random.sample(all_nodes, min(3, len(all_nodes)))
-    options = distractors + [correct_answer]
-    random.shuffle(options)
-
-    quiz_key = f'{mode}_quiz'
-    st.session_state[quiz_key] = {
-        "prompt": question_prompt,
-        "options": options,
-        "correct_answer": correct_answer,
-        "submitted_answer": None
-    }
+def get_review_scheduler(index):
+    """Agendador de revisões do aluno, restaurado do progresso salvo quando compatível com o índice."""
+    if 'review_scheduler' not in st.session_state:
+        num_items = len(eligible_questions(index, QUICK_QUIZ))
+        saved = st.session_state.pop('saved_srs', None)
+        scheduler = None
+        if saved and saved.get("fingerprint") == index.fingerprint:
+            scheduler = ReviewScheduler.from_bytes(base64.b64decode(saved["state"]))
+        if scheduler is None or scheduler.num_items != num_items:
+            scheduler = ReviewScheduler(num_items, seed=st.session_state.question_seed)
+        st.session_state.review_scheduler = scheduler
+        st.session_state.review_fingerprint = index.fingerprint
+    return st.session_state.review_scheduler
+
+def scheduled_question(index, item):
+    """Pergunta do item escolhido pelo agendador: do estoque, do banco ou, em último caso, do gerador."""
+    eligible = eligible_questions(index, QUICK_QUIZ)
+    route_id, step = int(eligible.routes[item]), int(eligible.steps[item])
+    pool = st.session_state.question_pools[QUICK_QUIZ]
+    for i, question in enumerate(pool):
+        if (question.route_id, question.step) == (route_id, step):
+            return pool.pop(i)
+
+    seed = (st.session_state.question_seed, st.session_state.question_batches)
+    st.session_state.question_batches += 1
+    bank = load_question_bank(QUESTION_BANK_DIR, index.fingerprint, index)
+    if bank is not None:
+        try:
+            question = bank.quiz_variant(item, seed=seed, difficulty=current_difficulty())
+        except IndexError:
+            pass
+        else:
+            if (question.route_id, question.step) == (route_id, step):
+                return question
+    return generate_for_items(index, QUICK_QUIZ, [item], seed=seed, difficulty=current_difficulty())[0]
 
-def render_quick_quiz_mode(organs):
+def setup_quick_quiz_question(index, mode='quiz'):
+    """Prepara uma pergunta de quiz rápido."""
+    if mode == 'quiz' and SRS_ENABLED:
+        # O agendador escolhe o item (órgão, via, etapa) mais urgente em O(log n)
+        item = get_review_scheduler(index).next_item(time.time())
+        question = scheduled_question(index, item)
+        st.session_state.quiz_item = item
+    else:
+        question = next_question(index, QUICK_QUIZ)
+    st.session_state[f'{mode}_question'] = question
+    st.session_state[f'{mode}_answer'] = None
+
+@st.fragment
+@prefetching
+@profiled("render_quick_quiz_mode")
+def render_quick_quiz_mode(index):
     """Renderiza o modo Quiz Rápido."""
+    touch_session()
     st.markdown("#### 🧠 Quiz Rápido")
     st.info("Teste seu conhecimento sobre as vias de drenagem linfática. Identifique a próxima estrutura no trajeto!")
 
@@ -474,20 +1073,31 @@ def render_quick_quiz_mode(organs):
             f"{st.session_state.quiz_score}/{st.session_state.quiz_total}",
             f"{(st.session_state.quiz_score/st.session_state.quiz_total*100):.0f}%" if st.session_state.quiz_total > 0 else "0%"
         )
+    # O fragmento exibe as próprias exceções, então o aviso precisa ser dado aqui
+    try:
+        scheduler = get_review_scheduler(index) if SRS_ENABLED else None
+        if st.session_state.get('quiz_question') is None:
+            setup_quick_quiz_question(index, 'quiz')
+    except NoEligibleQuestionsError as e:
+        st.warning(f"⚠️ {e}")
+        return
+
+    if scheduler is not None:
+        with col2:
+            st.metric("Itens dominados", f"{scheduler.mastered()}/{scheduler.num_items}")
+            st.caption(f"{scheduler.seen} itens já vistos; os erros voltam mais cedo.")
 
-    if 'quiz_quiz' not in st.session_state or st.session_state.quiz_quiz is None:
-        setup_quick_quiz_question(organs, 'quiz')
-
-    question = st.session_state.quiz_quiz
+    question = st.session_state.quiz_question
+    payload = question_payload(index, question)
 
     st.markdown("---")
-    st.markdown(question['prompt'])
+    st.markdown(payload['prompt'])
 
-    if question['submitted_answer']:
-        user_answer = question['submitted_answer']
-        correct_answer = question['correct_answer']
+    if st.session_state.quiz_answer is not None:
+        user_answer = st.session_state.quiz_answer
+        correct_answer = payload['correct_answer']
 
-        if user_answer == correct_answer:
+        if user_answer == question.answer:
             st.success("✅ **Correto!** Excelente conhecimento anatômico!")
             st.balloons()
         else:
@@ -500,90 +1110,53 @@ def render_quick_quiz_mode(organs):
                 for ach in new_achievements:
                     st.toast(ach, icon="🏆")
 
-            setup_quick_quiz_question(organs, 'quiz')
-            st.rerun()
+            st.session_state.quiz_question = None
+            rerun_game(new_achievements)
     else:
         user_answer = st.radio(
             "Selecione a próxima estrutura:",
-            question['options'],
+            question.options,
+            format_func=index.node_names.__getitem__,
             key=f"quiz_radio_{st.session_state.quiz_total}"
         )
 
         if st.button("✓ Confirmar Resposta", key="submit_quiz", use_container_width=True):
-            st.session_state.quiz_quiz['submitted_answer'] = user_answer
+            st.session_state.quiz_answer = user_answer
+            result = grade(index, question, user_answer)
+            correct = result.correct
 
             # Atualiza pontuações
             st.session_state.quiz_total += 1
             st.session_state.total_questions += 1
 
-            if user_answer == question['correct_answer']:
+            if correct:
                 st.session_state.quiz_score += 1
                 st.session_state.total_score += 1
 
-            st.rerun()
+            record_answer(index, QUICK_QUIZ, question.route_id, correct, result.steps, result.edges)
+
+            if SRS_ENABLED and st.session_state.get('quiz_item') is not None:
+                get_review_scheduler(index).review(st.session_state.quiz_item, correct, time.time())
+
+            save_progress()
+            rerun_fragment()
 
 # ============================================================================
 # MODO CASOS CLÍNICOS
 # ============================================================================
 
-CASE_TEMPLATES = {
-    "estomago": "Paciente {name}, {age} anos, sexo {sex}, apresenta quadro de dispepsia e perda ponderal progressiva. A endoscopia digestiva alta evidencia lesão vegetante na região da **{location}**. O exame anatomopatológico confirma adenocarcinoma gástrico. Considerando a drenagem linfática desta região, qual grupo de linfonodos será o primeiro a ser comprometido em caso de disseminação neoplásica?",
-
-    "intestino_grosso": "Paciente {name}, {age} anos, sexo {sex}, procura atendimento médico por alteração do hábito intestinal e hematoquezia. A colonoscopia identifica lesão tumoral no **{location}**. A biópsia confirma adenocarcinoma. Considerando que a linfa desta região passa inicialmente pelos linfonodos epicólicos e paracólicos, qual é o próximo grupo linfonodal na cadeia de drenagem?",
-
-    "pâncreas": "Paciente {name}, {age} anos, sexo {sex}, apresenta quadro de icterícia indolor progressiva e perda de peso. A tomografia computadorizada revela massa sólida na **{location}** do pâncreas. A biópsia guiada por ultrassom endoscópico confirma adenocarcinoma pancreático. Qual grupo de linfonodos constitui a primeira estação de drenagem linfática desta região?",
-
-    "figado": "Paciente {name}, {age} anos, sexo {sex}, portador de cirrose hepática por hepatite C, apresenta elevação de alfa-fetoproteína e lesão hepática suspeita. A investigação confirma carcinoma hepatocelular. Considerando a via de drenagem '{location}', qual grupo linfonodal deve ser avaliado prioritariamente no estadiamento?",
-
-    "rins": "Durante investigação de hematúria macroscópica em paciente {name}, {age} anos, sexo {sex}, a tomografia identifica massa renal sólida compatível com carcinoma de células renais. Qual é o principal grupo de linfonodos que recebe a drenagem linfática renal?",
-
-    "intestino_delgado": "Paciente {name}, {age} anos, sexo {sex}, apresenta quadro de dor abdominal intermitente e anemia ferropriva. A enterotomografia identifica lesão no **{location}**. A investigação confirma tumor neuroendócrino de intestino delgado. Qual é a primeira estação linfonodal de drenagem desta região?",
-
-    "baco": "Paciente {name}, {age} anos, sexo {sex}, vítima de traumatismo abdominal fechado de alta energia, apresenta lesão esplênica grau IV com necessidade de esplenectomia de urgência. Durante o procedimento cirúrgico, qual grupo de linfonodos regionais deve ser inspecionado, considerando a drenagem linfática esplênica?"
-}
-
-def setup_clinical_case_question(organs):
+def setup_clinical_case_question(index):
     """Prepara uma pergunta de caso clínico."""
-    valid_organ_keys = list(CASE_TEMPLATES.keys())
-    organ_key = random.choice(valid_organ_keys)
-    organ = organs[organ_key]
-    rota = random.choice(organ["rotas"])
-    caminho = rota["Trajeto"]
-
-    # Lógica específica
-    if organ_key == "intestino_grosso":
-        if len(caminho) < 3:
-            return setup_clinical_case_question(organs)
-        correct_answer = caminho[2]
-    else:
-        correct_answer = caminho[0]
-
-    # Gera o caso
-    template = CASE_TEMPLATES[organ_key]
-    case_text = template.format(
-        name=random.choice(["João Silva", "Maria Santos", "José Oliveira", "Ana Costa", "Carlos Ferreira", "Paula Rodrigues"]),
-        age=random.randint(45, 75),
-        sex=random.choice(["masculino", "feminino"]),
-        location=rota["Rota"]
-    )
-
-    # Distratores
-    all_nodes = list(set(node for org_data in organs.values() for r in org_data['rotas'] for node in r['Trajeto']))
-    all_nodes.remove(correct_answer)
-
-    distractors = random.sample(all_nodes, 3)
-    options = distractors + [correct_answer]
-    random.shuffle(options)
-
-    st.session_state.clinical_quiz = {
-        "prompt": case_text,
-        "options": options,
-        "correct_answer": correct_answer,
-        "submitted_answer": None
-    }
-
-def render_clinical_cases_mode(organs):
+    question = next_question(index, CLINICAL_CASE)
+    st.session_state.clinical_question = question
+    st.session_state.clinical_answer = None
+
+@st.fragment
+@prefetching
+@profiled("render_clinical_cases_mode")
+def render_clinical_cases_mode(index):
     """Renderiza o modo de Casos Clínicos."""
+    touch_session()
     st.markdown("#### 🩺 Casos Clínicos")
     st.info("Aplique seu conhecimento anatômico em cenários clínicos realistas de oncologia e trauma.")
 
@@ -596,20 +1169,26 @@ def render_clinical_cases_mode(organs):
             f"{(st.session_state.clinical_score/st.session_state.clinical_total*100):.0f}%" if st.session_state.clinical_total > 0 else "0%"
         )
 
-    if 'clinical_quiz' not in st.session_state or st.session_state.clinical_quiz is None:
-        setup_clinical_case_question(organs)
+    if st.session_state.get('clinical_question') is None:
+        # O fragmento exibe as próprias exceções, então o aviso precisa ser dado aqui
+        try:
+            setup_clinical_case_question(index)
+        except NoEligibleQuestionsError as e:
+            st.warning(f"⚠️ {e}")
+            return
 
-    case = st.session_state.clinical_quiz
+    question = st.session_state.clinical_question
+    case = question_payload(index, question)
 
     st.markdown("---")
     st.markdown("**📋 Caso Clínico:**")
     st.markdown(case['prompt'])
 
-    if case['submitted_answer']:
-        user_answer = case['submitted_answer']
+    if st.session_state.clinical_answer is not None:
+        user_answer = st.session_state.clinical_answer
         correct_answer = case['correct_answer']
 
-        if user_answer == correct_answer:
+        if user_answer == question.answer:
             st.success("✅ **Correto!** Excelente raciocínio clínico-anatômico!")
             st.balloons()
         else:
@@ -623,74 +1202,74 @@ def render_clinical_cases_mode(organs):
                 for ach in new_achievements:
                     st.toast(ach, icon="🏆")
 
-            setup_clinical_case_question(organs)
-            st.rerun()
+            st.session_state.clinical_question = None
+            rerun_game(new_achievements)
     else:
         user_answer = st.radio(
             "Qual grupo de linfonodos?",
-            case['options'],
+            question.options,
+            format_func=index.node_names.__getitem__,
             key=f"clinical_radio_{st.session_state.clinical_total}"
         )
 
         if st.button("✓ Confirmar Resposta", key="submit_clinical", use_container_width=True):
-            st.session_state.clinical_quiz['submitted_answer'] = user_answer
+            st.session_state.clinical_answer = user_answer
+            result = grade(index, question, user_answer)
+            correct = result.correct
 
             # Atualiza pontuações
             st.session_state.clinical_total += 1
             st.session_state.total_questions += 1
 
-            if user_answer == case['correct_answer']:
+            if correct:
                 st.session_state.clinical_score += 1
                 st.session_state.total_score += 1
 
-            st.rerun()
+            record_answer(index, CLINICAL_CASE, question.route_id, correct, result.steps, result.edges)
+
+            save_progress()
+            rerun_fragment()
 
 # ============================================================================
 # MODO SEQUÊNCIA COMPLETA (NOVO!)
 # ============================================================================
 
-def setup_sequence_game(organs):
+def setup_sequence_game(index):
     """Prepara o jogo de sequência completa."""
-    organ_key = random.choice(list(organs.keys()))
-    organ = organs[organ_key]
-    rota = random.choice(organ["rotas"])
-    caminho = rota["Trajeto"].copy()
-
-    # Embaralha a sequência
-    correct_sequence = caminho.copy()
-    shuffled_sequence = caminho.copy()
-    random.shuffle(shuffled_sequence)
-
-    # Garante que não seja a mesma sequência
-    while shuffled_sequence == correct_sequence and len(caminho) > 1:
-        random.shuffle(shuffled_sequence)
-
-    st.session_state.sequence_game = {
-        "organ": organ['nome'],
-        "route": rota['Rota'],
-        "correct_sequence": correct_sequence,
-        "current_sequence": shuffled_sequence,
-        "submitted": False
-    }
-
-def render_sequence_game_mode(organs):
+    question = next_question(index, SEQUENCE)
+    st.session_state.sequence_question = question
+    st.session_state.sequence_answer = None
+
+@st.fragment
+@prefetching
+@profiled("render_sequence_game_mode")
+def render_sequence_game_mode(index):
     """Renderiza o modo de jogo de sequência completa."""
+    touch_session()
     st.markdown("#### 🎯 Sequência Completa")
     st.info("Organize as estruturas anatômicas na ordem correta da drenagem linfática!")
 
-    # Pontuação específica
+    # Pontuação específica: cada sequência vale até 1 ponto, com crédito parcial
     col1, col2 = st.columns([2, 1])
     with col1:
         st.metric(
             "Pontuação de Sequências",
-            f"{st.session_state.sequence_score}/{st.session_state.sequence_total}",
-            f"{(st.session_state.sequence_score/st.session_state.sequence_total*100):.0f}%" if st.session_state.sequence_total > 0 else "0%"
+            f"{st.session_state.sequence_points:.1f}/{st.session_state.sequence_total}",
+            f"{(st.session_state.sequence_points/st.session_state.sequence_total*100):.0f}%" if st.session_state.sequence_total > 0 else "0%"
         )
+    with col2:
+        st.metric("Sequências perfeitas", st.session_state.sequence_score)
 
-    if 'sequence_game' not in st.session_state or st.session_state.sequence_game is None:
-        setup_sequence_game(organs)
+    if st.session_state.get('sequence_question') is None:
+        # O fragmento exibe as próprias exceções, então o aviso precisa ser dado aqui
+        try:
+            setup_sequence_game(index)
+        except NoEligibleQuestionsError as e:
+            st.warning(f"⚠️ {e}")
+            return
 
-    game = st.session_state.sequence_game
+    question = st.session_state.sequence_question
+    game = question_payload(index, question)
 
     st.markdown("---")
     st.markdown(f"**Órgão:** {game['organ']}")
@@ -698,46 +1277,44 @@ def render_sequence_game_mode(organs):
     st.markdown("")
     st.markdown("**Instruções:** Organize as estruturas abaixo na ordem correta do trajeto de drenagem linfática.")
 
-    if not game['submitted']:
+    if st.session_state.sequence_answer is None:
         st.markdown("---")
-        st.markdown("**🔀 Organize a sequência:**")
-
-        # Permite ao usuário reordenar
-        sequence_order = []
-        for i, structure in enumerate(game['current_sequence']):
-            col1, col2 = st.columns([1, 4])
-            with col1:
-                position = st.number_input(
-                    "Posição",
-                    min_value=1,
-                    max_value=len(game['current_sequence']),
-                    value=i+1,
-                    key=f"pos_{i}",
-                    label_visibility="collapsed"
-                )
-                sequence_order.append((position, structure))
-            with col2:
-                st.markdown(f"**{structure}**")
+        route = index.route(question.route_id)
+        structures = game['current_sequence']
+
+        # Um único widget dentro de um formulário: a página só reexecuta ao verificar
+        with st.form("sequence_form"):
+            chosen = st.multiselect(
+                "🔀 Clique nas estruturas na ordem do trajeto, da origem ao destino final:",
+                options=range(len(structures)),
+                format_func=structures.__getitem__,
+                key=f"sequence_choice_{st.session_state.sequence_total}"
+            )
+            submitted = st.form_submit_button("✓ Verificar Sequência", key="submit_sequence", use_container_width=True)
 
-        if st.button("✓ Verificar Sequência", key="submit_sequence", use_container_width=True):
-            # Ordena pela posição escolhida
-            sequence_order.sort(key=lambda x: x[0])
-            user_sequence = [s[1] for s in sequence_order]
+        if submitted:
+            if len(chosen) != len(structures):
+                st.warning(f"Selecione todas as {len(structures)} estruturas antes de verificar.")
+                return
 
-            st.session_state.sequence_game['user_sequence'] = user_sequence
-            st.session_state.sequence_game['submitted'] = True
+            st.session_state.sequence_answer = tuple(route[question.order[c]] for c in chosen)
+            result = grade(index, question, st.session_state.sequence_answer)
 
             # Atualiza pontuações
             st.session_state.sequence_total += 1
+            st.session_state.sequence_points += result.credit
             st.session_state.total_questions += 1
 
-            if user_sequence == game['correct_sequence']:
+            if result.correct:
                 st.session_state.sequence_score += 1
                 st.session_state.total_score += 1
 
-            st.rerun()
+            record_answer(index, SEQUENCE, question.route_id, result.correct, result.steps, result.edges)
+
+            save_progress()
+            rerun_fragment()
     else:
-        user_sequence = game.get('user_sequence', [])
+        user_sequence = [index.node_names[n] for n in st.session_state.sequence_answer]
         correct_sequence = game['correct_sequence']
 
         is_correct = user_sequence == correct_sequence
@@ -746,7 +1323,9 @@ def render_sequence_game_mode(organs):
             st.success("✅ **Correto!** Você organizou a sequência perfeitamente!")
             st.balloons()
         else:
-            st.error("❌ **Incorreto.** Veja a comparação abaixo:")
+            credit = sequence_credit(index.route(question.route_id), st.session_state.sequence_answer)
+            st.error(f"❌ **Incorreto.** Crédito parcial: **{credit * 100:.0f}%** da sequência "
+                     "estava na ordem relativa correta. Veja a comparação abaixo:")
 
         # Mostra comparação
         col1, col2 = st.columns(2)
@@ -772,8 +1351,256 @@ def render_sequence_game_mode(organs):
                 for ach in new_achievements:
                     st.toast(ach, icon="🏆")
 
-            setup_sequence_game(organs)
-            st.rerun()
+            st.session_state.sequence_question = None
+            rerun_game(new_achievements)
+
+# ============================================================================
+# PROVA
+# ============================================================================
+
+def render_exam_page(exam_id):
+    """Renderiza a prova do aluno a partir do formulário pré-gerado, sem tocar no índice."""
+    exam = load_exam(EXAMS_DIR, exam_id) if re.fullmatch(r"[\w-]+", exam_id) else None
+    if exam is None:
+        st.error(f"❌ Prova não encontrada: `{exam_id}`")
+        return
+
+    st.markdown(f'<p class="main-header">📝 {exam.manifest["title"]}</p>', unsafe_allow_html=True)
+    # A prova exige o código do aluno na URL: um código gerado a cada acesso permitiria refazê-la
+    student_id = st.query_params.get("aluno")
+    if not valid_student_id(student_id):
+        if student_id:
+            # Códigos com outros caracteres colidiriam ao virar nome de arquivo (a.b e ab)
+            st.error("❌ Código de aluno inválido: use apenas letras, números, '-' e '_'.")
+        with st.form("exam_student"):
+            code = st.text_input("Código do aluno (matrícula):").strip()
+            if st.form_submit_button("Iniciar prova") and code:
+                st.query_params["aluno"] = code
+                st.rerun()
+        st.info("Informe o seu código de aluno para iniciar a prova; o tempo começa a contar em seguida.")
+        return
+
+    record = st.session_state.get("exam_record")
+    if record is None or (record.get("exam"), record["student"]) != (exam_id, student_id):
+        try:
+            record = {**exam.start(student_id), "exam": exam_id}
+        except ExamClosedError as e:
+            st.warning(str(e))
+            return
+        except ExamStartedError as e:
+            previous = exam.submission(student_id)
+            if previous is not None and previous["submitted"] is not None:
+                st.success(f"✅ Prova entregue às {datetime.fromtimestamp(previous['submitted']):%H:%M}. "
+                           f"Código do aluno: `{student_id}`")
+            else:
+                st.error(f"{e} Cada aluno só pode iniciar a prova uma vez; procure o professor.")
+            return
+        st.session_state.exam_record = record
+
+    if record["submitted"] is not None:
+        st.success(f"✅ Prova entregue às {datetime.fromtimestamp(record['submitted']):%H:%M}. "
+                   f"Código do aluno: `{student_id}`")
+        return
+    if exam.closed:
+        st.warning("A prova já foi encerrada.")
+        return
+
+    deadline = record["started"] + exam.duration
+    remaining = deadline - time.time()
+    if remaining > 0:
+        st.info(f"⏱️ Entrega até **{datetime.fromtimestamp(deadline):%H:%M}** "
+                f"(restam cerca de {remaining / 60:.0f} min). Guarde o link desta página.")
+    else:
+        st.error("⏱️ O tempo da prova acabou. Entregue agora: a entrega será marcada como fora do prazo.")
+
+    form = exam.forms[record["form"]]
+    with st.form("exam_form"):
+        answers = []
+        for i, item in enumerate(form, 1):
+            st.markdown(f"#### Questão {i}")
+            if item["kind"] == SEQUENCE:
+                st.markdown(f"**Órgão:** {item['organ']}  \n**Via:** {item['route_name']}")
+                chosen = st.multiselect(
+                    "Selecione as estruturas na ordem do trajeto de drenagem:",
+                    options=range(len(item["options"])),
+                    format_func=item["options"].__getitem__,
+                    key=f"exam_{i}"
+                )
+                answers.append([item["option_ids"][c] for c in chosen] or None)
+            else:
+                st.markdown(item["prompt"])
+                chosen = st.radio(
+                    "Resposta:",
+                    options=range(len(item["options"])),
+                    format_func=item["options"].__getitem__,
+                    index=None,
+                    key=f"exam_{i}",
+                    label_visibility="collapsed"
+                )
+                answers.append(None if chosen is None else item["option_ids"][chosen])
+        submitted = st.form_submit_button("📨 Entregar prova", use_container_width=True)
+
+    if submitted:
+        try:
+            record = exam.submit(student_id, answers)
+        except ExamClosedError as e:
+            st.warning(str(e))
+            return
+        st.session_state.exam_record = {**record, "exam": exam_id}
+        st.rerun()
+
+# ============================================================================
+# PAINEL DO PROFESSOR
+# ============================================================================
+
+def render_exam_admin(index):
+    """Gera provas com formulários fixos e as encerra, corrigindo todas as entregas de uma vez."""
+    with st.form("exam_builder"):
+        col1, col2, col3 = st.columns(3)
+        exam_id = col1.text_input("Identificador (?prova=)", value="P1")
+        title = col2.text_input("Título", value="Prova de drenagem linfática")
+        minutes = col3.number_input("Duração (min)", min_value=5, value=60)
+        col1, col2, col3, col4, col5 = st.columns(5)
+        forms = col1.number_input("Formulários", min_value=1, max_value=26, value=4)
+        quiz = col2.number_input("Quiz", min_value=0, value=10)
+        clinical = col3.number_input("Casos clínicos", min_value=0, value=3)
+        sequence = col4.number_input("Sequências", min_value=0, value=2)
+        seed = col5.number_input("Semente", min_value=0, value=0)
+        if st.form_submit_button("Gerar formulários"):
+            if not re.fullmatch(r"[\w-]+", exam_id):
+                st.error("Use apenas letras, números, '-' e '_' no identificador.")
+            elif exam_id in list_exams(EXAMS_DIR):
+                st.error(f"Já existe uma prova `{exam_id}`.")
+            else:
+                counts = {QUICK_QUIZ: quiz, CLINICAL_CASE: clinical, SEQUENCE: sequence}
+                try:
+                    build_exam(index, EXAMS_DIR, exam_id, forms=forms, counts=counts,
+                               minutes=minutes, seed=seed, title=title)
+                except ValueError as e:
+                    st.error(str(e))
+                else:
+                    st.success(f"Prova gerada: os alunos a abrem com `?prova={exam_id}`.")
+
+    for exam_id in list_exams(EXAMS_DIR):
+        exam = load_exam(EXAMS_DIR, exam_id)
+        if exam is None:
+            continue
+        records = exam.submissions()
+        delivered = sum(r["submitted"] is not None for r in records)
+        status = "encerrada" if exam.closed else "aberta"
+        st.markdown(f"**{exam.manifest['title']}** (`?prova={exam_id}`, {status}): "
+                    f"{exam.manifest['forms']} formulários, {len(records)} alunos iniciaram, {delivered} entregaram")
+        if not exam.closed and st.button("Encerrar e corrigir", key=f"close_exam_{exam_id}"):
+            rows = close_exam(exam)
+            st.dataframe(rows, use_container_width=True, hide_index=True)
+        if exam.closed:
+            with open(os.path.join(exam.directory, RESULTS_FILE), "rb") as f:
+                st.download_button("Baixar notas (CSV)", f.read(), file_name=f"{exam_id}.csv",
+                                   key=f"results_{exam_id}")
+
+@profiled("render_instructor_tab")
+def render_instructor_tab(dataset):
+    """Renderiza o painel da turma a partir do registro colunar de respostas."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from answer_log import error_rate_by_organ, error_rate_by_step, error_rate_over_time, load_answers
+
+    st.markdown('<p class="main-header">👩‍🏫 Painel do Professor</p>', unsafe_allow_html=True)
+    st.markdown('<p class="subtitle">Desempenho da turma agregado a partir de todas as respostas registradas</p>', unsafe_allow_html=True)
+
+    index = dataset.index
+    registry = get_dataset_registry(DATASETS_FILE)
+    watcher = registry.watcher(st.session_state.dataset_key)
+    with st.expander("🗂️ Conjunto de dados"):
+        st.markdown(f"**Versão carregada:** {dataset.version} "
+                    f"({index.num_routes} vias, {index.num_nodes} estruturas)")
+        for warning in dataset.warnings:
+            st.warning(warning)
+        resident = registry.resident()
+        st.caption(
+            f"Conjuntos em memória: {', '.join(registry.names()[k] for k in resident)} "
+            f"({sum(resident.values()) / 1024:.0f} KiB de {DATASET_CACHE_MB:.0f} MB)"
+        )
+        if watcher.last_error is not None:
+            st.error(f"A última alteração de `{watcher.path}` foi recusada; a versão anterior continua em uso.\n\n{watcher.last_error}")
+
+    with st.expander("📝 Provas"):
+        render_exam_admin(index)
+
+    writer = get_progress_writer(PROGRESS_DB)
+    if writer.failures:
+        st.error(f"⚠️ {writer.failures} gravações do progresso dos alunos falharam neste processo "
+                 f"({writer.pending()} alunos aguardando gravação). Veja o log do servidor.")
+    answer_log = get_answer_log(ANSWER_LOG_DIR, index.fingerprint, index)
+    if answer_log.failures:
+        st.warning(f"⚠️ {answer_log.failures} gravações do registro de respostas falharam neste processo. "
+                   "Veja o log do servidor.")
+
+    answers, hidden = load_answers(ANSWER_LOG_DIR, index)
+    if hidden:
+        hidden_rows = f"{hidden:,}".replace(",", ".")
+        st.caption(f"{hidden_rows} etapas respondidas em versões anteriores do conjunto de dados não aparecem: "
+                   "o órgão, a via ou a estrutura foi removido ou renomeado.")
+    if answers.num_rows == 0:
+        st.info("Ainda não há respostas registradas para este conjunto de dados.")
+        return
+
+    mode_names = {QUICK_QUIZ: "Quiz Rápido", CLINICAL_CASE: "Casos Clínicos", SEQUENCE: "Sequência Completa"}
+    col1, col2 = st.columns(2)
+    with col1:
+        kinds = st.multiselect(
+            "Modos de jogo:",
+            options=list(mode_names),
+            default=list(mode_names),
+            format_func=mode_names.get,
+            key="instructor_kinds"
+        )
+    with col2:
+        unit = st.radio(
+            "Agrupar no tempo por:",
+            ["day", "week", "month"],
+            format_func={"day": "Dia", "week": "Semana", "month": "Mês"}.get,
+            horizontal=True,
+            key="instructor_unit"
+        )
+    answers = answers.filter(pc.is_in(answers["kind"], value_set=pa.array(kinds, pa.string())))
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Etapas respondidas", f"{answers.num_rows:,}".replace(",", "."))
+    col2.metric("Alunos", pc.count_distinct(answers["student"]).as_py())
+    errors = pc.sum(pc.invert(answers["correct"])).as_py() or 0
+    col3.metric("Taxa de erro geral", f"{errors / answers.num_rows * 100:.1f}%" if answers.num_rows else "—")
+    if answers.num_rows == 0:
+        return
+
+    # Ids viram nomes com um único take vetorizado por coluna
+    node_names = pa.array(list(index.node_names))
+    route_names = pa.array(list(index.route_names))
+    organ_names = pa.array(list(index.organ_names))
+
+    st.markdown("### 🧭 Erros por etapa do trajeto")
+    by_step = error_rate_by_step(answers)
+    st.dataframe(pa.table({
+        "Órgão": organ_names.take(pa.array(index.route_organs).take(by_step["route"])),
+        "Via": route_names.take(by_step["route"]),
+        "Etapa": pc.add(by_step["step"], 1),
+        "Estrutura": node_names.take(by_step["node"]),
+        "Respostas": by_step["answers"],
+        "Taxa de erro": by_step["error_rate"],
+    }), use_container_width=True, hide_index=True)
+
+    st.markdown("### 🫀 Erros por órgão")
+    by_organ = error_rate_by_organ(answers)
+    st.dataframe(pa.table({
+        "Órgão": organ_names.take(by_organ["organ"]),
+        "Modo": [mode_names.get(k, k) for k in by_organ["kind"].to_pylist()],
+        "Respostas": by_organ["answers"],
+        "Taxa de erro": by_organ["error_rate"],
+    }), use_container_width=True, hide_index=True)
+
+    st.markdown("### 📈 Erros ao longo do tempo")
+    over_time = error_rate_over_time(answers, unit)
+    st.line_chart(over_time.select(["period", "error_rate"]).to_pandas(), x="period", y="error_rate")
 
 # ============================================================================
 # FUNÇÕES AUXILIARES
@@ -792,46 +1619,178 @@ def get_organ_emoji(organ_key):
     }
     return emojis.get(organ_key, "🔬")
 
+def keep_section_state():
+    """Preserva o valor dos widgets das seções que não serão desenhadas neste rerun.
+
+    O Streamlit descarta o estado de widgets ausentes em um rerun; reatribuir
+    a chave mantém a seleção de cada seção ao voltar para ela.
+    """
+    for key in list(st.session_state.keys()):
+        if key.startswith(SECTION_STATE_PREFIXES):
+            st.session_state[key] = st.session_state[key]
+
+def is_instructor():
+    """Indica se a URL traz a chave do professor."""
+    return bool(INSTRUCTOR_KEY) and st.query_params.get("professor") == INSTRUCTOR_KEY
+
+def diagnostics_enabled():
+    """Os painéis de diagnóstico só aparecem com a instrumentação ativa ou para o professor."""
+    return INSTRUMENTATION or is_instructor()
+
+def available_sections():
+    """Seções visíveis nesta sessão: o painel do professor exige a chave na URL."""
+    if is_instructor():
+        return {**SECTIONS, INSTRUCTOR_SECTION[0]: INSTRUCTOR_SECTION[1]}
+    return SECTIONS
+
+def render_section(section, dataset):
+    """Executa apenas a função de renderização da seção indicada."""
+    index = dataset.index
+    if section == INSTRUCTOR_SECTION[0]:
+        render_instructor_tab(dataset)
+    elif section == "vias":
+        render_drainage_pathways_tab(index, get_render_cache(index.fingerprint, index))
+    elif section == "estudo":
+        render_study_tab(index)
+    else:
+        render_games_tab(index)
+
+def render_performance_panel(nav_mode):
+    """Mostra na barra lateral o tempo médio de rerun e a economia da navegação preguiçosa."""
+    timings = get_rerun_timings()
+    with st.sidebar.expander("⏱️ Desempenho dos reruns"):
+        for mode in NAV_MODES:
+            mean = timings.mean(mode)
+            if mean is not None:
+                st.markdown(f"**{mode}:** {mean * 1000:.1f} ms em média ({timings.count(mode)} reruns)")
+        savings = timings.savings()
+        if savings is not None:
+            st.markdown(f"**Economia da navegação preguiçosa:** {savings * 100:.0f}%")
+        st.caption(f"Modo atual: {nav_mode}. Compare abrindo o app com ?nav=tabs e ?nav=lazy.")
+
+        footprint = session_footprint()
+        st.markdown(f"**Estado desta sessão:** {footprint / 1024:.1f} KiB "
+                    f"(orçamento: {SESSION_BYTES_BUDGET / 1024:.0f} KiB)")
+        if footprint > SESSION_BYTES_BUDGET:
+            st.warning("O estado da sessão passou do orçamento por sessão.")
+        if SESSION_IDLE_TIMEOUT > 0:
+            reaper = get_session_reaper()
+            st.caption(f"{len(reaper)} sessões acompanhadas neste processo; "
+                       f"sessões sem uso por {SESSION_IDLE_TIMEOUT / 60:.0f} min são encerradas.")
+            if reaper.failures:
+                st.warning(f"{reaper.failures} varreduras de sessões ociosas falharam; veja o log do servidor.")
+
+def render_instrumentation_panel():
+    """Mostra na barra lateral onde o tempo dos reruns está sendo gasto."""
+    profiler = get_profiler()
+    reruns = max(sum(get_rerun_timings().count(mode) for mode in NAV_MODES), 1)
+    with st.sidebar.expander("🛠️ Instrumentação"):
+        timings = profiler.timings()
+        if timings:
+            st.markdown("**Tempo por função:**")
+            st.dataframe({
+                "Função": list(timings),
+                "Chamadas": [count for count, _, _ in timings.values()],
+                "Média (ms)": [round(total / count * 1000, 2) for count, total, _ in timings.values()],
+                "Máx. (ms)": [round(peak * 1000, 2) for _, _, peak in timings.values()],
+                "Total (s)": [round(total, 3) for _, total, _ in timings.values()],
+            }, hide_index=True)
+
+        counters = profiler.counters()
+        reads = counters.get(("session_state_ops", "read"), 0)
+        writes = counters.get(("session_state_ops", "write"), 0)
+        st.markdown(f"**session_state por rerun:** {reads / reruns:.0f} leituras, {writes / reruns:.0f} escritas")
+
+        sizes = {label: value for (name, label), value in counters.items() if name == "forward_msg_bytes"}
+        if sizes:
+            st.markdown(f"**Enviado ao navegador por rerun:** {sum(sizes.values()) / reruns / 1024:.1f} KiB")
+            for label, value in sorted(sizes.items(), key=lambda item: -item[1]):
+                st.markdown(f"- `{label}`: {counters[('forward_msgs', label)]} mensagens, {value / 1024:.1f} KiB")
+
+        if get_metrics_server(METRICS_PORT) is not None:
+            st.caption(f"Métricas no formato Prometheus em http://127.0.0.1:{METRICS_PORT}/metrics")
+        else:
+            st.caption(f"Porta {METRICS_PORT} ocupada: endpoint /metrics desativado neste processo.")
+
 # ============================================================================
 # MAIN
 # ============================================================================
 
 def main():
     """Função principal da aplicação."""
+    started = time.perf_counter()
+    # Alunos sempre usam o modo configurado; ?nav= serve só para comparar os modos.
+    # O modo vira rótulo das medições, então só os conhecidos são aceitos da URL
+    requested = st.query_params.get("nav") if diagnostics_enabled() else None
+    nav_mode = requested if requested in NAV_MODES else NAV_MODE
+    sections = available_sections()
+    section = None
+    if INSTRUMENTATION:
+        instrument_messages()
+
+    # Prova: só o formulário pré-gerado, sem as seções de estudo nem o progresso
+    # (que criaria um código de aluno automático)
+    exam_id = st.query_params.get("prova")
+    if exam_id:
+        touch_session()
+        render_exam_page(exam_id)
+        return
+
     # Inicializa estado
     init_session_state()
+    touch_session()
 
-    # Carrega dados
-    organs = load_data('data.json')
+    # Carrega dados: um único instantâneo vale para o rerun inteiro
+    try:
+        dataset = load_data(select_dataset())
+    except (OSError, DatasetError) as e:
+        st.error(f"❌ Não foi possível carregar os dados.\n\n{e}")
+        st.stop()
+    index = dataset.index
+    sync_dataset(index)
 
     # Cabeçalho principal
     st.markdown('<p class="main-header">🫀 Drenagem Linfática Abdominal</p>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">Plataforma interativa de estudo para estudantes de medicina</p>', unsafe_allow_html=True)
 
-    # Sistema de abas
-    tab1, tab2, tab3 = st.tabs([
-        "🗺️ Vias de Drenagem",
-        "📚 Estudo",
-        "🎮 Jogos Interativos"
-    ])
-
-    with tab1:
-        render_drainage_pathways_tab(organs)
-
-    with tab2:
-        render_study_tab(organs)
-
-    with tab3:
-        render_games_tab(organs)
+    try:
+        if nav_mode == "tabs":
+            # Sistema de abas: todas as abas executam a cada rerun
+            tabs = st.tabs(list(sections.values()))
+            for tab, key in zip(tabs, sections):
+                with tab:
+                    render_section(key, dataset)
+        else:
+            # Navegação preguiçosa: apenas a seção selecionada executa
+            keep_section_state()
+            section = st.radio(
+                "Seção:",
+                options=list(sections),
+                format_func=sections.get,
+                horizontal=True,
+                key="active_section",
+                label_visibility="collapsed"
+            )
+            render_section(section, dataset)
+    finally:
+        get_rerun_timings().record(nav_mode, section, time.perf_counter() - started)
+
+    # O tamanho da sessão percorre todo o estado: não é medido para cada aluno
+    if diagnostics_enabled():
+        render_performance_panel(nav_mode)
+    if INSTRUMENTATION:
+        render_instrumentation_panel()
+    st.sidebar.caption(
+        f"Código do aluno: `{st.session_state.student_id}`. "
+        "Guarde o link desta página para recuperar seu progresso."
+    )
 
     # Rodapé
     st.markdown("---")
-    st.markdown("""
-    <div style='text-align: center; color: #64748b; font-size: 0.9rem;'>
-        <p>Desenvolvido para estudantes de medicina • Conteúdo baseado em anatomia clássica</p>
-        <p>Sempre consulte literatura médica atualizada e seus professores para confirmação</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(static_html("footer.html"), unsafe_allow_html=True)
+
+    # Pré-gera perguntas para que o próximo clique apenas retire uma pronta
+    prefetch_questions(index)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,22 @@
+"""Etapa protegida das threads de manutenção em segundo plano.
+
+As threads que gravam em lote (progresso, registro de respostas), liberam
+sessões ociosas e recarregam os conjuntos de dados repetem uma etapa
+periódica. Uma exceção não pode encerrar a thread: o trabalho que falhou
+continua pendente e é tentado de novo no ciclo seguinte.
+"""
+
+
+def guarded_step(owner, step, logger, message, *args):
+    """Executa ``step()``; se falhar, conta em ``owner.failures``, registra no log e retorna a exceção.
+
+    ``message`` e ``args`` vão para ``logger.exception``, para que o log
+    indique o módulo e o recurso envolvidos.
+    """
+    try:
+        step()
+    except Exception as e:
+        owner.failures += 1
+        logger.exception(message, *args)
+        return e
+    return None
@@ -0,0 +1,179 @@
+"""Benchmark de partida a frio: quanto tempo um processo novo leva para servir o app.py.
+
+Cada repetição usa processos novos, sem nada em cache:
+
+- ``server_ready``: ``streamlit run`` até o endpoint ``/_stcore/health``
+  responder, isto é, até o pod poder entrar no balanceador;
+- ``first_paint``: do início do interpretador até o fim da primeira execução
+  do script (importações, carga dos dados e a página inicial completa),
+  medido com ``AppTest`` em um processo filho;
+- ``warm_rerun``: a execução seguinte do script no mesmo processo.
+
+O processo filho também informa quais módulos pesados (graphviz, pyarrow,
+numpy) já estavam importados ao fim da primeira página. Com ``--budget`` o
+script termina com erro se a mediana de ``server_ready + first_paint``
+passar do limite, para ser usado como verificação antes de publicar.
+
+Uso:
+    python benchmarks/cold_start.py --repeat 5 --budget 3 --out cold_start.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+HEAVY_MODULES = ("graphviz", "pyarrow", "numpy")
+
+
+def child(started):
+    """Executado no processo filho: mede a primeira página e o rerun seguinte."""
+    import warnings
+    warnings.filterwarnings("ignore")
+
+    from streamlit.testing.v1 import AppTest
+
+    imported = time.time()
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    at.run()
+    first_paint = time.time()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    rerun_started = time.perf_counter()
+    at.run()
+    warm_rerun = time.perf_counter() - rerun_started
+    json.dump({
+        "import_streamlit_s": imported - started,
+        "first_paint_s": first_paint - started,
+        "warm_rerun_s": warm_rerun,
+        "heavy_modules_loaded": loaded,
+        "errors": len(at.exception),
+    }, sys.stdout)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_paint(env):
+    """Roda o filho em um interpretador novo e devolve suas medições."""
+    started = time.time()
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", repr(started)],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure_server_ready(env, timeout):
+    """Segundos de ``streamlit run`` até o health check responder."""
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}/_stcore/health"
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"o servidor não respondeu em {timeout} s")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def summarize(values):
+    values = np.asarray(values) * 1000
+    return {
+        "median_ms": round(float(np.median(values)), 1),
+        "min_ms": round(float(values.min()), 1),
+        "max_ms": round(float(values.max()), 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de partida a frio do app de drenagem linfática.")
+    parser.add_argument("--repeat", type=int, default=5, help="Número de partidas medidas.")
+    parser.add_argument("--timeout", type=float, default=60, help="Tempo limite (s) de cada partida.")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Limite (s) para a mediana de server_ready + first_paint.")
+    parser.add_argument("--out", default="cold_start.json", help="Arquivo JSON de resultados.")
+    parser.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        return child(float(args.child))
+
+    # Progresso e registro de respostas vão para um diretório temporário
+    workdir = tempfile.mkdtemp(prefix="drenagem-cold-")
+    env = dict(os.environ)
+    env.setdefault("DRENAGEM_PROGRESS_DB", os.path.join(workdir, "progress.sqlite3"))
+    env.setdefault("DRENAGEM_ANSWER_LOG", os.path.join(workdir, "answer_log"))
+
+    runs = []
+    for i in range(args.repeat):
+        run = measure_first_paint(env)
+        run["server_ready_s"] = measure_server_ready(env, args.timeout)
+        runs.append(run)
+        print(f"partida {i + 1}: servidor pronto em {run['server_ready_s'] * 1000:.0f} ms, "
+              f"primeira página em {run['first_paint_s'] * 1000:.0f} ms, "
+              f"rerun seguinte em {run['warm_rerun_s'] * 1000:.0f} ms")
+
+    total = [r["server_ready_s"] + r["first_paint_s"] for r in runs]
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "server_ready": summarize([r["server_ready_s"] for r in runs]),
+        "import_streamlit": summarize([r["import_streamlit_s"] for r in runs]),
+        "first_paint": summarize([r["first_paint_s"] for r in runs]),
+        "warm_rerun": summarize([r["warm_rerun_s"] for r in runs]),
+        "ready_to_first_paint": summarize(total),
+        "heavy_modules_loaded": runs[-1]["heavy_modules_loaded"],
+        "errors": sum(r["errors"] for r in runs),
+        "runs": runs,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Mediana até a primeira página: {results['ready_to_first_paint']['median_ms']:.0f} ms; "
+          f"módulos pesados carregados: {', '.join(results['heavy_modules_loaded']) or 'nenhum'}")
+    print(f"Resultados gravados em {args.out}")
+
+    if args.budget is not None and float(np.median(total)) > args.budget:
+        print(f"Acima do limite de {args.budget:.1f} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""Teste de carga headless: simula alunos concorrentes usando o app.py.
+
+Cada aluno simulado é uma sessão ``AppTest`` independente, executada em sua
+própria thread, que segue um roteiro realista: troca de seções, responde
+perguntas do quiz rápido, casos clínicos e sequências, e troca órgão/via na
+aba de vias. Para cada número de sessões simultâneas o script mede a
+latência de cada tipo de interação (percentis), o tempo de CPU por rerun e a
+memória por sessão, e grava tudo em JSON para comparar commits.
+
+O ``AppTest`` troca objetos globais do Streamlit a cada execução e não pode
+rodar dois scripts ao mesmo tempo; por isso os reruns das sessões passam por
+uma trava única. A latência registrada inclui a espera nessa fila, como num
+processo servidor limitado pelo GIL; o tempo de serviço (sem a espera) é
+registrado à parte.
+
+Uso:
+    python benchmarks/load_test.py --sessions 1 10 50 100 --out load_test.json
+"""
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import warnings
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT, "app.py")
+PERCENTILES = (50, 90, 95, 99)
+
+# Um rerun do AppTest por vez no processo (ver docstring do módulo)
+_RUN_LOCK = threading.Lock()
+
+
+def rss_bytes():
+    """Memória residente atual do processo (Linux), ou o pico se /proc não existir."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss é em KiB no Linux e em bytes no macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class StudentSession:
+    """Um aluno simulado: uma sessão AppTest e o registro das latências de cada interação."""
+
+    def __init__(self, rng, timeout):
+        from streamlit.testing.v1 import AppTest
+
+        self.rng = rng
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.latencies = defaultdict(list)
+        self.service = []
+        self.reruns = 0
+        self.errors = 0
+
+    def _timed(self, name, action):
+        started = time.perf_counter()
+        with _RUN_LOCK:
+            acquired = time.perf_counter()
+            action()
+        finished = time.perf_counter()
+        self.latencies[name].append(finished - started)
+        self.service.append(finished - acquired)
+        self.reruns += 1
+        if self.at.exception:
+            self.errors += 1
+
+    def _button(self, key):
+        return next(b for b in self.at.button if b.key == key)
+
+    def _has_button(self, key):
+        return any(b.key == key for b in self.at.button)
+
+    def section(self, name):
+        self._timed("switch_section", lambda: self.at.radio(key="active_section").set_value(name).run())
+
+    def game_mode(self, mode):
+        self._timed("switch_game_mode", lambda: self.at.radio(key="game_mode_selection").set_value(mode).run())
+
+    def answer(self, prefix, radio_key=None):
+        """Escolhe uma alternativa ao acaso, confirma e avança para a próxima pergunta."""
+        if radio_key is not None:
+            radios = [r for r in self.at.radio if r.key and r.key.startswith(radio_key)]
+            if radios:
+                radios[0].set_value(self.rng.choice(radios[0].options))
+        orderings = [m for m in self.at.multiselect if m.key and m.key.startswith("sequence_choice_")]
+        if orderings:
+            options = list(range(len(orderings[0].options)))
+            orderings[0].set_value(self.rng.sample(options, len(options)))
+        self._timed(f"{prefix}_submit", lambda: self._button(f"submit_{prefix}").click().run())
+        if self._has_button(f"next_{prefix}"):
+            self._timed(f"{prefix}_next", lambda: self._button(f"next_{prefix}").click().run())
+
+    def pathways(self, changes):
+        organ_box = self.at.selectbox(key="pathway_organ")
+        for organ in self.rng.sample(list(organ_box.options), min(changes, len(organ_box.options))):
+            self._timed("pathway_organ", lambda: self.at.selectbox(key="pathway_organ").set_value(organ).run())
+            routes = [s for s in self.at.selectbox if s.key == "pathway_route"]
+            if routes:
+                choice = self.rng.randrange(len(routes[0].options))
+                self._timed("pathway_route", lambda: routes[0].select_index(choice).run())
+
+    def run(self, rounds):
+        """Roteiro completo de um aluno."""
+        self._timed("load", lambda: self.at.run())
+        self.section("vias")
+        self.pathways(rounds)
+        self.section("jogos")
+        for _ in range(rounds):
+            self.answer("quiz", "quiz_radio_")
+        self.game_mode("Casos Clínicos")
+        for _ in range(rounds):
+            self.answer("clinical", "clinical_radio_")
+        self.game_mode("Sequência Completa")
+        for _ in range(rounds):
+            self.answer("sequence")
+        self.section("estudo")
+
+
+def summarize(samples):
+    """Percentis (ms) de uma lista de latências em segundos."""
+    values = np.asarray(samples) * 1000
+    summary = {"count": int(values.size), "mean_ms": round(float(values.mean()), 3)}
+    for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(v), 3)
+    summary["max_ms"] = round(float(values.max()), 3)
+    return summary
+
+
+def run_level(num_sessions, rounds, seed, timeout):
+    """Executa ``num_sessions`` alunos simultâneos e resume as medições."""
+    gc.collect()
+    rss_before = rss_bytes()
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+
+    sessions = [StudentSession(random.Random(seed + i), timeout) for i in range(num_sessions)]
+    barrier = threading.Barrier(num_sessions)
+
+    def drive(session):
+        barrier.wait()
+        session.run(rounds)
+
+    with ThreadPoolExecutor(max_workers=num_sessions) as pool:
+        list(pool.map(drive, sessions))
+
+    wall = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    # As sessões continuam vivas até aqui, então o RSS inclui o estado de todas elas
+    rss_after = rss_bytes()
+
+    latencies = defaultdict(list)
+    for session in sessions:
+        for name, values in session.latencies.items():
+            latencies[name].extend(values)
+    reruns = sum(s.reruns for s in sessions)
+    return {
+        "sessions": num_sessions,
+        "rounds": rounds,
+        "reruns": reruns,
+        "errors": sum(s.errors for s in sessions),
+        "wall_s": round(wall, 3),
+        "throughput_reruns_per_s": round(reruns / wall, 2),
+        "cpu_per_rerun_ms": round(cpu / reruns * 1000, 3),
+        # Memória liberada por níveis anteriores é reaproveitada sem aumentar o RSS;
+        # para medir a memória com precisão, rode um único nível por execução
+        "rss_per_session_kib": round(max(rss_after - rss_before, 0) / num_sessions / 1024, 1),
+        "all": summarize([v for values in latencies.values() for v in values]),
+        "service": summarize([v for session in sessions for v in session.service]),
+        "interactions": {name: summarize(values) for name, values in sorted(latencies.items())},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Teste de carga headless do app de drenagem linfática.")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50, 100],
+                        help="Números de sessões simultâneas a testar, em ordem.")
+    parser.add_argument("--rounds", type=int, default=3,
+                        help="Perguntas respondidas por modo de jogo e órgãos visitados por aluno.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=120, help="Tempo limite (s) de cada rerun.")
+    parser.add_argument("--out", default="load_test.json", help="Arquivo JSON de resultados.")
+    args = parser.parse_args(argv)
+
+    # Progresso e registro de respostas vão para um diretório temporário
+    workdir = tempfile.mkdtemp(prefix="drenagem-load-")
+    os.environ.setdefault("DRENAGEM_PROGRESS_DB", os.path.join(workdir, "progress.sqlite3"))
+    os.environ.setdefault("DRENAGEM_ANSWER_LOG", os.path.join(workdir, "answer_log"))
+    os.chdir(ROOT)
+    warnings.filterwarnings("ignore")
+
+    import streamlit
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "cpus": os.cpu_count(),
+            "nav_mode": os.environ.get("DRENAGEM_NAV_MODE", "lazy"),
+        },
+        "levels": [],
+    }
+    # Aquecimento: importações e caches compartilhados não entram na conta da primeira medição
+    StudentSession(random.Random(args.seed), args.timeout).run(1)
+
+    for num_sessions in args.sessions:
+        level = run_level(num_sessions, args.rounds, args.seed, args.timeout)
+        results["levels"].append(level)
+        print(f"{num_sessions:4d} sessões: p50 {level['all']['p50_ms']:.1f} ms, "
+              f"p99 {level['all']['p99_ms']:.1f} ms (serviço p50 {level['service']['p50_ms']:.1f} ms), "
+              f"CPU/rerun {level['cpu_per_rerun_ms']:.1f} ms, "
+              f"{level['rss_per_session_kib']:.0f} KiB/sessão, {level['errors']} erros")
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Resultados gravados em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Carregamento validado do conjunto de dados, com recarga automática.
+
+``data.json`` é validado (esquema e invariantes do grafo) e compilado no
+índice do app uma única vez por versão do arquivo. Um observador em segundo
+plano percebe quando o arquivo muda, compila a nova versão e a publica com
+uma única atribuição: quem já pegou o instantâneo anterior continua usando-o
+inteiro, sem misturar as duas versões.
+
+Vários conjuntos (regiões anatômicas) podem ser publicados juntos por um
+registro: cada um só é lido quando alguém o escolhe pela primeira vez, e os
+menos usados saem da memória quando o total passa de um limite.
+
+Com ``shared_dir``, o índice compilado é gravado uma vez em um arquivo que
+todos os processos do servidor mapeiam em memória, em vez de cada um manter
+a sua cópia.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from background import guarded_step
+from drainage_index import OrgansView, compile_dag, compile_index, open_index, save_index
+from questions import CASE_ANSWER_STEP, CASE_TEMPLATES
+from sessions import deep_sizeof
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetError(ValueError):
+    """O conjunto de dados viola o esquema ou os invariantes do grafo."""
+
+    def __init__(self, problems):
+        self.problems = list(problems)
+        super().__init__("Conjunto de dados inválido:\n" + "\n".join(f"- {p}" for p in self.problems))
+
+
+def _find_cycle(edges):
+    """Retorna um ciclo (lista de estruturas) do grafo dirigido, ou None."""
+    succ = {}
+    for a, b in edges:
+        succ.setdefault(a, []).append(b)
+    # DFS iterativa com três cores: 0 = não visitado, 1 = na pilha, 2 = concluído
+    color = {}
+    for start in succ:
+        if color.get(start):
+            continue
+        path, stack = [start], [iter(succ.get(start, ()))]
+        color[start] = 1
+        while stack:
+            nxt = next(stack[-1], None)
+            if nxt is None:
+                color[path.pop()] = 2
+                stack.pop()
+            elif color.get(nxt) == 1:
+                return path[path.index(nxt):] + [nxt]
+            elif not color.get(nxt):
+                color[nxt] = 1
+                path.append(nxt)
+                stack.append(iter(succ.get(nxt, ())))
+    return None
+
+
+def validate_organs(organs):
+    """Verifica o esquema e os invariantes do grafo; retorna a lista de avisos.
+
+    Levanta ``DatasetError`` com todos os problemas encontrados se os dados
+    não puderem ser usados pelo app.
+    """
+    if not isinstance(organs, dict) or not organs:
+        raise DatasetError(["a raiz deve ser um objeto não vazio com um item por órgão"])
+
+    problems, warnings, edges = [], [], set()
+    for organ_key, organ in organs.items():
+        where = f"órgão '{organ_key}'"
+        if not isinstance(organ, dict):
+            problems.append(f"{where}: deve ser um objeto com 'nome' e 'rotas'")
+            continue
+        if not isinstance(organ.get("nome"), str) or not organ.get("nome"):
+            problems.append(f"{where}: 'nome' ausente ou vazio")
+        rotas = organ.get("rotas")
+        if not isinstance(rotas, list) or not rotas:
+            problems.append(f"{where}: 'rotas' deve ser uma lista não vazia")
+            continue
+        for i, rota in enumerate(rotas, 1):
+            where_route = f"{where}, via {i}"
+            if not isinstance(rota, dict):
+                problems.append(f"{where_route}: deve ser um objeto com 'Rota' e 'Trajeto'")
+                continue
+            if not isinstance(rota.get("Rota"), str) or not rota.get("Rota"):
+                problems.append(f"{where_route}: 'Rota' ausente ou vazia")
+            trajeto = rota.get("Trajeto")
+            if not isinstance(trajeto, list) or not trajeto:
+                problems.append(f"{where_route}: 'Trajeto' deve ser uma lista não vazia")
+                continue
+            if not all(isinstance(etapa, str) and etapa.strip() for etapa in trajeto):
+                problems.append(f"{where_route}: todas as etapas do 'Trajeto' devem ser textos não vazios")
+                continue
+            repeated = sorted({etapa for etapa in trajeto if trajeto.count(etapa) > 1})
+            if repeated:
+                problems.append(f"{where_route}: o trajeto passa mais de uma vez por {', '.join(repeated)}")
+            edges.update(zip(trajeto, trajeto[1:]))
+
+        if organ_key not in CASE_TEMPLATES:
+            warnings.append(f"{where}: sem modelo em CASE_TEMPLATES; não haverá casos clínicos deste órgão")
+        else:
+            step = CASE_ANSWER_STEP.get(organ_key, 0)
+            if all(len(r.get("Trajeto") or ()) <= step for r in rotas if isinstance(r, dict)):
+                warnings.append(f"{where}: nenhuma via tem a etapa {step + 1} cobrada no caso clínico")
+
+    cycle = _find_cycle(edges) if not problems else None
+    if cycle:
+        problems.append(f"o grafo de drenagem tem um ciclo: {' → '.join(cycle)}")
+    if problems:
+        raise DatasetError(problems)
+    return warnings
+
+
+@dataclass(frozen=True, eq=False)
+class Dataset:
+    """Uma versão validada e compilada do conjunto de dados."""
+    version: int
+    organs: object
+    index: object
+    warnings: tuple
+    nbytes: int = 0
+
+
+def _parse(data):
+    try:
+        return json.loads(data)
+    except ValueError as e:
+        raise DatasetError([f"JSON malformado: {e}"]) from e
+
+
+def load_dataset(path, mode="json", version=1, shared_dir=None):
+    """Lê, valida e compila ``path``; ``mode='dag'`` guarda os trajetos em um DAG compacto.
+
+    Com ``shared_dir``, o índice vem do arquivo mapeado compilado a partir
+    deste mesmo conteúdo, que é criado se ainda não existir. Esse arquivo
+    sempre guarda o índice compilado completo (é compartilhado por todos os
+    processos), então ``mode`` não se aplica a ele.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if shared_dir:
+        return _load_shared(data, version, shared_dir)
+    raw = _parse(data)
+    warnings = validate_organs(raw)
+    if mode == "dag":
+        # O DAG continua sendo o armazenamento das rotas; os órgãos são lidos dele, sem guardar o JSON
+        index = compile_dag(raw).compile_index()
+        organs = OrgansView(index)
+    else:
+        organs, index = raw, compile_index(raw)
+    return Dataset(version, organs, index, tuple(warnings), deep_sizeof((organs, index)))
+
+
+def _load_shared(data, version, shared_dir):
+    """Mapeia o índice compartilhado do conteúdo ``data``, compilando-o só no primeiro processo."""
+    shared_path = os.path.join(shared_dir, f"{hashlib.sha256(data).hexdigest()[:16]}.idx")
+    try:
+        index, extra = open_index(shared_path)
+    except (OSError, ValueError):
+        raw = _parse(data)
+        warnings = validate_organs(raw)
+        os.makedirs(shared_dir, exist_ok=True)
+        save_index(compile_index(raw), shared_path, extra={"warnings": warnings})
+        index, extra = open_index(shared_path)
+    # Os órgãos são lidos do próprio índice, sem guardar o JSON em cada processo
+    organs = OrgansView(index)
+    return Dataset(version, organs, index, tuple(extra["warnings"]), deep_sizeof((organs, index)))
+
+
+class DatasetWatcher:
+    """Mantém a versão atual do conjunto de dados e a troca quando o arquivo muda.
+
+    Versões inválidas são recusadas: a anterior continua publicada e o erro
+    fica em ``last_error``. Falhas inesperadas da recarga também vão para
+    ``last_error``, para o log e para a contagem ``failures``.
+    """
+
+    def __init__(self, path, mode="json", poll_interval=2.0, shared_dir=None):
+        self.path = path
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.shared_dir = shared_dir
+        self.last_error = None
+        self.failures = 0
+        self._stamp = self._file_stamp()
+        self._current = load_dataset(path, mode, shared_dir=shared_dir)
+        self._stopped = threading.Event()
+        if poll_interval > 0:
+            threading.Thread(target=self._run, name="dataset-watcher", daemon=True).start()
+
+    @property
+    def current(self):
+        """Instantâneo publicado; leia uma vez por rerun e use-o até o fim."""
+        return self._current
+
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def check(self):
+        """Recarrega o arquivo se ele mudou; retorna True se uma nova versão foi publicada."""
+        stamp = self._file_stamp()
+        if stamp is None or stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        try:
+            dataset = load_dataset(self.path, self.mode, self._current.version + 1, self.shared_dir)
+        except (OSError, DatasetError) as e:
+            self.last_error = e
+            return False
+        self.last_error = None
+        self._current = dataset
+        return True
+
+    def stop(self):
+        """Encerra a verificação periódica do arquivo."""
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.wait(self.poll_interval):
+            error = guarded_step(self, self.check, logger, "Falha ao recarregar %s", self.path)
+            if error is not None:
+                # A versão anterior continua publicada
+                self.last_error = error
+
+
+class DatasetRegistry:
+    """Conjuntos de dados publicados, carregados sob demanda e mantidos sob um limite de memória.
+
+    ``entries`` mapeia a chave de cada conjunto para ``{"nome": ..., "arquivo": ...}``.
+    Criar o registro não lê nenhum dos arquivos.
+    """
+
+    def __init__(self, entries, mode="json", poll_interval=2.0, max_bytes=256 * 1024 * 1024, shared_dir=None):
+        if not entries:
+            raise ValueError("O registro precisa de pelo menos um conjunto de dados.")
+        self.entries = dict(entries)
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+        self.shared_dir = shared_dir
+        self._watchers = OrderedDict()  # do menos para o mais recentemente usado
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_file(cls, path, default_file="data.json", **kwargs):
+        """Lê o registro de ``path``; sem ele, publica apenas ``default_file``."""
+        base = os.path.dirname(os.path.abspath(path))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return cls({"abdome": {"nome": "Abdome", "arquivo": default_file}}, **kwargs)
+        entries = {
+            key: {"nome": entry.get("nome", key), "arquivo": os.path.join(base, entry["arquivo"])}
+            for key, entry in raw.items()
+        }
+        return cls(entries, **kwargs)
+
+    @property
+    def default_key(self):
+        return next(iter(self.entries))
+
+    def names(self):
+        """{chave: nome exibido} de todos os conjuntos publicados."""
+        return {key: entry["nome"] for key, entry in self.entries.items()}
+
+    def watcher(self, key):
+        """Observador do conjunto ``key``, carregando-o na primeira vez."""
+        with self._lock:
+            watcher = self._watchers.get(key)
+            if watcher is not None:
+                self._watchers.move_to_end(key)
+                return watcher
+            # O carregamento fica sob a trava para que duas sessões não compilem o mesmo conjunto
+            watcher = DatasetWatcher(self.entries[key]["arquivo"], self.mode, self.poll_interval, self.shared_dir)
+            self._watchers[key] = watcher
+            self._evict(keep=key)
+            return watcher
+
+    def get(self, key):
+        """Instantâneo atual do conjunto ``key``."""
+        return self.watcher(key).current
+
+    def resident(self):
+        """{chave: bytes} dos conjuntos carregados, do menos para o mais recentemente usado."""
+        with self._lock:
+            return {key: w.current.nbytes for key, w in self._watchers.items()}
+
+    def _evict(self, keep):
+        """Descarta os conjuntos menos usados até caber no limite (nunca o que acabou de ser pedido)."""
+        total = sum(w.current.nbytes for w in self._watchers.values())
+        for key in list(self._watchers):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            watcher = self._watchers.pop(key)
+            watcher.stop()
+            total -= watcher.current.nbytes
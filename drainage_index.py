@@ -0,0 +1,552 @@
+"""Índice compilado do grafo de drenagem linfática.
+
+Compila o dicionário de órgãos lido de ``data.json`` em tabelas imutáveis de
+inteiros (formato CSR), construídas uma única vez por processo e
+compartilhadas entre todas as sessões. O índice também pode ser gravado em
+um arquivo binário que vários processos mapeiam em memória (``save_index`` /
+``open_index``): as tabelas passam a ser páginas do arquivo, compartilhadas
+por todos, e os nomes são decodificados só quando lidos.
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, fields
+from functools import cached_property
+from types import MappingProxyType
+
+import numpy as np
+
+
+def _frozen(values):
+    """Converte uma sequência de inteiros em um memoryview somente leitura."""
+    return memoryview(array('i', values)).toreadonly()
+
+
+class _IndexQueries:
+    """Consultas comuns ao índice compilado e ao índice sobre o DAG."""
+
+    @property
+    def num_nodes(self):
+        return len(self.node_names)
+
+    @property
+    def num_routes(self):
+        return len(self.route_names)
+
+    def organ_id(self, organ_key):
+        """Retorna o id inteiro de um órgão a partir da sua chave."""
+        return self.organ_keys.index(organ_key)
+
+    def organ_routes(self, organ_key):
+        """Retorna o intervalo de ids das rotas de um órgão."""
+        o = self.organ_id(organ_key)
+        return range(self.organ_route_offsets[o], self.organ_route_offsets[o + 1])
+
+    def route_id(self, organ_key, route_index):
+        """Converte (órgão, índice local da rota) no id global da rota."""
+        return self.organ_routes(organ_key)[route_index]
+
+    def trajeto(self, route_id):
+        """Retorna o trajeto de uma rota como lista de nomes de estruturas."""
+        return [self.node_names[n] for n in self.route(route_id)]
+
+    def successors(self, node_id):
+        """Retorna os ids das estruturas que recebem linfa do nó."""
+        return self.succ_targets[self.succ_offsets[node_id]:self.succ_offsets[node_id + 1]]
+
+    def near_distractors(self, node_id):
+        """Retorna as estruturas mais fáceis de confundir com o nó, da mais à menos próxima no grafo."""
+        return self.near_nodes[self.near_offsets[node_id]:self.near_offsets[node_id + 1]]
+
+    def organs_converging(self, node_id):
+        """Retorna os ids dos órgãos cuja linfa passa pelo nó (consulta O(1))."""
+        return self.node_organ_ids[self.node_organ_offsets[node_id]:self.node_organ_offsets[node_id + 1]]
+
+    def _hash(self, route_offsets, route_chunks):
+        """Fingerprint a partir das tabelas de rotas (iteráveis em pedaços, para não montá-las inteiras)."""
+        h = hashlib.sha256()
+        for names in (self.organ_keys, self.organ_names, self.route_names, self.node_names):
+            h.update("\0".join(names).encode("utf-8"))
+            h.update(b"\1")
+        h.update(self.organ_route_offsets.tobytes())
+        h.update(route_offsets)
+        for chunk in route_chunks:
+            h.update(chunk)
+        return h.hexdigest()
+
+
+@dataclass(frozen=True, eq=False)
+class DrainageIndex(_IndexQueries):
+    """Índice imutável do grafo de drenagem.
+
+    Cada estrutura anatômica recebe um id inteiro. As rotas são guardadas
+    como listas de ids concatenadas em ``route_nodes`` e delimitadas por
+    ``route_offsets``; o mesmo vale para sucessores, para os mapas reversos
+    nó -> rotas e nó -> órgãos e para os distratores próximos de cada estrutura.
+    """
+    node_names: tuple
+    node_ids: MappingProxyType
+    organ_keys: tuple
+    organ_names: tuple
+    organ_route_offsets: memoryview
+    route_names: tuple
+    route_organs: memoryview
+    route_offsets: memoryview
+    route_nodes: memoryview
+    succ_offsets: memoryview
+    succ_targets: memoryview
+    node_route_offsets: memoryview
+    node_route_ids: memoryview
+    node_organ_offsets: memoryview
+    node_organ_ids: memoryview
+    near_offsets: memoryview
+    near_nodes: memoryview
+
+    @cached_property
+    def fingerprint(self):
+        """Hash SHA-256 do conteúdo do índice, usado para validar artefatos pré-compilados."""
+        return self._hash(self.route_offsets.tobytes(), [self.route_nodes.tobytes()])
+
+    def route(self, route_id):
+        """Retorna a sequência de ids de nós de uma rota."""
+        return self.route_nodes[self.route_offsets[route_id]:self.route_offsets[route_id + 1]]
+
+    def nodes_at(self, routes, steps):
+        """Ids das estruturas nas posições (via, etapa) indicadas, vetorizado."""
+        return np.asarray(self.route_nodes)[np.asarray(self.route_offsets)[routes] + steps]
+
+    def routes_containing(self, node_id):
+        """Retorna os ids das rotas que passam pelo nó."""
+        return self.node_route_ids[self.node_route_offsets[node_id]:self.node_route_offsets[node_id + 1]]
+
+
+def _csr(buckets):
+    """Achata uma lista de listas em (offsets, valores)."""
+    offsets = [0]
+    values = []
+    for bucket in buckets:
+        values.extend(bucket)
+        offsets.append(len(values))
+    return offsets, values
+
+
+# Distratores próximos guardados por estrutura
+NEAR_DISTRACTORS = 6
+
+
+def _near_nodes(routes, successors, containing):
+    """Estruturas próximas de cada nó no grafo, em ordem de proximidade.
+
+    Primeiro os irmãos (outras saídas das estruturas que drenam para o nó),
+    depois as estruturas a um passo acima ou abaixo e, por fim, as demais
+    estações das vias que passam pelo nó, pela distância ao longo da via.
+    """
+    predecessors = [set() for _ in successors]
+    for a, targets in enumerate(successors):
+        for b in targets:
+            predecessors[b].add(a)
+
+    near = []
+    for node in range(len(successors)):
+        ranked = {}
+        for p in sorted(predecessors[node]):
+            ranked.update(dict.fromkeys(sorted(successors[p])))
+        ranked.update(dict.fromkeys(sorted(predecessors[node]) + sorted(successors[node])))
+        distance = {}
+        for route_id in containing[node]:
+            route = routes[route_id]
+            i = route.index(node)
+            for j, n in enumerate(route):
+                distance[n] = min(distance.get(n, len(route)), abs(i - j))
+        ranked.update(dict.fromkeys(sorted(distance, key=lambda n: (distance[n], n))))
+        ranked.pop(node, None)
+        near.append(list(ranked)[:NEAR_DISTRACTORS])
+    return near
+
+
+def compile_index(organs):
+    """Compila o dicionário de órgãos em um ``DrainageIndex``."""
+    node_ids = {}
+    node_names = []
+    organ_keys = []
+    organ_names = []
+    organ_route_offsets = [0]
+    route_names = []
+    routes = []
+
+    for organ_key, organ in organs.items():
+        organ_keys.append(organ_key)
+        organ_names.append(organ['nome'])
+        for rota in organ['rotas']:
+            route = []
+            for etapa in rota['Trajeto']:
+                if etapa not in node_ids:
+                    node_ids[etapa] = len(node_names)
+                    node_names.append(sys.intern(etapa))
+                route.append(node_ids[etapa])
+            routes.append(route)
+            route_names.append(rota['Rota'])
+        organ_route_offsets.append(len(routes))
+
+    tables, containing = _derived_tables(len(node_names), organ_route_offsets, routes)
+    route_offsets, route_nodes = _csr(routes)
+    node_route_offsets, node_route_ids = _csr(containing)
+    return DrainageIndex(
+        node_names=tuple(node_names),
+        node_ids=MappingProxyType(node_ids),
+        organ_keys=tuple(organ_keys),
+        organ_names=tuple(organ_names),
+        organ_route_offsets=_frozen(organ_route_offsets),
+        route_names=tuple(route_names),
+        route_offsets=_frozen(route_offsets),
+        route_nodes=_frozen(route_nodes),
+        node_route_offsets=_frozen(node_route_offsets),
+        node_route_ids=_frozen(node_route_ids),
+        **tables,
+    )
+
+
+def _derived_tables(num_nodes, organ_route_offsets, routes):
+    """Tabelas por rota e por estrutura derivadas das rotas (listas de ids de estruturas).
+
+    Retorna também o mapa nó -> rotas, que só o índice compilado guarda.
+    """
+    route_organs = [o for o in range(len(organ_route_offsets) - 1)
+                    for _ in range(organ_route_offsets[o], organ_route_offsets[o + 1])]
+    successors = [set() for _ in range(num_nodes)]
+    containing = [[] for _ in range(num_nodes)]
+    for route_id, route in enumerate(routes):
+        for a, b in zip(route, route[1:]):
+            successors[a].add(b)
+        for n in dict.fromkeys(route):
+            containing[n].append(route_id)
+
+    succ_offsets, succ_targets = _csr(sorted(s) for s in successors)
+    node_organ_offsets, node_organ_ids = _csr(sorted({route_organs[r] for r in c}) for c in containing)
+    near_offsets, near_nodes = _csr(_near_nodes(routes, successors, containing))
+    tables = dict(
+        route_organs=_frozen(route_organs),
+        succ_offsets=_frozen(succ_offsets),
+        succ_targets=_frozen(succ_targets),
+        node_organ_offsets=_frozen(node_organ_offsets),
+        node_organ_ids=_frozen(node_organ_ids),
+        near_offsets=_frozen(near_offsets),
+        near_nodes=_frozen(near_nodes),
+    )
+    return tables, containing
+
+
+# ============================================================================
+# ARQUIVO MAPEADO EM MEMÓRIA (VÁRIOS PROCESSOS)
+# ============================================================================
+
+INDEX_FILE_MAGIC = b"DRNIDX03"
+_INT_TABLES = (
+    "organ_route_offsets", "route_organs", "route_offsets", "route_nodes",
+    "succ_offsets", "succ_targets", "node_route_offsets", "node_route_ids",
+    "node_organ_offsets", "node_organ_ids", "near_offsets", "near_nodes"
+)
+_STRING_TABLES = ("node_names", "route_names")
+
+
+class MappedStrings(Sequence):
+    """Sequência de textos guardados em UTF-8 em um arquivo mapeado, decodificados a cada leitura."""
+
+    __slots__ = ("_offsets", "_blob")
+
+    def __init__(self, offsets, blob):
+        self._offsets = offsets
+        self._blob = blob
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]], "utf-8")
+
+
+class MappedNameIds(Mapping):
+    """Mapa nome -> id por busca binária nos ids ordenados por nome, sem dicionário por processo."""
+
+    __slots__ = ("_names", "_order")
+
+    def __init__(self, names, order):
+        self._names = names
+        self._order = order
+
+    def __getitem__(self, name):
+        order, names = self._order, self._names
+        lo, hi = 0, len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if names[order[mid]] < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(order) and names[order[lo]] == name:
+            return order[lo]
+        raise KeyError(name)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+def save_index(index, path, extra=None):
+    """Grava o índice em ``path`` para ser aberto com ``open_index``; ``extra`` vai no cabeçalho.
+
+    A gravação é atômica: processos que abrem o arquivo ao mesmo tempo veem
+    a versão anterior inteira ou a nova inteira.
+    """
+    sections = {name: array('i', getattr(index, name)).tobytes() for name in _INT_TABLES}
+    for name in _STRING_TABLES:
+        encoded = [s.encode("utf-8") for s in getattr(index, name)]
+        offsets, _ = _csr(encoded)
+        sections[f"{name}.offsets"] = array('i', offsets).tobytes()
+        sections[f"{name}.blob"] = b"".join(encoded)
+    order = sorted(range(index.num_nodes), key=index.node_names.__getitem__)
+    sections["node_order"] = array('i', order).tobytes()
+
+    layout, position = {}, 0
+    for name, data in sections.items():
+        layout[name] = (position, len(data))
+        position = _align(position + len(data))
+    header = json.dumps({
+        "fingerprint": index.fingerprint,
+        "organ_keys": list(index.organ_keys),
+        "organ_names": list(index.organ_names),
+        "sections": layout,
+        "extra": extra or {},
+    }, ensure_ascii=False).encode("utf-8")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_FILE_MAGIC + len(header).to_bytes(8, "little") + header)
+        base = _align(16 + len(header))
+        for name, data in sections.items():
+            f.seek(base + layout[name][0])
+            f.write(data)
+    os.replace(tmp_path, path)
+
+
+def open_index(path):
+    """Mapeia um índice gravado por ``save_index``; retorna (índice, ``extra``).
+
+    As tabelas são memoryviews sobre o mapa somente leitura: nada é copiado e
+    o sistema operacional compartilha as páginas entre todos os processos.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:8] != INDEX_FILE_MAGIC:
+        raise ValueError(f"{path} não é um índice de drenagem compilado.")
+    header_size = int.from_bytes(mm[8:16], "little")
+    header = json.loads(mm[16:16 + header_size])
+    base = _align(16 + header_size)
+    view = memoryview(mm)
+
+    def section(name):
+        start, size = header["sections"][name]
+        return view[base + start:base + start + size]
+
+    tables = {name: section(name).cast("i") for name in _INT_TABLES}
+    strings = {name: MappedStrings(section(f"{name}.offsets").cast("i"), section(f"{name}.blob"))
+               for name in _STRING_TABLES}
+    index = DrainageIndex(
+        node_names=strings["node_names"],
+        node_ids=MappedNameIds(strings["node_names"], section("node_order").cast("i")),
+        organ_keys=tuple(header["organ_keys"]),
+        organ_names=tuple(header["organ_names"]),
+        route_names=strings["route_names"],
+        **tables,
+    )
+    # O fingerprint foi calculado na compilação; recalculá-lo decodificaria todos os nomes
+    index.__dict__["fingerprint"] = header["fingerprint"]
+    return index, header["extra"]
+
+
+# ============================================================================
+# DAG COM TRONCOS COMPARTILHADOS
+# ============================================================================
+
+@dataclass(frozen=True, eq=False)
+class SharedTrunkDag:
+    """Representação deduplicada de todas as rotas de ``data.json``.
+
+    Cada vértice é o par (estrutura, próximo vértice); vértices com o mesmo
+    par são fundidos, de modo que caudas comuns (p. ex. "Cisterna do quilo"
+    -> "Ducto torácico" -> "Ângulo venoso esquerdo") existem uma única vez.
+    Uma rota é apenas o id do seu vértice inicial em ``route_heads``.
+    """
+    node_names: tuple
+    node_ids: MappingProxyType
+    organ_keys: tuple
+    organ_names: tuple
+    organ_route_offsets: memoryview
+    route_names: tuple
+    route_heads: memoryview
+    vertex_node: memoryview
+    vertex_next: memoryview
+
+    @property
+    def num_vertices(self):
+        return len(self.vertex_node)
+
+    def route(self, route_id):
+        """Percorre a rota a partir do seu vértice inicial e retorna os ids dos nós."""
+        nodes = []
+        v = self.route_heads[route_id]
+        while v != -1:
+            nodes.append(self.vertex_node[v])
+            v = self.vertex_next[v]
+        return nodes
+
+    def trajeto(self, route_id):
+        """Retorna o trajeto de uma rota como lista de nomes de estruturas."""
+        return [self.node_names[n] for n in self.route(route_id)]
+
+    def compile_index(self):
+        """Índice que usa o próprio DAG para guardar as rotas; só as tabelas por estrutura são derivadas.
+
+        As rotas expandidas existem apenas durante a compilação.
+        """
+        routes = [self.route(r) for r in range(len(self.route_heads))]
+        tables, _ = _derived_tables(len(self.node_names), self.organ_route_offsets, routes)
+        return DagIndex(**{f.name: getattr(self, f.name) for f in fields(SharedTrunkDag)}, **tables)
+
+    def organs_view(self):
+        """Retorna uma visão ``organs[key]['rotas']`` compatível com ``data.json``."""
+        return OrgansView(self)
+
+
+@dataclass(frozen=True, eq=False)
+class DagIndex(SharedTrunkDag, _IndexQueries):
+    """Índice com as mesmas consultas de ``DrainageIndex`` guardando as rotas no DAG.
+
+    Em vez de ``route_offsets``/``route_nodes`` (uma entrada por etapa de
+    cada rota), as rotas são percorridas a partir de ``route_heads``; as
+    caudas comuns ocupam memória uma única vez. O fingerprint é o mesmo do
+    índice compilado do mesmo JSON, então os artefatos pré-compilados valem
+    para os dois modos.
+    """
+    route_organs: memoryview
+    succ_offsets: memoryview
+    succ_targets: memoryview
+    node_organ_offsets: memoryview
+    node_organ_ids: memoryview
+    near_offsets: memoryview
+    near_nodes: memoryview
+
+    @cached_property
+    def fingerprint(self):
+        """Hash SHA-256 do conteúdo, idêntico ao de ``DrainageIndex`` para os mesmos dados."""
+        offsets = [0]
+        for r in range(self.num_routes):
+            offsets.append(offsets[-1] + len(self.route(r)))
+        chunks = (array('i', self.route(r)).tobytes() for r in range(self.num_routes))
+        return self._hash(array('i', offsets).tobytes(), chunks)
+
+    def nodes_at(self, routes, steps):
+        """Ids das estruturas nas posições (via, etapa) indicadas, avançando todas as vias juntas no DAG."""
+        steps = np.asarray(steps)
+        vertices = np.asarray(self.route_heads)[routes]
+        following = np.asarray(self.vertex_next)
+        for i in range(int(steps.max(initial=0))):
+            moving = steps > i
+            vertices[moving] = following[vertices[moving]]
+        return np.asarray(self.vertex_node)[vertices]
+
+    def routes_containing(self, node_id):
+        """Retorna os ids das rotas que passam pelo nó, percorrendo todas (o DAG não guarda esse mapa)."""
+        return [r for r in range(self.num_routes) if node_id in self.route(r)]
+
+
+class OrgansView(Mapping):
+    """Mapeamento somente leitura que materializa ``organs[key]`` sob demanda a partir do DAG (ou do índice)."""
+
+    def __init__(self, dag):
+        self._dag = dag
+
+    def __getitem__(self, organ_key):
+        dag = self._dag
+        o = dag.organ_keys.index(organ_key) if organ_key in dag.organ_keys else -1
+        if o < 0:
+            raise KeyError(organ_key)
+        return {
+            'nome': dag.organ_names[o],
+            'rotas': [
+                {'Rota': dag.route_names[r], 'Trajeto': dag.trajeto(r)}
+                for r in range(dag.organ_route_offsets[o], dag.organ_route_offsets[o + 1])
+            ],
+        }
+
+    def __iter__(self):
+        return iter(self._dag.organ_keys)
+
+    def __len__(self):
+        return len(self._dag.organ_keys)
+
+
+def compile_dag(organs):
+    """Funde todas as rotas em um ``SharedTrunkDag`` com sufixos compartilhados."""
+    node_ids = {}
+    node_names = []
+    organ_keys = []
+    organ_names = []
+    organ_route_offsets = [0]
+    route_names = []
+    route_heads = []
+    vertex_ids = {}
+    vertex_node = []
+    vertex_next = []
+
+    for organ_key, organ in organs.items():
+        organ_keys.append(organ_key)
+        organ_names.append(organ['nome'])
+        for rota in organ['rotas']:
+            # Ids das estruturas na ordem de leitura, como em compile_index
+            for etapa in rota['Trajeto']:
+                if etapa not in node_ids:
+                    node_ids[etapa] = len(node_names)
+                    node_names.append(sys.intern(etapa))
+            # Constrói a rota de trás para frente para reaproveitar caudas já vistas
+            v = -1
+            for etapa in reversed(rota['Trajeto']):
+                n = node_ids[etapa]
+                key = (n, v)
+                if key not in vertex_ids:
+                    vertex_ids[key] = len(vertex_node)
+                    vertex_node.append(n)
+                    vertex_next.append(v)
+                v = vertex_ids[key]
+            route_heads.append(v)
+            route_names.append(rota['Rota'])
+        organ_route_offsets.append(len(route_heads))
+
+    return SharedTrunkDag(
+        node_names=tuple(node_names),
+        node_ids=MappingProxyType(node_ids),
+        organ_keys=tuple(organ_keys),
+        organ_names=tuple(organ_names),
+        organ_route_offsets=_frozen(organ_route_offsets),
+        route_names=tuple(route_names),
+        route_heads=_frozen(route_heads),
+        vertex_node=_frozen(vertex_node),
+        vertex_next=_frozen(vertex_next),
+    )
@@ -0,0 +1,408 @@
+"""Provas com formulários fixos, gerados em lote para a turma inteira.
+
+O professor gera de uma vez K formulários com semente, equilibrados: todos
+têm o mesmo número de perguntas de cada tipo, os órgãos aparecem em
+quantidades que diferem no máximo em uma pergunta e, dentro de cada órgão, as
+etapas do ``Trajeto`` são intercaladas. Os textos de cada formulário ficam
+gravados prontos para exibir (``forms.json``) e o gabarito fica em uma matriz
+``key.npy``; na hora da prova o app apenas lê esses arquivos, sem gerar nada.
+
+Cada aluno recebe um formulário pelo hash do seu código e tem as respostas
+gravadas em um arquivo próprio. No encerramento, todas as entregas são
+corrigidas de uma vez, comparando uma matriz (alunos × perguntas × estruturas)
+com o gabarito; as sequências recebem crédito parcial (``sequence_credits``).
+
+Uso:
+    python exams.py build --data data.json --out exams --id P1 --forms 4 --quiz 10 --clinical 3 --sequence 2
+    python exams.py grade --dir exams/P1
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+from dataset import load_dataset
+from questions import (
+    CLINICAL_CASE, QUICK_QUIZ, SEQUENCE, eligible_questions, generate_for_items, question_payload, sequence_credits
+)
+
+EXAM_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+FORMS_FILE = "forms.json"
+KEY_FILE = "key.npy"
+SUBMISSIONS_DIR = "submissions"
+RESULTS_FILE = "results.csv"
+
+EXAM_KINDS = (QUICK_QUIZ, CLINICAL_CASE, SEQUENCE)
+
+# Tolerância (s) para entregas após o fim do tempo, por atraso de rede
+LATE_GRACE = 30
+
+# Marcadores da matriz de respostas: posição sem estrutura e pergunta em branco
+PAD = -1
+BLANK = -2
+
+
+class ExamClosedError(ValueError):
+    """A prova já foi encerrada e corrigida."""
+
+
+class ExamStartedError(ValueError):
+    """O aluno já iniciou esta prova (em outra sessão ou dispositivo)."""
+
+
+class InvalidStudentIdError(ValueError):
+    """Código de aluno vazio ou com caracteres que não podem ir para o nome do arquivo."""
+
+
+def valid_student_id(student_id):
+    return bool(student_id) and all(c.isalnum() or c in "-_" for c in student_id)
+
+
+def _safe_id(student_id):
+    """Nome do arquivo da entrega: o próprio código, que é recusado em vez de limpo.
+
+    Limpar o código juntaria alunos distintos (``a.b`` e ``ab``) na mesma entrega.
+    """
+    if not valid_student_id(student_id):
+        raise InvalidStudentIdError("Código de aluno inválido: use apenas letras, números, '-' e '_'.")
+    return student_id
+
+
+def _write_json(path, data):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _create_json(path, data):
+    """Grava ``path`` de uma vez, só se ele ainda não existir (senão, ``FileExistsError``)."""
+    tmp = f"{path}.{os.getpid()}-{time.monotonic_ns()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    try:
+        os.link(tmp, path)
+    finally:
+        os.remove(tmp)
+
+
+# ============================================================================
+# GERAÇÃO DOS FORMULÁRIOS
+# ============================================================================
+
+def _organ_queues(index, eligible, rng):
+    """Fila embaralhada das perguntas elegíveis de cada órgão, com as etapas intercaladas."""
+    organs = np.asarray(index.route_organs)[eligible.routes]
+    queues = {}
+    for organ in np.unique(organs).tolist():
+        positions = rng.permutation(np.flatnonzero(organs == organ))
+        steps = eligible.steps[positions]
+        # A k-ésima pergunta de cada etapa vem antes da (k+1)-ésima de qualquer etapa
+        rank = np.zeros(len(positions), dtype=np.intp)
+        for step in np.unique(steps):
+            rank[steps == step] = np.arange(np.count_nonzero(steps == step))
+        queues[organ] = positions[np.argsort(rank, kind="stable")]
+    return queues
+
+
+def _quotas(order, sizes, n, shift):
+    """Perguntas de cada órgão em um formulário: divisão uniforme, com o resto em rodízio."""
+    m = len(order)
+    order = order[shift % m:] + order[:shift % m]
+    quotas = {organ: min(n // m + (i < n % m), sizes[organ]) for i, organ in enumerate(order)}
+    # Órgãos com poucas perguntas cedem a sobra aos demais
+    missing = n - sum(quotas.values())
+    while missing:
+        for organ in order:
+            if missing and quotas[organ] < sizes[organ]:
+                quotas[organ] += 1
+                missing -= 1
+    return quotas
+
+
+def balanced_items(index, kind, forms, n, rng):
+    """Posições do conjunto elegível de cada formulário, matriz (forms, n).
+
+    Os formulários consomem as filas dos órgãos em sequência, então só repetem
+    uma pergunta (com outras alternativas) depois de esgotar as demais.
+    """
+    eligible = eligible_questions(index, kind)
+    if n > len(eligible):
+        raise ValueError(f"O conjunto de dados permite no máximo {len(eligible)} perguntas do tipo '{kind}' por formulário.")
+    queues = _organ_queues(index, eligible, rng)
+    order = [int(o) for o in rng.permutation(list(queues))]
+    sizes = {organ: len(queue) for organ, queue in queues.items()}
+    cursors = dict.fromkeys(queues, 0)
+
+    items = np.empty((forms, n), dtype=np.intp)
+    for form in range(forms):
+        row = []
+        for organ, quota in _quotas(order, sizes, n, form * n).items():
+            queue = queues[organ]
+            row.extend(queue[(cursors[organ] + np.arange(quota)) % len(queue)].tolist())
+            cursors[organ] += quota
+        items[form] = rng.permutation(row)
+    return items
+
+
+def _item(index, question):
+    """Pergunta pronta para exibir, sem a resposta: ela só existe no gabarito."""
+    payload = question_payload(index, question)
+    route = index.route(question.route_id)
+    item = {"kind": question.kind, "route": question.route_id, "step": question.step}
+    if question.kind == SEQUENCE:
+        item.update(organ=payload["organ"], route_name=payload["route"],
+                    options=payload["current_sequence"], option_ids=[route[i] for i in question.order])
+    else:
+        item.update(prompt=payload["prompt"], options=payload["options"], option_ids=list(question.options))
+    return item
+
+
+def _key_row(index, question, width):
+    row = np.full(width, PAD, dtype=np.int32)
+    if question.kind == SEQUENCE:
+        route = index.route(question.route_id)
+        row[:len(route)] = route
+    else:
+        row[0] = question.answer
+    return row
+
+
+def build_exam(index, out_dir, exam_id, forms=4, counts=None, minutes=60, seed=0, title=""):
+    """Gera os formulários da prova em ``out_dir/exam_id`` e retorna o manifesto gravado."""
+    counts = {QUICK_QUIZ: 10, CLINICAL_CASE: 3, SEQUENCE: 2} if counts is None else counts
+    rng = np.random.default_rng(seed)
+    questions = [[] for _ in range(forms)]
+    for kind in EXAM_KINDS:
+        if not counts.get(kind):
+            continue
+        items = balanced_items(index, kind, forms, counts[kind], rng)
+        for form in range(forms):
+            questions[form].extend(generate_for_items(index, kind, items[form], seed=int(rng.integers(2 ** 32))))
+    if not questions[0]:
+        raise ValueError("A prova precisa de pelo menos uma pergunta.")
+
+    width = max(len(index.route(q.route_id)) if q.kind == SEQUENCE else 1 for form in questions for q in form)
+    key = np.stack([np.stack([_key_row(index, q, width) for q in form]) for form in questions])
+    payloads = [[_item(index, q) for q in form] for form in questions]
+
+    directory = os.path.join(out_dir, exam_id)
+    os.makedirs(os.path.join(directory, SUBMISSIONS_DIR), exist_ok=True)
+    np.save(os.path.join(directory, KEY_FILE), key)
+    _write_json(os.path.join(directory, FORMS_FILE), payloads)
+    manifest = {
+        "format_version": EXAM_FORMAT_VERSION,
+        "id": exam_id,
+        "title": title or exam_id,
+        "fingerprint": index.fingerprint,
+        "forms": forms,
+        "counts": {kind: counts.get(kind, 0) for kind in EXAM_KINDS},
+        "minutes": minutes,
+        "seed": seed,
+        "created": time.time(),
+    }
+    # O manifesto vai por último: uma prova sem ele está incompleta
+    _write_json(os.path.join(directory, MANIFEST_FILE), manifest)
+    return manifest
+
+
+# ============================================================================
+# APLICAÇÃO E CORREÇÃO
+# ============================================================================
+
+class Exam:
+    """Prova gravada: formulários prontos, gabarito e entregas dos alunos."""
+
+    def __init__(self, directory, manifest, forms, key):
+        self.directory = directory
+        self.manifest = manifest
+        self.forms = forms
+        self.key = key
+
+    @classmethod
+    def open(cls, directory):
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != EXAM_FORMAT_VERSION:
+            raise ValueError(f"Versão de prova não suportada: {manifest.get('format_version')}")
+        with open(os.path.join(directory, FORMS_FILE), encoding="utf-8") as f:
+            forms = json.load(f)
+        return cls(directory, manifest, forms, np.load(os.path.join(directory, KEY_FILE), mmap_mode="r"))
+
+    @property
+    def closed(self):
+        return os.path.exists(os.path.join(self.directory, RESULTS_FILE))
+
+    @property
+    def duration(self):
+        return self.manifest["minutes"] * 60
+
+    def form_of(self, student_id):
+        """Formulário do aluno, fixo para o mesmo código."""
+        digest = hashlib.sha256(f"{self.manifest['id']}:{student_id}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") % self.manifest["forms"]
+
+    def _path(self, student_id):
+        return os.path.join(self.directory, SUBMISSIONS_DIR, f"{_safe_id(student_id)}.json")
+
+    def submission(self, student_id):
+        try:
+            with open(self._path(student_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def start(self, student_id, now=None):
+        """Registra o início da prova do aluno e retorna sua entrega; um segundo início é recusado."""
+        if self.closed:
+            raise ExamClosedError("A prova já foi encerrada.")
+        record = {"student": student_id, "form": self.form_of(student_id),
+                  "started": time.time() if now is None else now, "submitted": None, "answers": None}
+        try:
+            _create_json(self._path(student_id), record)
+        except FileExistsError:
+            raise ExamStartedError(f"A prova já foi iniciada com o código {student_id}.") from None
+        return record
+
+    def submit(self, student_id, answers, now=None):
+        """Grava as respostas: por pergunta, o id escolhido ou os ids na ordem do aluno (None em branco)."""
+        if self.closed:
+            raise ExamClosedError("A prova já foi encerrada.")
+        record = self.submission(student_id) or self.start(student_id, now)
+        if record["submitted"] is not None:
+            return record
+        form = self.forms[record["form"]]
+        if len(answers) != len(form):
+            raise ValueError(f"A prova tem {len(form)} perguntas.")
+        record["answers"] = [None if a is None else [int(a)] if isinstance(a, (int, np.integer)) else [int(n) for n in a]
+                             for a in answers]
+        record["submitted"] = time.time() if now is None else now
+        _write_json(self._path(student_id), record)
+        return record
+
+    def submissions(self):
+        directory = os.path.join(self.directory, SUBMISSIONS_DIR)
+        records = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".json"):
+                record = self.submission(name[:-5])
+                if record is not None:
+                    records.append(record)
+        return records
+
+
+def answer_matrix(exam, records):
+    """Respostas de todos os alunos como matriz (alunos, perguntas, estruturas) no formato do gabarito."""
+    _, num_items, width = exam.key.shape
+    answers = np.full((len(records), num_items, width), PAD, dtype=np.int32)
+    for s, record in enumerate(records):
+        for i, answer in enumerate(record["answers"] or [None] * num_items):
+            if answer is None or len(answer) > width:
+                answers[s, i, 0] = BLANK
+            else:
+                answers[s, i, :len(answer)] = answer
+    return answers
+
+
+def grade_exam(exam, records=None):
+    """Corrige todas as entregas de uma vez.
+
+    Retorna (registros, formulários, acertos, créditos), com acertos e
+    créditos (de 0 a 1) em matrizes (alunos, perguntas).
+    """
+    records = exam.submissions() if records is None else records
+    forms = np.array([r["form"] for r in records], dtype=np.intp)
+    answers, key = answer_matrix(exam, records), exam.key[forms]
+    correct = (answers == key).all(axis=2)
+    credit = correct.astype(float)
+
+    # Sequências: posição correta de cada estrutura escolhida, e crédito pela maior subsequência crescente
+    is_sequence = np.array([[item["kind"] == SEQUENCE for item in form] for form in exam.forms])[forms]
+    if is_sequence.any():
+        chosen, expected = answers[is_sequence], key[is_sequence]
+        match = (chosen[:, :, None] == expected[:, None, :]) & (expected[:, None, :] != PAD)
+        positions = np.where(match.any(axis=2), match.argmax(axis=2), -1)
+        credit[is_sequence] = sequence_credits(positions, (expected != PAD).sum(axis=1))
+    return records, forms, correct, credit
+
+
+def close_exam(exam):
+    """Encerra a prova, grava ``results.csv`` e retorna as linhas gravadas."""
+    records, forms, correct, credit = grade_exam(exam)
+    scores, points = correct.sum(axis=1), credit.sum(axis=1)
+    total = correct.shape[1]
+    rows = []
+    for record, form, score, point in zip(records, forms.tolist(), scores.tolist(), points.tolist()):
+        submitted = record["submitted"]
+        late = submitted is not None and submitted - record["started"] > exam.duration + LATE_GRACE
+        rows.append({
+            "aluno": record["student"],
+            "formulario": form + 1,
+            "acertos": score,
+            "pontos": round(point, 2),
+            "total": total,
+            "nota": round(10 * point / total, 2),
+            "entregue": submitted is not None,
+            "fora_do_prazo": late,
+        })
+    path = os.path.join(exam.directory, RESULTS_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["aluno", "formulario", "acertos", "pontos", "total", "nota", "entregue", "fora_do_prazo"])
+        writer.writeheader()
+        writer.writerows(rows)
+    os.replace(f"{path}.tmp", path)
+    return rows
+
+
+def list_exams(out_dir):
+    """Identificadores das provas completas no diretório."""
+    try:
+        names = sorted(os.listdir(out_dir))
+    except OSError:
+        return []
+    return [name for name in names if os.path.exists(os.path.join(out_dir, name, MANIFEST_FILE))]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera e corrige provas de drenagem linfática.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Gera os formulários da prova.")
+    build.add_argument("--data", default="data.json", help="Arquivo JSON com os órgãos.")
+    build.add_argument("--out", default="exams", help="Diretório das provas.")
+    build.add_argument("--id", required=True, help="Identificador da prova (usado em ?prova=).")
+    build.add_argument("--title", default="")
+    build.add_argument("--forms", type=int, default=4, help="Número de formulários diferentes.")
+    build.add_argument("--quiz", type=int, default=10)
+    build.add_argument("--clinical", type=int, default=3)
+    build.add_argument("--sequence", type=int, default=2)
+    build.add_argument("--minutes", type=int, default=60, help="Duração da prova para cada aluno.")
+    build.add_argument("--seed", type=int, default=0)
+    grade = subparsers.add_parser("grade", help="Encerra a prova e corrige todas as entregas.")
+    grade.add_argument("--dir", required=True, help="Diretório da prova.")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        index = load_dataset(args.data).index
+        counts = {QUICK_QUIZ: args.quiz, CLINICAL_CASE: args.clinical, SEQUENCE: args.sequence}
+        try:
+            manifest = build_exam(index, args.out, args.id, forms=args.forms, counts=counts,
+                                  minutes=args.minutes, seed=args.seed, title=args.title)
+        except ValueError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"{manifest['forms']} formulários de {sum(manifest['counts'].values())} perguntas "
+              f"em {os.path.join(args.out, args.id)}")
+    else:
+        rows = close_exam(Exam.open(args.dir))
+        delivered = [r for r in rows if r["entregue"]]
+        print(f"{len(delivered)} entregas corrigidas de {len(rows)} alunos; resultados em "
+              f"{os.path.join(args.dir, RESULTS_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
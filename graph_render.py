@@ -0,0 +1,294 @@
+"""Construção e cache dos fluxogramas Graphviz das vias de drenagem.
+
+O layout do Graphviz (``splines='ortho'``) é a etapa mais cara de um rerun;
+aqui ele é executado uma única vez por (órgão, via, estilo) e o SVG
+resultante fica em um cache LRU compartilhado pelo processo. Com um
+diretório compartilhado, o SVG também é gravado em disco e os outros
+processos do servidor o leem de lá em vez de refazer o layout.
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+
+# Atributos de layout por estilo de fluxograma
+GRAPH_STYLES = {
+    "vertical": {"rankdir": "TB", "splines": "ortho", "nodesep": "0.5", "ranksep": "0.8"},
+    "horizontal": {"rankdir": "LR", "splines": "ortho", "nodesep": "0.4", "ranksep": "0.6"},
+}
+DEFAULT_STYLE = "vertical"
+
+
+@dataclass(frozen=True)
+class RenderedGraph:
+    """Fluxograma pronto para exibição: SVG já com layout ou, em último caso, o DOT."""
+    kind: str  # "svg" ou "dot"
+    content: str
+
+
+def build_route_graph(caminho, style=DEFAULT_STYLE):
+    """Monta o ``graphviz.Digraph`` de um trajeto com as cores de origem/destino."""
+    import graphviz  # adiado: só quem abre um fluxograma paga a importação
+
+    graph = graphviz.Digraph()
+    graph.attr('node', shape='box', style='rounded,filled', fontname='Arial', fontsize='11')
+    graph.attr('edge', color='#475569', penwidth='2', arrowsize='0.8')
+    graph.attr(**GRAPH_STYLES[style])
+
+    # Cores diferentes para diferentes tipos de nós
+    for i, etapa in enumerate(caminho):
+        if i == 0:
+            # Primeiro nó (origem) - azul
+            graph.node(str(i), etapa, fillcolor='#dbeafe', color='#1e40af', fontcolor='#1e3a8a', penwidth='3')
+        elif i == len(caminho) - 1:
+            # Último nó (destino final) - verde
+            graph.node(str(i), etapa, fillcolor='#d1fae5', color='#059669', fontcolor='#065f46', penwidth='3')
+        else:
+            # Nós intermediários - cinza claro
+            graph.node(str(i), etapa, fillcolor='#f1f5f9', color='#64748b', fontcolor='#334155')
+
+        if i > 0:
+            graph.edge(str(i - 1), str(i))
+
+    return graph
+
+
+@lru_cache(maxsize=None)
+def _dot_binary():
+    """Localiza o executável ``dot`` uma única vez por processo."""
+    return shutil.which("dot")
+
+
+def layout_image(source, fmt, timeout):
+    """Executa o layout do DOT no formato ``fmt`` (svg, png...) e retorna os bytes, ou None se o ``dot`` estiver ausente ou lento."""
+    dot = _dot_binary()
+    if dot is None:
+        return None
+    try:
+        proc = subprocess.run([dot, f"-T{fmt}"], input=source.encode("utf-8"),
+                              capture_output=True, timeout=timeout, check=True)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return proc.stdout
+
+
+def layout_svg(source, timeout):
+    """Executa o layout do DOT e retorna o SVG, ou None se o ``dot`` estiver ausente ou lento."""
+    svg = layout_image(source, "svg", timeout)
+    return None if svg is None else svg.decode("utf-8")
+
+
+def render_graph(graph, timeout):
+    """Converte um Digraph em ``RenderedGraph``, recorrendo ao DOT quando não há SVG."""
+    svg = layout_svg(graph.source, timeout)
+    if svg is None:
+        return RenderedGraph("dot", graph.source)
+    return RenderedGraph("svg", svg)
+
+
+class RenderCache:
+    """Cache LRU limitado de fluxogramas renderizados, seguro entre threads.
+
+    Com ``shared_dir``, as faltas consultam primeiro os SVGs já gravados
+    por qualquer processo, identificados pelo hash do DOT.
+    """
+
+    def __init__(self, maxsize=256, timeout=5.0, shared_dir=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.shared_dir = shared_dir
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, build):
+        """Retorna o fluxograma da chave, executando ``build()`` e o layout apenas em caso de falta."""
+        with self._lock:
+            rendered = self._items.get(key)
+            if rendered is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return rendered
+            self.misses += 1
+
+        # O layout roda fora do lock para não bloquear outras sessões
+        graph = build()
+        rendered = self._load_shared(graph.source) if self.shared_dir else None
+        if rendered is None:
+            rendered = render_graph(graph, self.timeout)
+            if self.shared_dir and rendered.kind == "svg":
+                self._store_shared(graph.source, rendered)
+        with self._lock:
+            self._items[key] = rendered
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+        return rendered
+
+    def _shared_path(self, source):
+        return os.path.join(self.shared_dir, hashlib.sha256(source.encode("utf-8")).hexdigest()[:32] + ".svg")
+
+    def _load_shared(self, source):
+        try:
+            with open(self._shared_path(source), "r", encoding="utf-8") as f:
+                svg = f.read()
+        except OSError:
+            return None
+        self.shared_hits += 1
+        return RenderedGraph("svg", svg)
+
+    def _store_shared(self, source, rendered):
+        """Grava o SVG de forma atômica; uma falha de disco só faz o layout ser refeito depois."""
+        path = self._shared_path(source)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.shared_dir, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(rendered.content)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _warm_items(self, index, styles):
+        """(chave, build) de todas as vias do índice e dos grafos unificados."""
+        for organ_key in index.organ_keys:
+            for rota_index, route_id in enumerate(index.organ_routes(organ_key)):
+                for style in styles:
+                    caminho = index.trajeto(route_id)
+                    yield (organ_key, rota_index, style), lambda c=caminho, s=style: build_route_graph(c, s)
+        # Grafos unificados por órgão e do abdome completo
+        for style in styles:
+            for organ_key in index.organ_keys:
+                yield ("merged", organ_key, style), lambda k=organ_key, s=style: build_merged_graph(index, (k,), s)
+            yield ("merged", "*", style), lambda s=style: build_merged_graph(index, index.organ_keys, s)
+
+    def warm(self, index, styles=(DEFAULT_STYLE,)):
+        """Pré-renderiza todas as vias do índice e os grafos unificados."""
+        for key, build in self._warm_items(index, styles):
+            self.get(key, build)
+
+    def warm_shared(self, index, styles=(DEFAULT_STYLE,)):
+        """Grava no diretório compartilhado os SVGs que faltam, sem ocupar o LRU deste processo."""
+        for _, build in self._warm_items(index, styles):
+            graph = build()
+            if not os.path.exists(self._shared_path(graph.source)):
+                rendered = render_graph(graph, self.timeout)
+                if rendered.kind == "svg":
+                    self._store_shared(graph.source, rendered)
+
+
+# ============================================================================
+# GRAFO UNIFICADO (ÓRGÃO COMPLETO / ABDOME COMPLETO)
+# ============================================================================
+
+HIGHLIGHT_COLOR = '#dc2626'
+
+
+def merged_scope(index, organ_keys):
+    """Retorna (rotas, nós, arestas) do subgrafo formado pelas vias dos órgãos."""
+    route_ids = [r for k in organ_keys for r in index.organ_routes(k)]
+    nodes = {}
+    edges = {}
+    for route_id in route_ids:
+        route = index.route(route_id)
+        for n in route:
+            nodes[n] = None
+        for a, b in zip(route, route[1:]):
+            edges[(a, b)] = None
+    return route_ids, list(nodes), list(edges)
+
+
+def build_merged_graph(index, organ_keys, style=DEFAULT_STYLE):
+    """Monta um único Digraph com todas as vias dos órgãos, fundindo as estruturas comuns.
+
+    Nós e arestas recebem ids estáveis (``n<id>`` e ``e<a>_<b>``) para que o
+    destaque seja aplicado depois sobre o layout em cache.
+    """
+    route_ids, nodes, edges = merged_scope(index, organ_keys)
+    origins = {index.route(r)[0] for r in route_ids}
+    has_successor = {a for a, _ in edges}
+
+    import graphviz
+    graph = graphviz.Digraph(strict=True)
+    graph.attr('node', shape='box', style='rounded,filled', fontname='Arial', fontsize='11')
+    graph.attr('edge', color='#475569', penwidth='2', arrowsize='0.8')
+    graph.attr(**GRAPH_STYLES[style])
+
+    for n in nodes:
+        if n in origins:
+            colors = dict(fillcolor='#dbeafe', color='#1e40af', fontcolor='#1e3a8a', penwidth='3')
+        elif n not in has_successor:
+            colors = dict(fillcolor='#d1fae5', color='#059669', fontcolor='#065f46', penwidth='3')
+        else:
+            colors = dict(fillcolor='#f1f5f9', color='#64748b', fontcolor='#334155')
+        graph.node(f"n{n}", index.node_names[n], id=f"n{n}", **colors)
+    for a, b in edges:
+        graph.edge(f"n{a}", f"n{b}", id=f"e{a}_{b}")
+
+    return graph
+
+
+def highlight_for_route(index, route_id):
+    """Conjuntos (nós, arestas) a destacar para uma via."""
+    route = index.route(route_id)
+    return set(route), set(zip(route, route[1:]))
+
+
+def highlight_for_node(node_id, edges):
+    """Conjuntos (nós, arestas) a destacar para uma estrutura e suas conexões diretas."""
+    touching = {(a, b) for a, b in edges if node_id in (a, b)}
+    return {node_id} | {n for e in touching for n in e}, touching
+
+
+def _css_rule(selectors, suffix, declarations):
+    """Monta uma regra CSS aplicando o sufixo a cada seletor."""
+    return f"{', '.join(s + suffix for s in selectors)} {{ {declarations} }} "
+
+
+def highlight_svg(svg, nodes, edges):
+    """Restiliza um SVG já com layout, sem executar o Graphviz novamente.
+
+    Injeta uma folha de estilo logo após a tag ``<svg>`` que esmaece todo o
+    grafo e realça os ids selecionados.
+    """
+    start = svg.find('<svg')
+    if start < 0 or (not nodes and not edges):
+        return svg
+    node_sel = [f"#n{n}" for n in nodes]
+    edge_sel = [f"#e{a}_{b}" for a, b in edges]
+    css = ".node, .edge { opacity: 0.3; } " + _css_rule(node_sel + edge_sel, "", "opacity: 1;")
+    if node_sel:
+        css += _css_rule(node_sel, " path", f"stroke: {HIGHLIGHT_COLOR}; stroke-width: 4;")
+        css += _css_rule(node_sel, " polygon", f"stroke: {HIGHLIGHT_COLOR}; stroke-width: 4;")
+    if edge_sel:
+        css += _css_rule(edge_sel, " path", f"stroke: {HIGHLIGHT_COLOR}; stroke-width: 3;")
+        css += _css_rule(edge_sel, " polygon", f"stroke: {HIGHLIGHT_COLOR}; fill: {HIGHLIGHT_COLOR};")
+    insert_at = svg.index('>', start) + 1
+    return f"{svg[:insert_at]}<style>{css}</style>{svg[insert_at:]}"
+
+
+def highlight_dot(source, nodes, edges):
+    """Aplica o destaque ao DOT em cache acrescentando atributos (grafo ``strict``)."""
+    if not nodes and not edges:
+        return source
+    extra = [f'\tn{n} [color="{HIGHLIGHT_COLOR}" penwidth=4]' for n in nodes]
+    extra += [f'\tn{a} -> n{b} [color="{HIGHLIGHT_COLOR}" penwidth=3]' for a, b in edges]
+    end = source.rstrip().rfind('}')
+    return source[:end] + '\n'.join(extra) + '\n}\n'
+
+
+def highlight_rendered(rendered, nodes, edges):
+    """Aplica o destaque a um ``RenderedGraph`` em cache, preservando o seu layout."""
+    if rendered.kind == "svg":
+        return RenderedGraph("svg", highlight_svg(rendered.content, nodes, edges))
+    return RenderedGraph("dot", highlight_dot(rendered.content, nodes, edges))
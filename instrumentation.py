@@ -0,0 +1,178 @@
+"""Medições de desempenho dos reruns do app.
+
+Os acumuladores são compartilhados pelo processo (via ``st.cache_resource``
+no app) e não dependem do Streamlit.
+"""
+
+import functools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class RerunTimings:
+    """Acumula a duração dos reruns por modo de navegação e por seção."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(lambda: [0, 0.0])
+
+    def record(self, nav_mode, section, seconds):
+        """Registra a duração de um rerun."""
+        with self._lock:
+            for key in ((nav_mode, None), (nav_mode, section)):
+                entry = self._totals[key]
+                entry[0] += 1
+                entry[1] += seconds
+
+    def mean(self, nav_mode, section=None):
+        """Duração média (s) dos reruns registrados, ou None se não houver."""
+        with self._lock:
+            count, total = self._totals.get((nav_mode, section), (0, 0.0))
+        return total / count if count else None
+
+    def count(self, nav_mode, section=None):
+        with self._lock:
+            return self._totals.get((nav_mode, section), (0, 0.0))[0]
+
+    def savings(self, baseline="tabs", candidate="lazy"):
+        """Fração do tempo médio de rerun economizada pelo modo candidato."""
+        base = self.mean(baseline)
+        cand = self.mean(candidate)
+        if not base or cand is None:
+            return None
+        return 1 - cand / base
+
+
+class Profiler:
+    """Tempos por função e contadores nomeados, exportáveis no formato texto do Prometheus."""
+
+    # Limites (s) dos buckets dos histogramas de duração
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+    def __init__(self, prefix="drenagem"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._timings = {}                 # nome -> [contagem, soma, máximo, buckets...]
+        self._counters = defaultdict(int)  # (nome, rótulo) -> valor
+
+    def observe(self, name, seconds):
+        """Registra uma duração no histograma ``name``."""
+        with self._lock:
+            entry = self._timings.get(name)
+            if entry is None:
+                entry = self._timings[name] = [0, 0.0, 0.0] + [0] * len(self.BUCKETS)
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    entry[3 + i] += 1
+                    break
+
+    @contextmanager
+    def measure(self, name):
+        """Cronometra o bloco ``with``."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def timed(self, name=None):
+        """Decorador que cronometra cada chamada da função."""
+        def decorator(func):
+            label = name or func.__name__
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.measure(label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def count(self, name, label="", amount=1):
+        """Soma ``amount`` ao contador (``name``, ``label``)."""
+        with self._lock:
+            self._counters[(name, label)] += amount
+
+    def timings(self):
+        """{nome: (contagem, total s, máximo s)}, ordenado pelo tempo total."""
+        with self._lock:
+            items = [(name, tuple(entry[:3])) for name, entry in self._timings.items()]
+        return dict(sorted(items, key=lambda item: -item[1][1]))
+
+    def counters(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def prometheus_text(self):
+        """Todas as métricas no formato de exposição em texto do Prometheus."""
+        with self._lock:
+            timings = {name: list(entry) for name, entry in self._timings.items()}
+            counters = dict(self._counters)
+
+        metric = f"{self.prefix}_duration_seconds"
+        lines = [f"# HELP {metric} Duração das funções instrumentadas.", f"# TYPE {metric} histogram"]
+        for name, entry in sorted(timings.items()):
+            cumulative = 0
+            for bound, hits in zip(self.BUCKETS, entry[3:]):
+                cumulative += hits
+                lines.append(f'{metric}_bucket{{name="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{name="{name}",le="+Inf"}} {entry[0]}')
+            lines.append(f'{metric}_sum{{name="{name}"}} {entry[1]:.6f}')
+            lines.append(f'{metric}_count{{name="{name}"}} {entry[0]}')
+
+        for counter in sorted({name for name, _ in counters}):
+            metric = f"{self.prefix}_{counter}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for (name, label), value in sorted(counters.items()):
+                if name == counter:
+                    labels = f'{{label="{label}"}}' if label else ""
+                    lines.append(f"{metric}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def count_item_access(cls, profiler, name):
+    """Conta leituras e escritas por ``[]`` (e, por consequência, por atributo) nas instâncias de ``cls``."""
+    getitem, setitem, delitem = cls.__getitem__, cls.__setitem__, cls.__delitem__
+
+    def counted_getitem(self, key):
+        profiler.count(name, "read")
+        return getitem(self, key)
+
+    def counted_setitem(self, key, value):
+        profiler.count(name, "write")
+        setitem(self, key, value)
+
+    def counted_delitem(self, key):
+        profiler.count(name, "delete")
+        delitem(self, key)
+
+    cls.__getitem__, cls.__setitem__, cls.__delitem__ = counted_getitem, counted_setitem, counted_delitem
+
+
+def start_metrics_server(profiler, host="127.0.0.1", port=9464):
+    """Serve ``/metrics`` em texto do Prometheus a partir de uma thread em segundo plano."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = profiler.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,153 @@
+"""Persistência do progresso dos alunos com gravação em lote (write-behind).
+
+As respostas apenas atualizam um buffer em memória; uma thread em segundo
+plano grava os instantâneos acumulados em lote no SQLite (ou, se o SQLite não
+estiver disponível, em arquivos JSON), de modo que a interface nunca espera
+pelo disco.
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+from background import guarded_step
+
+try:
+    import sqlite3
+except ImportError:  # Python compilado sem SQLite
+    sqlite3 = None
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteProgressStore:
+    """Progresso dos alunos em uma tabela SQLite (um JSON por aluno)."""
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS progress ("
+                "student_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+
+    def load(self, student_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM progress WHERE student_id = ?", (student_id,)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, snapshots):
+        now = time.time()
+        rows = [(sid, json.dumps(data), now) for sid, data in snapshots.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO progress (student_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(student_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                rows
+            )
+
+
+class FileProgressStore:
+    """Progresso dos alunos em arquivos JSON, um por aluno, gravados de forma atômica."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, student_id):
+        safe = "".join(c for c in student_id if c.isalnum() or c in "-_")
+        return os.path.join(self.directory, f"{safe}.json")
+
+    def load(self, student_id):
+        try:
+            with open(self._path(student_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_many(self, snapshots):
+        for student_id, data in snapshots.items():
+            path = self._path(student_id)
+            tmp = f"{path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+
+
+def open_progress_store(path):
+    """Abre o SQLite em ``path``; se não for possível, usa arquivos JSON em ``path + '.d'``."""
+    if sqlite3 is not None:
+        try:
+            return SQLiteProgressStore(path)
+        except sqlite3.Error:
+            pass
+    return FileProgressStore(f"{path}.d")
+
+
+class WriteBehindWriter:
+    """Agrupa instantâneos de progresso e os grava em lote em uma thread própria.
+
+    Instantâneos do mesmo aluno que chegam antes da gravação são fundidos:
+    apenas o mais recente vai para o disco. ``failures`` conta as gravações
+    em lote que falharam (os instantâneos voltam ao buffer).
+    """
+
+    def __init__(self, store, flush_interval=2.0, max_batch=500):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.failures = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="progress-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def put(self, student_id, snapshot):
+        """Enfileira o instantâneo do aluno sem tocar no disco."""
+        with self._lock:
+            self._pending[student_id] = snapshot
+            full = len(self._pending) >= self.max_batch
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        """Número de alunos com progresso ainda não gravado."""
+        with self._lock:
+            return len(self._pending)
+
+    def load(self, student_id):
+        """Lê o progresso do aluno, preferindo o instantâneo ainda não gravado."""
+        with self._lock:
+            if student_id in self._pending:
+                return self._pending[student_id]
+        return self.store.load(student_id)
+
+    def flush(self):
+        """Grava imediatamente tudo o que estiver pendente."""
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if batch:
+            try:
+                self.store.save_many(batch)
+            except Exception:
+                # Devolve ao buffer o que não foi gravado, sem sobrescrever dados mais novos
+                with self._lock:
+                    for student_id, snapshot in batch.items():
+                        self._pending.setdefault(student_id, snapshot)
+                raise
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            # Se falhar, os instantâneos voltam ao buffer para o próximo ciclo
+            guarded_step(self, self.flush, logger, "Falha ao gravar o progresso de %d alunos", self.pending())
@@ -0,0 +1,292 @@
+"""Banco de perguntas pré-compilado e mapeado em memória.
+
+Enumera offline todas as perguntas de quiz rápido (órgão, via, etapa), todos
+os casos clínicos de ``CASE_TEMPLATES`` e um conjunto fixo de embaralhamentos
+por via para o jogo de sequência, gravando tudo em arquivos ``.npy``. As
+perguntas com alternativas são gravadas uma vez por nível de dificuldade
+(``DIFFICULTY_TIERS``), e o sorteio escolhe o nível pedido pelo app. O app
+abre esses arquivos com ``mmap_mode='r'``: o sorteio custa o mesmo para
+qualquer tamanho de banco e vários processos compartilham as mesmas páginas.
+
+Uso:
+    python question_bank.py build --data data.json --out question_bank
+"""
+
+import argparse
+import json
+import os
+from itertools import product
+
+import numpy as np
+
+from dataset import load_dataset
+from questions import (
+    CLINICAL_CASE, NUM_DISTRACTORS, PATIENT_AGES, PATIENT_NAMES, PATIENT_SEXES,
+    QUICK_QUIZ, SEQUENCE, NoEligibleQuestionsError, Question, draw_options, eligible_questions
+)
+
+BANK_FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+TABLE_FILES = {
+    QUICK_QUIZ: "quiz.npy",
+    CLINICAL_CASE: "clinical.npy",
+    SEQUENCE: "sequence.npy",
+}
+
+NUM_OPTIONS = NUM_DISTRACTORS + 1
+
+# Níveis de dificuldade (fração de distratores próximos) gravados no banco
+DIFFICULTY_TIERS = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+# Cada registro guarda a probabilidade acumulada (cdf) para o sorteio ponderado
+# dentro do seu nível; as tabelas com alternativas são ordenadas por nível
+QUIZ_DTYPE = np.dtype([("cdf", "f8"), ("tier", "i1"), ("route", "i4"), ("step", "i2"), ("answer", "i4"),
+                       ("options", "i4", NUM_OPTIONS)])
+CLINICAL_DTYPE = np.dtype([("cdf", "f8"), ("tier", "i1"), ("route", "i4"), ("step", "i2"), ("answer", "i4"),
+                           ("options", "i4", NUM_OPTIONS), ("name", "i1"), ("age", "i1"), ("sex", "i1")])
+
+
+def _sequence_dtype(max_len):
+    return np.dtype([("cdf", "f8"), ("route", "i4"), ("length", "i2"), ("order", "i2", max_len)])
+
+
+# Tabela gravada para um tipo sem nenhuma pergunta elegível no conjunto de dados
+EMPTY_TABLES = {
+    QUICK_QUIZ: np.zeros(0, dtype=QUIZ_DTYPE),
+    CLINICAL_CASE: np.zeros(0, dtype=CLINICAL_DTYPE),
+    SEQUENCE: np.zeros(0, dtype=_sequence_dtype(1)),
+}
+
+
+def _pad_options(options):
+    """Completa as alternativas com -1 quando o grafo tem menos estruturas que o necessário."""
+    padded = np.full((len(options), NUM_OPTIONS), -1, dtype=np.int32)
+    padded[:, :options.shape[1]] = options
+    return padded
+
+
+def _cdf(weights):
+    cdf = np.cumsum(weights)
+    return cdf / cdf[-1]
+
+
+def _by_tier(build):
+    """Concatena a tabela montada por ``build(tier, difficulty)`` para cada nível de dificuldade."""
+    return np.concatenate([build(tier, difficulty) for tier, difficulty in enumerate(DIFFICULTY_TIERS)])
+
+
+def build_quiz_table(index, rng, variants):
+    """Todas as perguntas (via, etapa) do quiz, cada uma com ``variants`` conjuntos de distratores por nível."""
+    eligible = eligible_questions(index, QUICK_QUIZ)
+    routes, steps, p = eligible.routes, eligible.steps, eligible.p
+    routes, steps = np.repeat(routes, variants), np.repeat(steps, variants)
+    current, answers = index.nodes_at(routes, steps), index.nodes_at(routes, steps + 1)
+
+    def build(tier, difficulty):
+        table = np.zeros(len(routes), dtype=QUIZ_DTYPE)
+        table["cdf"], table["tier"] = _cdf(np.repeat(p, variants)), tier
+        table["route"], table["step"], table["answer"] = routes, steps, answers
+        table["options"] = _pad_options(draw_options(rng, index.num_nodes, answers, [current], index, difficulty))
+        return table
+    return _by_tier(build)
+
+
+def build_clinical_table(index, rng):
+    """Todos os casos clínicos: cada via elegível combinada com cada paciente possível, em cada nível."""
+    eligible = eligible_questions(index, CLINICAL_CASE)
+    routes, steps, p = eligible.routes, eligible.steps, eligible.p
+    patients = np.array(list(product(range(len(PATIENT_NAMES)),
+                                     range(PATIENT_AGES[0], PATIENT_AGES[1] + 1),
+                                     range(len(PATIENT_SEXES)))))
+    reps = len(patients)
+    routes, steps = np.repeat(routes, reps), np.repeat(steps, reps)
+    patients = np.tile(patients, (len(p), 1))
+    answers = index.nodes_at(routes, steps)
+
+    def build(tier, difficulty):
+        table = np.zeros(len(routes), dtype=CLINICAL_DTYPE)
+        table["cdf"], table["tier"] = _cdf(np.repeat(p, reps)), tier
+        table["route"], table["step"], table["answer"] = routes, steps, answers
+        table["options"] = _pad_options(draw_options(rng, index.num_nodes, answers, [], index, difficulty))
+        table["name"], table["age"], table["sex"] = patients.T
+        return table
+    return _by_tier(build)
+
+
+def build_sequence_table(index, rng, variants):
+    """``variants`` embaralhamentos (diferentes da ordem correta) para cada via."""
+    eligible = eligible_questions(index, SEQUENCE)
+    routes, p = eligible.routes, eligible.p
+    max_len = max(len(index.route(r)) for r in routes)
+    table = np.zeros(len(routes) * variants, dtype=_sequence_dtype(max_len))
+    table["cdf"] = _cdf(np.repeat(p, variants))
+    table["order"] = -1
+    for i, route_id in enumerate(np.repeat(routes, variants)):
+        length = len(index.route(route_id))
+        order = rng.permutation(length)
+        while (order == np.arange(length)).all():
+            order = rng.permutation(length)
+        table[i]["route"], table[i]["length"] = route_id, length
+        table[i]["order"][:length] = order
+    return table
+
+
+def _save_table(path, table):
+    """Grava a tabela num arquivo temporário e o troca de uma vez: quem já mapeou o antigo continua lendo-o."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, table)
+    os.replace(tmp_path, path)
+
+
+def build_bank(index, out_dir, variants=16, seed=0):
+    """Compila o banco completo no diretório e retorna o manifesto gravado.
+
+    Um tipo de pergunta sem itens elegíveis (por exemplo, casos clínicos num
+    conjunto sem órgãos de ``CASE_TEMPLATES``) é gravado como tabela vazia.
+    """
+    rng = np.random.default_rng(seed)
+    builders = {
+        QUICK_QUIZ: lambda: build_quiz_table(index, rng, variants),
+        CLINICAL_CASE: lambda: build_clinical_table(index, rng),
+        SEQUENCE: lambda: build_sequence_table(index, rng, variants),
+    }
+    tables = {}
+    for kind, build in builders.items():
+        try:
+            tables[kind] = build()
+        except NoEligibleQuestionsError:
+            tables[kind] = EMPTY_TABLES[kind]
+    os.makedirs(out_dir, exist_ok=True)
+    for kind, table in tables.items():
+        _save_table(os.path.join(out_dir, TABLE_FILES[kind]), table)
+
+    manifest = {
+        "format_version": BANK_FORMAT_VERSION,
+        "fingerprint": index.fingerprint,
+        "variants": variants,
+        "tiers": list(DIFFICULTY_TIERS),
+        "seed": seed,
+        "counts": {kind: len(table) for kind, table in tables.items()},
+    }
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return manifest
+
+
+def _draw_tiers(rng, difficulty, n):
+    """Sorteia n níveis entre os dois gravados mais próximos de ``difficulty``, pela proximidade."""
+    position = np.interp(difficulty, DIFFICULTY_TIERS, np.arange(len(DIFFICULTY_TIERS)))
+    lower = int(position)
+    return np.minimum(lower + (rng.random(n) < position - lower), len(DIFFICULTY_TIERS) - 1)
+
+
+class QuestionBank:
+    """Banco de perguntas aberto em modo somente leitura via mmap."""
+
+    def __init__(self, manifest, tables):
+        self.manifest = manifest
+        self.tables = tables
+
+    @classmethod
+    def open(cls, directory, index):
+        """Abre o banco, recusando-o se ele foi compilado a partir de outro conjunto de dados."""
+        with open(os.path.join(directory, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != BANK_FORMAT_VERSION:
+            raise ValueError(f"Versão de banco de perguntas não suportada: {manifest.get('format_version')}")
+        if manifest.get("fingerprint") != index.fingerprint:
+            raise ValueError("O banco de perguntas foi compilado a partir de outro conjunto de dados.")
+        tables = {
+            kind: np.load(os.path.join(directory, filename), mmap_mode="r")
+            for kind, filename in TABLE_FILES.items()
+        }
+        return cls(manifest, tables)
+
+    def __len__(self):
+        return sum(len(t) for t in self.tables.values())
+
+    def _tier_rows(self, kind, tier):
+        """Primeira e última+1 linha do nível ``tier`` (as tabelas são ordenadas por nível)."""
+        column = self.tables[kind]["tier"]
+        return int(np.searchsorted(column, tier, side="left")), int(np.searchsorted(column, tier, side="right"))
+
+    def sample(self, kind, n, seed=None, difficulty=0.0):
+        """Sorteia até n perguntas distintas por busca binária na cdf gravada.
+
+        Variantes da mesma pergunta (mesma via e etapa) contam como repetição.
+        Cada pergunta com alternativas vem de um dos dois níveis gravados mais
+        próximos de ``difficulty``, com chance proporcional à proximidade, de
+        modo que a fração esperada de distratores próximos acompanha o app.
+        Levanta ``NoEligibleQuestionsError`` se o banco não tiver perguntas do tipo.
+        """
+        table = self.tables[kind]
+        if not len(table):
+            raise NoEligibleQuestionsError(f"Nenhuma pergunta do tipo '{kind}' pode ser gerada com este conjunto de dados.")
+        rng = np.random.default_rng(seed)
+        u = rng.random(2 * n)
+        if kind == SEQUENCE:
+            draws = np.searchsorted(table["cdf"], u, side="right")
+            draws = np.minimum(draws, len(table) - 1)
+        else:
+            tiers = _draw_tiers(rng, difficulty, 2 * n)
+            draws = np.empty(2 * n, dtype=np.intp)
+            for tier in np.unique(tiers):
+                rows = tiers == tier
+                start, stop = self._tier_rows(kind, tier)
+                ranks = np.searchsorted(table["cdf"][start:stop], u[rows], side="right")
+                draws[rows] = start + np.minimum(ranks, stop - start - 1)
+        keys = table["route"][draws].astype(np.int64)
+        if kind != SEQUENCE:
+            keys = (keys << 16) | table["step"][draws]
+        _, first = np.unique(keys, return_index=True)
+        picks = draws[np.sort(first)][:n]
+        return [self._question(kind, table[i]) for i in picks]
+
+    def quiz_variant(self, item, seed=None, difficulty=0.0):
+        """Uma das variantes gravadas do item ``item`` do quiz (posição em ``eligible_questions``).
+
+        Usada quando o agendador já escolheu a pergunta: as ``variants`` linhas
+        de cada item ficam juntas, na ordem do conjunto elegível, em cada nível.
+        """
+        rng = np.random.default_rng(seed)
+        start, stop = self._tier_rows(QUICK_QUIZ, _draw_tiers(rng, difficulty, 1)[0])
+        variants = self.manifest["variants"]
+        row = start + item * variants + int(rng.integers(variants))
+        if row >= stop:
+            raise IndexError(f"Item {item} fora do banco de perguntas.")
+        return self._question(QUICK_QUIZ, self.tables[QUICK_QUIZ][row])
+
+    @staticmethod
+    def _question(kind, row):
+        if kind == SEQUENCE:
+            order = row["order"][:row["length"]]
+            return Question(kind, int(row["route"]), order=tuple(int(i) for i in order))
+        options = tuple(int(o) for o in row["options"] if o >= 0)
+        patient = (int(row["name"]), int(row["age"]), int(row["sex"])) if kind == CLINICAL_CASE else ()
+        return Question(kind, int(row["route"]), int(row["step"]), int(row["answer"]), options, patient=patient)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compila o banco de perguntas de drenagem linfática.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Enumera todas as perguntas e grava o banco.")
+    build.add_argument("--data", default="data.json", help="Arquivo JSON com os órgãos.")
+    build.add_argument("--out", default="question_bank", help="Diretório de saída.")
+    build.add_argument("--variants", type=int, default=16,
+                       help="Conjuntos de distratores por pergunta de quiz e embaralhamentos por via.")
+    build.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    index = load_dataset(args.data).index
+    manifest = build_bank(index, args.out, variants=args.variants, seed=args.seed)
+    for kind, count in manifest["counts"].items():
+        print(f"{kind}: {count} perguntas")
+    print(f"Banco gravado em {args.out}")
+
+
+if __name__ == "__main__":
+    main()
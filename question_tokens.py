@@ -0,0 +1,79 @@
+"""Tokens assinados que carregam uma pergunta, para corrigir sem sessão no servidor.
+
+O token guarda a ``Question`` compacta, o início do ``fingerprint`` do índice
+e o instante de emissão. O conteúdo é cifrado com um fluxo de chave
+HMAC-SHA256 em modo contador (o aluno não lê a resposta dentro do token) e
+autenticado com HMAC-SHA256 (o aluno não consegue alterá-lo). Qualquer
+processo com o mesmo segredo corrige o token, sem consultar nada além do
+índice.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+from questions import Question
+
+NONCE_BYTES = 12
+TAG_BYTES = 16
+
+
+class InvalidTokenError(ValueError):
+    """Token adulterado, malformado ou expirado."""
+
+
+class StaleTokenError(InvalidTokenError):
+    """Token válido, mas emitido para outra versão do conjunto de dados."""
+
+
+class QuestionTokens:
+    """Emite e abre tokens de perguntas com um segredo compartilhado pelos processos."""
+
+    def __init__(self, secret, max_age=24 * 3600):
+        secret = secret.encode("utf-8") if isinstance(secret, str) else secret
+        self._enc_key = hmac.new(secret, b"drenagem-token-enc", hashlib.sha256).digest()
+        self._mac_key = hmac.new(secret, b"drenagem-token-mac", hashlib.sha256).digest()
+        self.max_age = max_age
+
+    def _keystream(self, nonce, size):
+        blocks = (hmac.new(self._enc_key, nonce + i.to_bytes(4, "big"), hashlib.sha256).digest()
+                  for i in range((size + 31) // 32))
+        return b"".join(blocks)[:size]
+
+    def _xor(self, nonce, data):
+        stream = self._keystream(nonce, len(data))
+        return (int.from_bytes(data, "big") ^ int.from_bytes(stream, "big")).to_bytes(len(data), "big")
+
+    def _tag(self, data):
+        return hmac.new(self._mac_key, data, hashlib.sha256).digest()[:TAG_BYTES]
+
+    def encode(self, question, fingerprint, now=None):
+        """Token (texto base64 para URLs) da pergunta para o índice indicado."""
+        issued = int(time.time() if now is None else now)
+        plain = json.dumps([
+            question.kind, question.route_id, question.step, question.answer,
+            question.options, question.order, question.patient, fingerprint[:16], issued
+        ], separators=(",", ":")).encode("utf-8")
+        nonce = os.urandom(NONCE_BYTES)
+        data = nonce + self._xor(nonce, plain)
+        return base64.urlsafe_b64encode(data + self._tag(data)).rstrip(b"=").decode("ascii")
+
+    def decode(self, token, fingerprint, now=None):
+        """Pergunta contida no token; levanta ``InvalidTokenError`` se ele não puder ser usado."""
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except (ValueError, TypeError) as e:
+            raise InvalidTokenError("Token malformado.") from e
+        data, tag = raw[:-TAG_BYTES], raw[-TAG_BYTES:]
+        if len(data) <= NONCE_BYTES or not hmac.compare_digest(tag, self._tag(data)):
+            raise InvalidTokenError("Assinatura do token inválida.")
+        plain = self._xor(data[:NONCE_BYTES], data[NONCE_BYTES:])
+        kind, route_id, step, answer, options, order, patient, token_fingerprint, issued = json.loads(plain)
+        if token_fingerprint != fingerprint[:16]:
+            raise StaleTokenError("O token foi emitido para outra versão do conjunto de dados.")
+        if (time.time() if now is None else now) - issued > self.max_age:
+            raise InvalidTokenError("Token expirado.")
+        return Question(kind, route_id, step, answer, tuple(options), tuple(order), tuple(patient))
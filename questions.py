@@ -0,0 +1,480 @@
+"""Geração e correção de perguntas a partir do índice de drenagem.
+
+Módulo independente do Streamlit: as perguntas são registros compactos de
+inteiros (ids de rota, etapa e estruturas) produzidos em lotes por um gerador
+NumPy com semente, e só viram texto na hora de exibir. O app e a API HTTP
+(``api.py``) usam as mesmas funções para gerar, exibir e corrigir.
+"""
+
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import wraps
+
+import numpy as np
+
+# Tipos de pergunta
+QUICK_QUIZ = "quiz"
+CLINICAL_CASE = "clinical"
+SEQUENCE = "sequence"
+
+# Número de distratores por pergunta de múltipla escolha
+NUM_DISTRACTORS = 3
+
+# Dificuldade adaptativa: com acerto recente até ADAPTIVE_LOW os distratores
+# são uniformes; a partir de ADAPTIVE_HIGH, todos vêm das estruturas próximas
+ADAPTIVE_LOW = 0.5
+ADAPTIVE_HIGH = 0.9
+
+# Sorteios uniformes por distrator; repetições e exclusões são descartadas
+UNIFORM_DRAWS = 4
+
+# Quantas posições da lista de próximos um distrator pode pular ao ser embaralhado
+NEAR_JITTER = 3
+
+
+class NoEligibleQuestionsError(ValueError):
+    """O conjunto de dados não permite gerar nenhuma pergunta do tipo pedido."""
+
+CASE_TEMPLATES = {
+    "estomago": "Paciente {name}, {age} anos, sexo {sex}, apresenta quadro de dispepsia e perda ponderal progressiva. A endoscopia digestiva alta evidencia lesão vegetante na região da **{location}**. O exame anatomopatológico confirma adenocarcinoma gástrico. Considerando a drenagem linfática desta região, qual grupo de linfonodos será o primeiro a ser comprometido em caso de disseminação neoplásica?",
+
+    "intestino_grosso": "Paciente {name}, {age} anos, sexo {sex}, procura atendimento médico por alteração do hábito intestinal e hematoquezia. A colonoscopia identifica lesão tumoral no **{location}**. A biópsia confirma adenocarcinoma. Considerando que a linfa desta região passa inicialmente pelos linfonodos epicólicos e paracólicos, qual é o próximo grupo linfonodal na cadeia de drenagem?",
+
+    "pâncreas": "Paciente {name}, {age} anos, sexo {sex}, apresenta quadro de icterícia indolor progressiva e perda de peso. A tomografia computadorizada revela massa sólida na **{location}** do pâncreas. A biópsia guiada por ultrassom endoscópico confirma adenocarcinoma pancreático. Qual grupo de linfonodos constitui a primeira estação de drenagem linfática desta região?",
+
+    "figado": "Paciente {name}, {age} anos, sexo {sex}, portador de cirrose hepática por hepatite C, apresenta elevação de alfa-fetoproteína e lesão hepática suspeita. A investigação confirma carcinoma hepatocelular. Considerando a via de drenagem '{location}', qual grupo linfonodal deve ser avaliado prioritariamente no estadiamento?",
+
+    "rins": "Durante investigação de hematúria macroscópica em paciente {name}, {age} anos, sexo {sex}, a tomografia identifica massa renal sólida compatível com carcinoma de células renais. Qual é o principal grupo de linfonodos que recebe a drenagem linfática renal?",
+
+    "intestino_delgado": "Paciente {name}, {age} anos, sexo {sex}, apresenta quadro de dor abdominal intermitente e anemia ferropriva. A enterotomografia identifica lesão no **{location}**. A investigação confirma tumor neuroendócrino de intestino delgado. Qual é a primeira estação linfonodal de drenagem desta região?",
+
+    "baco": "Paciente {name}, {age} anos, sexo {sex}, vítima de traumatismo abdominal fechado de alta energia, apresenta lesão esplênica grau IV com necessidade de esplenectomia de urgência. Durante o procedimento cirúrgico, qual grupo de linfonodos regionais deve ser inspecionado, considerando a drenagem linfática esplênica?"
+}
+
+# Etapa do trajeto cobrada em cada caso clínico (padrão: primeira estação)
+CASE_ANSWER_STEP = {"intestino_grosso": 2}
+
+PATIENT_NAMES = ("João Silva", "Maria Santos", "José Oliveira", "Ana Costa", "Carlos Ferreira", "Paula Rodrigues")
+PATIENT_SEXES = ("masculino", "feminino")
+PATIENT_AGES = (45, 75)
+
+
+@dataclass(frozen=True)
+class Question:
+    """Pergunta compacta: apenas ids inteiros que referenciam o índice.
+
+    - ``step``: etapa do trajeto em que a linfa está (quiz) ou que é cobrada (caso clínico)
+    - ``options``: ids das estruturas oferecidas, já embaralhados
+    - ``order``: permutação das etapas exibida no jogo de sequência
+    - ``patient``: (nome, idade, sexo) do caso clínico
+    """
+    kind: str
+    route_id: int
+    step: int = 0
+    answer: int = -1
+    options: tuple = ()
+    order: tuple = ()
+    patient: tuple = ()
+
+
+def _eligible_quick_quiz(index):
+    """Retorna (rotas, etapas, pesos) de todas as perguntas de quiz possíveis.
+
+    Os pesos reproduzem o sorteio original: órgão uniforme, depois via
+    uniforme dentro do órgão, depois etapa uniforme dentro da via.
+    """
+    routes, steps, weights = [], [], []
+    num_organs = len(index.organ_keys)
+    for organ_key in index.organ_keys:
+        organ_routes = index.organ_routes(organ_key)
+        for route_id in organ_routes:
+            num_steps = len(index.route(route_id)) - 1
+            for step in range(num_steps):
+                routes.append(route_id)
+                steps.append(step)
+                weights.append(1 / (num_organs * len(organ_routes) * num_steps))
+    return routes, steps, weights
+
+
+def _eligible_clinical(index):
+    """Retorna (rotas, etapas, pesos) de todos os casos clínicos possíveis."""
+    routes, steps, weights = [], [], []
+    organ_keys = [k for k in CASE_TEMPLATES if k in index.organ_keys]
+    for organ_key in organ_keys:
+        step = CASE_ANSWER_STEP.get(organ_key, 0)
+        organ_routes = [r for r in index.organ_routes(organ_key) if len(index.route(r)) > step]
+        for route_id in organ_routes:
+            routes.append(route_id)
+            steps.append(step)
+            weights.append(1 / (len(organ_keys) * len(organ_routes)))
+    return routes, steps, weights
+
+
+def _eligible_sequence(index):
+    """Retorna (rotas, etapas, pesos) de todos os jogos de sequência possíveis."""
+    routes, weights = [], []
+    num_organs = len(index.organ_keys)
+    for organ_key in index.organ_keys:
+        organ_routes = [r for r in index.organ_routes(organ_key) if len(index.route(r)) > 1]
+        for route_id in organ_routes:
+            routes.append(route_id)
+            weights.append(1 / (num_organs * len(organ_routes)))
+    return routes, [0] * len(routes), weights
+
+
+_ELIGIBLE = {
+    QUICK_QUIZ: _eligible_quick_quiz,
+    CLINICAL_CASE: _eligible_clinical,
+    SEQUENCE: _eligible_sequence,
+}
+
+
+def _alias_table(p):
+    """Tabela de alias de Vose: permite sortear com pesos arbitrários em O(1)."""
+    n = len(p)
+    scaled = p * n
+    prob = np.ones(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1]
+    large = [i for i in range(n) if scaled[i] >= 1]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = scaled[s], l
+        scaled[l] -= 1 - scaled[s]
+        (small if scaled[l] < 1 else large).append(l)
+    return prob, alias
+
+
+@dataclass(frozen=True, eq=False)
+class EligibleSet:
+    """Todas as perguntas válidas de um tipo, com tabela de alias para sorteio ponderado.
+
+    Como só contém tuplas (via, etapa) válidas, o sorteio nunca precisa
+    rejeitar e refazer uma escolha.
+    """
+    routes: np.ndarray
+    steps: np.ndarray
+    p: np.ndarray
+    prob: np.ndarray
+    alias: np.ndarray
+
+    def __len__(self):
+        return len(self.routes)
+
+    def sample(self, rng, n):
+        """Sorteia até n posições distintas, cada sorteio em O(1)."""
+        size = len(self.routes)
+        n = min(n, size)
+        if n == size:
+            return rng.permutation(size)
+        picks = {}
+        while len(picks) < n:
+            m = 2 * (n - len(picks))
+            draws = rng.integers(size, size=m)
+            draws = np.where(rng.random(m) < self.prob[draws], draws, self.alias[draws])
+            for i in draws.tolist():
+                picks.setdefault(i)
+                if len(picks) == n:
+                    break
+        return np.fromiter(picks, dtype=np.intp, count=n)
+
+
+def cached_by_fingerprint(maxsize):
+    """Como ``lru_cache``, mas a chave usa ``index.fingerprint`` no lugar do índice.
+
+    Uma chave com o próprio índice manteria vivos, depois de uma recarga do
+    conjunto de dados, o índice antigo e os arquivos mapeados por ele.
+    """
+    def decorate(func):
+        cache, lock = OrderedDict(), threading.Lock()
+
+        @wraps(func)
+        def wrapper(index, *args):
+            key = (index.fingerprint, *args)
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+            value = func(index, *args)
+            with lock:
+                cache[key] = value
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return value
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+    return decorate
+
+
+@cached_by_fingerprint(maxsize=16)
+def eligible_questions(index, kind):
+    """Pré-calcula, uma vez por índice, o conjunto de perguntas válidas do tipo.
+
+    Levanta ``NoEligibleQuestionsError`` se o conjunto de dados não tiver
+    nenhuma via que sirva para esse tipo de pergunta.
+    """
+    routes, steps, weights = _ELIGIBLE[kind](index)
+    if not routes:
+        raise NoEligibleQuestionsError(f"Nenhuma pergunta do tipo '{kind}' pode ser gerada com este conjunto de dados.")
+    p = np.asarray(weights)
+    p = p / p.sum()
+    prob, alias = _alias_table(p)
+    return EligibleSet(np.asarray(routes), np.asarray(steps), p, prob, alias)
+
+
+def difficulty_for(accuracy):
+    """Fração dos distratores tirada das estruturas próximas, dado o acerto recente (0 a 1)."""
+    return min(max((accuracy - ADAPTIVE_LOW) / (ADAPTIVE_HIGH - ADAPTIVE_LOW), 0.0), 1.0)
+
+
+def _near_candidates(rng, index, answers):
+    """Estruturas próximas de cada resposta, embaralhadas só entre posições vizinhas do ranking."""
+    offsets, nodes = np.asarray(index.near_offsets), np.asarray(index.near_nodes)
+    starts = offsets[answers]
+    lengths = offsets[answers + 1] - starts
+    width = int(lengths.max(initial=0))
+    if width == 0:
+        return np.empty((len(answers), 0), dtype=np.intp)
+    ranks = np.arange(width)
+    candidates = np.where(ranks < lengths[:, None], nodes[np.minimum(starts[:, None] + ranks, len(nodes) - 1)], -1)
+    order = np.argsort(ranks + rng.random(candidates.shape) * NEAR_JITTER, axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def _uniform_options(rng, num_nodes, answers, excluded, k):
+    """Sorteio exato por chaves aleatórias sobre todas as estruturas, para grafos pequenos demais."""
+    n = len(answers)
+    keys = rng.random((n, num_nodes))
+    rows = np.arange(n)
+    keys[rows, answers] = np.inf
+    for column in excluded:
+        keys[rows, column] = np.inf
+    return np.argpartition(keys, k - 1, axis=1)[:, :k]
+
+
+def draw_options(rng, num_nodes, answers, excluded, index=None, difficulty=0.0):
+    """Monta as alternativas de todas as perguntas do lote de uma só vez.
+
+    Cada linha recebe ``NUM_DISTRACTORS`` estruturas distintas, diferentes da
+    resposta e das estruturas excluídas. Com o ``index`` e ``difficulty`` > 0,
+    cada distrator vem, com essa probabilidade, das estruturas próximas da
+    resposta pré-calculadas no índice; os demais são sorteados uniformemente.
+    O custo por pergunta não depende do número de estruturas do grafo.
+    """
+    answers = np.asarray(answers)
+    n = len(answers)
+    k = min(NUM_DISTRACTORS, num_nodes - 1 - len(excluded))
+    if k <= 0:
+        distractors = np.empty((n, 0), dtype=np.intp)
+    else:
+        near = (_near_candidates(rng, index, answers) if index is not None and difficulty > 0
+                else np.empty((n, 0), dtype=np.intp))
+        uniform = rng.integers(num_nodes, size=(n, UNIFORM_DRAWS * k + len(excluded)))
+        candidates = np.concatenate([near, uniform], axis=1)
+
+        valid = (candidates >= 0) & (candidates != answers[:, None])
+        for column in excluded:
+            valid &= candidates != np.asarray(column)[:, None]
+        # Cada linha usa só o número sorteado de distratores próximos
+        hard = rng.binomial(k, difficulty, size=n) if near.shape[1] else np.zeros(n, dtype=np.intp)
+        valid[:, :near.shape[1]] &= np.cumsum(valid[:, :near.shape[1]], axis=1) <= hard[:, None]
+        # Uma estrutura repetida só vale na primeira ocorrência válida
+        same = candidates[:, :, None] == candidates[:, None, :]
+        valid &= ~(np.tril(same, -1) & valid[:, None, :]).any(axis=2)
+
+        first = np.argsort(~valid, axis=1, kind="stable")[:, :k]
+        distractors = np.take_along_axis(candidates, first, axis=1)
+        short = valid.sum(axis=1) < k
+        if short.any():
+            distractors[short] = _uniform_options(rng, num_nodes, answers[short],
+                                                  [np.asarray(c)[short] for c in excluded], k)
+    options = np.concatenate([distractors, answers[:, None]], axis=1)
+    return rng.permuted(options, axis=1)
+
+
+def generate_batch(index, kind, n, seed=None, difficulty=0.0):
+    """Gera até n perguntas distintas do tipo indicado em um único lote.
+
+    A mesma semente produz sempre o mesmo lote para o mesmo índice.
+    ``difficulty`` (0 a 1, ver ``difficulty_for``) é a fração esperada de
+    distratores próximos da resposta no grafo.
+    """
+    rng = np.random.default_rng(seed)
+    eligible = eligible_questions(index, kind)
+    picks = eligible.sample(rng, n)
+    return _build_questions(index, kind, eligible.routes[picks], eligible.steps[picks], rng, difficulty)
+
+
+def generate_for_items(index, kind, items, seed=None, difficulty=0.0):
+    """Gera as perguntas das posições indicadas do conjunto elegível (p. ex. escolhidas pelo agendador)."""
+    rng = np.random.default_rng(seed)
+    eligible = eligible_questions(index, kind)
+    items = np.asarray(items, dtype=np.intp)
+    return _build_questions(index, kind, eligible.routes[items], eligible.steps[items], rng, difficulty)
+
+
+def _build_questions(index, kind, routes, steps, rng, difficulty=0.0):
+    """Monta as perguntas de um lote de (via, etapa) com alternativas vetorizadas."""
+    if kind == QUICK_QUIZ:
+        current = index.nodes_at(routes, steps)
+        answers = index.nodes_at(routes, steps + 1)
+        options = draw_options(rng, index.num_nodes, answers, [current], index, difficulty)
+        return [
+            Question(kind, int(r), int(s), int(a), tuple(int(o) for o in opts))
+            for r, s, a, opts in zip(routes, steps, answers, options)
+        ]
+
+    if kind == CLINICAL_CASE:
+        answers = index.nodes_at(routes, steps)
+        options = draw_options(rng, index.num_nodes, answers, [], index, difficulty)
+        names = rng.integers(len(PATIENT_NAMES), size=len(routes))
+        ages = rng.integers(PATIENT_AGES[0], PATIENT_AGES[1] + 1, size=len(routes))
+        sexes = rng.integers(len(PATIENT_SEXES), size=len(routes))
+        return [
+            Question(kind, int(r), int(s), int(a), tuple(int(o) for o in opts),
+                     patient=(int(nm), int(ag), int(sx)))
+            for r, s, a, opts, nm, ag, sx in zip(routes, steps, answers, options, names, ages, sexes)
+        ]
+
+    questions = []
+    for route_id in routes:
+        length = len(index.route(route_id))
+        # Garante que a ordem exibida não seja a própria sequência correta
+        order = rng.permutation(length)
+        while (order == np.arange(length)).all():
+            order = rng.permutation(length)
+        questions.append(Question(kind, int(route_id), order=tuple(int(i) for i in order)))
+    return questions
+
+
+@cached_by_fingerprint(maxsize=4096)
+def question_payload(index, question):
+    """Textos exibidos para uma pergunta compacta; o resultado é compartilhado e não deve ser alterado."""
+    route = index.route(question.route_id)
+    organ_name = index.organ_names[index.route_organs[question.route_id]]
+    route_name = index.route_names[question.route_id]
+
+    if question.kind == SEQUENCE:
+        caminho = [index.node_names[n] for n in route]
+        return {
+            "organ": organ_name,
+            "route": route_name,
+            "correct_sequence": caminho,
+            "current_sequence": [caminho[i] for i in question.order]
+        }
+
+    if question.kind == QUICK_QUIZ:
+        prompt = f"A linfa do órgão **{organ_name}** (via: *{route_name}*) está na estrutura **{index.node_names[route[question.step]]}**. Para qual estrutura ela segue?"
+    else:
+        organ_key = index.organ_keys[index.route_organs[question.route_id]]
+        name, age, sex = question.patient
+        prompt = CASE_TEMPLATES[organ_key].format(
+            name=PATIENT_NAMES[name],
+            age=age,
+            sex=PATIENT_SEXES[sex],
+            location=route_name
+        )
+
+    return {
+        "prompt": prompt,
+        "options": [index.node_names[n] for n in question.options],
+        "correct_answer": index.node_names[question.answer]
+    }
+
+
+@dataclass(frozen=True)
+class Grade:
+    """Correção de uma resposta.
+
+    - ``steps``: (etapa do trajeto cobrada, acerto)
+    - ``edges``: ((estrutura, estrutura seguinte), acerto) de cada transição cobrada
+    - ``credit``: crédito parcial de 0 a 1 (na múltipla escolha, 0 ou 1)
+    """
+    correct: bool
+    steps: tuple
+    edges: tuple
+    credit: float
+
+
+def lis_length(values):
+    """Comprimento da maior subsequência estritamente crescente, em O(n log n)."""
+    tails = []
+    for value in values:
+        i = bisect_left(tails, value)
+        if i == len(tails):
+            tails.append(value)
+        else:
+            tails[i] = value
+    return len(tails)
+
+
+def _credit(lis, length):
+    # Ordem invertida vale 0 (só uma estrutura "em ordem"), ordem correta vale 1
+    if length < 2:
+        return float(lis == length)
+    return max(lis - 1, 0) / (length - 1)
+
+
+def sequence_credit(route, answer):
+    """Crédito parcial de uma sequência: a maior parte dela que já está na ordem relativa correta."""
+    position = {node: i for i, node in enumerate(route)}
+    return _credit(lis_length(position[n] for n in answer if n in position), len(route))
+
+
+def sequence_credits(positions, lengths):
+    """Crédito parcial de muitas sequências de uma vez, para correções em lote.
+
+    ``positions`` é uma matriz (respostas, estruturas) com a posição correta de
+    cada estrutura na ordem escolhida pelo aluno (-1 nas casas vazias) e
+    ``lengths`` o tamanho de cada via. Calcula a maior subsequência crescente
+    de todas as linhas juntas, com uma busca binária vetorizada por coluna.
+    """
+    positions = np.asarray(positions)
+    lengths = np.asarray(lengths)
+    num_rows, width = positions.shape
+    rows = np.arange(num_rows)
+    tails = np.full((num_rows, max(width, 1)), np.iinfo(np.int64).max)
+    lis = np.zeros(num_rows, dtype=np.int64)
+    for column in positions.T:
+        lo, hi = np.zeros(num_rows, dtype=np.intp), np.full(num_rows, width, dtype=np.intp)
+        for _ in range(max(width, 1).bit_length()):
+            mid = (lo + hi) // 2
+            right = (lo < hi) & (tails[rows, np.minimum(mid, width - 1)] < column)
+            lo, hi = np.where(right, mid + 1, lo), np.where((lo < hi) & ~right, mid, hi)
+        valid = column >= 0
+        tails[rows[valid], lo[valid]] = column[valid]
+        lis = np.where(valid, np.maximum(lis, lo + 1), lis)
+    short = lengths < 2
+    credits = np.maximum(lis - 1, 0) / np.maximum(lengths - 1, 1)
+    return np.where(short, (lis == lengths).astype(float), credits)
+
+
+def grade(index, question, answer):
+    """Corrige uma resposta: o id da estrutura escolhida ou, na sequência, os ids na ordem do aluno.
+
+    Levanta ``ValueError`` se a sequência não contiver cada estrutura da via
+    exatamente uma vez.
+    """
+    route = tuple(index.route(question.route_id))
+    if question.kind == SEQUENCE:
+        answer = tuple(answer)
+        position = {node: i for i, node in enumerate(answer)}
+        if len(answer) != len(route) or set(position) != set(route):
+            raise ValueError("A sequência deve conter cada estrutura da via exatamente uma vez.")
+        # Cada estrutura conta pela posição; cada transição, por ter sido mantida em sequência
+        return Grade(
+            answer == route,
+            tuple((i, position[node] == i) for i, node in enumerate(route)),
+            tuple(((a, b), position[b] == position[a] + 1) for a, b in zip(route, route[1:])),
+            sequence_credit(route, answer)
+        )
+
+    correct = answer == question.answer
+    step = question.step
+    if question.kind == QUICK_QUIZ:
+        return Grade(correct, ((step + 1, correct),), (((route[step], question.answer), correct),), float(correct))
+    edges = (((route[step - 1], route[step]), correct),) if step > 0 else ()
+    return Grade(correct, ((step, correct),), edges, float(correct))
@@ -0,0 +1,119 @@
+"""Agendador de revisão espaçada (SM-2) para as perguntas do quiz rápido.
+
+Cada item é uma posição no conjunto de perguntas elegíveis do quiz
+(órgão, via, etapa). Só os itens já vistos ocupam memória: eles ficam em um
+heap ordenado pela próxima revisão, e itens novos são introduzidos em uma
+ordem pseudoaleatória calculada em O(1), sem percorrer o conjunto inteiro.
+"""
+
+import heapq
+import math
+import struct
+
+# Intervalos (s) das primeiras revisões e do reaprendizado após um erro
+LEARNING_STEPS = (10 * 60, 24 * 60 * 60)
+RELEARN_DELAY = 30
+MIN_EASE = 1.3
+INITIAL_EASE = 2.5
+# Repetições a partir das quais o item deixa a fase de aprendizado
+MASTERED_REPS = len(LEARNING_STEPS) + 1
+
+# item (i4), próxima revisão (i8), intervalo (f4), facilidade x100 (H), repetições (B)
+_RECORD = struct.Struct("<iqfHB")
+_HEADER = struct.Struct("<iqq")
+
+
+class ReviewScheduler:
+    """Fila de revisões de um aluno, priorizada pela data da próxima revisão."""
+
+    def __init__(self, num_items, seed=0):
+        self.num_items = num_items
+        self.seed = seed
+        self.new_cursor = 0
+        # Passo da bijeção afim k -> (k * step + seed) mod n; precisa ser coprimo com n
+        self._step = (seed % num_items) * 2 + 1 if num_items > 1 else 1
+        while math.gcd(self._step, num_items) != 1:
+            self._step += 2
+        self._items = {}  # item -> [due, interval, ease, reps]
+        self._heap = []   # (due, item); entradas antigas são descartadas ao sair do heap
+        self._mastered = 0
+
+    def _new_item(self, k):
+        """k-ésimo item novo, por uma bijeção afim sobre 0..n-1 (sem guardar permutação)."""
+        return (k * self._step + self.seed) % self.num_items
+
+    def _peek_due(self):
+        """Remove entradas obsoletas do topo do heap e retorna (due, item) ou None."""
+        while self._heap:
+            due, item = self._heap[0]
+            if self._items[item][0] == due:
+                return due, item
+            heapq.heappop(self._heap)
+        return None
+
+    def next_item(self, now):
+        """Escolhe o próximo item em O(log n): uma revisão vencida, um item novo ou a revisão mais próxima."""
+        top = self._peek_due()
+        if top is not None and top[0] <= now:
+            return top[1]
+        if self.new_cursor < self.num_items:
+            return self._new_item(self.new_cursor)
+        return top[1] if top is not None else 0
+
+    def review(self, item, correct, now):
+        """Atualiza o item segundo o SM-2 e o reagenda."""
+        if item not in self._items:
+            self._items[item] = [0, 0.0, INITIAL_EASE, 0]
+            if item == self._new_item(self.new_cursor):
+                self.new_cursor += 1
+        state = self._items[item]
+        _, interval, ease, reps = state
+        was_mastered = reps >= MASTERED_REPS
+
+        quality = 4 if correct else 1
+        ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+        if not correct:
+            reps, interval = 0, RELEARN_DELAY
+        elif reps < len(LEARNING_STEPS):
+            interval = LEARNING_STEPS[reps]
+            reps += 1
+        else:
+            interval = interval * ease
+            reps += 1
+
+        due = int(now + interval)
+        state[:] = [due, interval, ease, min(reps, 255)]
+        self._mastered += (state[3] >= MASTERED_REPS) - was_mastered
+        heapq.heappush(self._heap, (due, item))
+
+        # Compacta o heap quando as entradas obsoletas passam a dominar (custo amortizado O(1))
+        if len(self._heap) > 2 * len(self._items) + 16:
+            self._heap = [(state[0], i) for i, state in self._items.items()]
+            heapq.heapify(self._heap)
+
+    @property
+    def seen(self):
+        return len(self._items)
+
+    def mastered(self):
+        """Número de itens que já passaram da fase de aprendizado, mantido por ``review``."""
+        return self._mastered
+
+    def to_bytes(self):
+        """Serializa o estado em registros binários de tamanho fixo."""
+        parts = [_HEADER.pack(self.num_items, self.seed, self.new_cursor)]
+        for item, (due, interval, ease, reps) in self._items.items():
+            parts.append(_RECORD.pack(item, due, interval, round(ease * 100), reps))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data):
+        num_items, seed, new_cursor = _HEADER.unpack_from(data)
+        scheduler = cls(num_items, seed)
+        scheduler.new_cursor = new_cursor
+        for item, due, interval, ease, reps in _RECORD.iter_unpack(data[_HEADER.size:]):
+            scheduler._items[item] = [due, interval, ease / 100, reps]
+            scheduler._heap.append((due, item))
+            scheduler._mastered += reps >= MASTERED_REPS
+        heapq.heapify(scheduler._heap)
+        return scheduler
@@ -0,0 +1,94 @@
+"""Controle da memória ocupada pelas sessões: tamanho do estado e remoção de sessões ociosas.
+
+Independe do Streamlit: o app fornece as funções que gravam o progresso e
+encerram uma sessão.
+"""
+
+import logging
+import sys
+import threading
+import time
+
+from background import guarded_step
+
+logger = logging.getLogger(__name__)
+
+
+def deep_sizeof(obj, _seen=None):
+    """Bytes ocupados por ``obj`` e por tudo o que ele referencia (contando cada objeto uma vez)."""
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif isinstance(obj, memoryview):
+        size += obj.nbytes
+    elif isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        pass
+    else:
+        if hasattr(obj, "__dict__"):
+            size += deep_sizeof(vars(obj), seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+class IdleSessionReaper:
+    """Encerra as sessões sem reruns há mais de ``idle_timeout`` segundos.
+
+    Vale também para abas esquecidas abertas, com o navegador ainda conectado:
+    quem continua respondendo gera reruns e nunca fica ocioso. Antes de
+    encerrar uma sessão, ``persist()`` é chamado para que todo o progresso
+    pendente chegue ao disco; em seguida ``close(session_id)`` descarta o
+    estado dela. ``failures`` conta as varreduras que falharam.
+    """
+
+    def __init__(self, idle_timeout, persist, close, sweep_interval=None):
+        self.idle_timeout = idle_timeout
+        self.persist = persist
+        self.close = close
+        self.failures = 0
+        self.sweep_interval = sweep_interval or max(idle_timeout / 4, 1.0)
+        self._last_seen = {}
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="session-reaper", daemon=True)
+        self._thread.start()
+
+    def touch(self, session_id, now=None):
+        """Marca a sessão como ativa."""
+        with self._lock:
+            self._last_seen[session_id] = time.monotonic() if now is None else now
+
+    def __len__(self):
+        with self._lock:
+            return len(self._last_seen)
+
+    def sweep(self, now=None):
+        """Grava o progresso e encerra as sessões ociosas; retorna os ids encerrados."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            idle = [sid for sid, seen in self._last_seen.items() if now - seen > self.idle_timeout]
+        if not idle:
+            return []
+        self.persist()
+        evicted = []
+        for session_id in idle:
+            with self._lock:
+                # A sessão pode ter voltado a ser usada enquanto o progresso era gravado
+                if now - self._last_seen.get(session_id, now) <= self.idle_timeout:
+                    continue
+                del self._last_seen[session_id]
+            self.close(session_id)
+            evicted.append(session_id)
+        return evicted
+
+    def _run(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            # Se falhar, as sessões continuam registradas para a próxima varredura
+            guarded_step(self, self.sweep, logger, "Falha ao liberar as sessões ociosas")
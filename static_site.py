@@ -0,0 +1,194 @@
+"""Exportação estática dos fluxogramas e das páginas de estudo.
+
+Os fluxogramas e os resumos por órgão são iguais para todos os alunos.
+Este módulo os gera uma única vez em um pacote de arquivos estáticos, que
+pode ser servido por uma CDN ou por um servidor de arquivos comum. Com
+``DRENAGEM_STATIC_URL`` definida, o app passa a apontar para esses arquivos
+em vez de refazer o layout, e o servidor Streamlit fica só com os jogos.
+
+O pacote fica em um subdiretório com o início do ``fingerprint`` do índice.
+Assim, as URLs de uma versão dos dados nunca servem arquivos de outra, e
+versões diferentes podem ficar lado a lado na CDN.
+
+Uso:
+    python static_site.py build --data data.json --out static_site --formats svg png
+"""
+
+import argparse
+import html
+import json
+import os
+import shutil
+
+from dataset import load_dataset
+from graph_render import DEFAULT_STYLE, GRAPH_STYLES, build_merged_graph, build_route_graph, layout_image
+
+SITE_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+IMAGE_FORMATS = ("svg", "png")
+STYLE_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "style.css")
+
+
+def site_root(fingerprint):
+    """Subdiretório (e prefixo das URLs) do pacote de um índice."""
+    return fingerprint[:16]
+
+
+# Caminhos dos arquivos dentro do pacote; ids numéricos evitam acentos nas URLs
+def route_diagram(route_id, style=DEFAULT_STYLE, fmt="svg"):
+    return f"diagrams/route-{route_id}-{style}.{fmt}"
+
+
+def organ_diagram(organ_id, style=DEFAULT_STYLE, fmt="svg"):
+    return f"diagrams/organ-{organ_id}-{style}.{fmt}"
+
+
+def full_diagram(style=DEFAULT_STYLE, fmt="svg"):
+    return f"diagrams/all-{style}.{fmt}"
+
+
+def study_page(organ_id):
+    return f"estudo/organ-{organ_id}.html"
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def _page(title, body, up=""):
+    return (
+        '<!DOCTYPE html>\n<html lang="pt-BR">\n<head>\n<meta charset="utf-8">\n'
+        f"<title>{html.escape(title)} — Drenagem Linfática Abdominal</title>\n"
+        f'<link rel="stylesheet" href="{up}style.css">\n</head>\n<body>\n{body}</body>\n</html>\n'
+    )
+
+
+def _figure(src, alt):
+    return f'<p><img src="{src}" alt="{html.escape(alt)}" style="max-width: 100%;"></p>\n'
+
+
+def render_study_page(index, organ_key, images=True):
+    """Página de estudo de um órgão: vias, trajetos e fluxogramas."""
+    organ_id = index.organ_id(organ_key)
+    name = index.organ_names[organ_id]
+    route_ids = index.organ_routes(organ_key)
+    body = ['<p><a href="../index.html">← Todos os órgãos</a></p>\n',
+            f'<p class="main-header">{html.escape(name)}</p>\n',
+            f'<div class="pathway-info"><p><strong>Número de vias de drenagem:</strong> {len(route_ids)}</p></div>\n']
+    if images and len(route_ids) > 1:
+        body.append(_figure(f"../{organ_diagram(organ_id)}", f"Grafo unificado: {name}"))
+    for i, route_id in enumerate(route_ids, 1):
+        caminho = index.trajeto(route_id)
+        body.append(f"<h3>Via {i}: {html.escape(index.route_names[route_id])}</h3>\n<ol>\n")
+        for step, etapa in enumerate(caminho):
+            mark = " <em>(origem)</em>" if step == 0 else " <em>(destino final)</em>" if step == len(caminho) - 1 else ""
+            body.append(f"<li>{html.escape(etapa)}{mark}</li>\n")
+        body.append("</ol>\n")
+        if images:
+            body.append(_figure(f"../{route_diagram(route_id)}", f"Fluxograma: {index.route_names[route_id]}"))
+    return _page(name, "".join(body), up="../")
+
+
+def render_index_page(index, images=True):
+    """Página inicial do pacote, com a lista de órgãos e o grafo do abdome completo."""
+    body = ['<p class="main-header">Vias de Drenagem Linfática Abdominal</p>\n<ul>\n']
+    for organ_key in index.organ_keys:
+        organ_id = index.organ_id(organ_key)
+        body.append(f'<li><a href="{study_page(organ_id)}">{html.escape(index.organ_names[organ_id])}</a> '
+                    f"({len(index.organ_routes(organ_key))} vias)</li>\n")
+    body.append("</ul>\n")
+    if images:
+        body.append(_figure(full_diagram(), "Grafo unificado: Abdome completo"))
+    return _page("Vias de Drenagem", "".join(body))
+
+
+def build_site(index, out_dir, formats=("svg",), styles=tuple(GRAPH_STYLES), timeout=30.0):
+    """Gera o pacote estático do índice em ``out_dir`` e retorna o manifesto gravado.
+
+    O manifesto é gravado por último: um pacote sem ele está incompleto e é
+    ignorado pelo app.
+    """
+    root = os.path.join(out_dir, site_root(index.fingerprint))
+    graphs = {}
+    for style in styles:
+        for organ_key in index.organ_keys:
+            for route_id in index.organ_routes(organ_key):
+                graphs[(route_diagram, route_id, style)] = build_route_graph(index.trajeto(route_id), style)
+            organ_id = index.organ_id(organ_key)
+            graphs[(organ_diagram, organ_id, style)] = build_merged_graph(index, (organ_key,), style)
+        graphs[(full_diagram, None, style)] = build_merged_graph(index, index.organ_keys, style)
+
+    files = 0
+    for (path_of, key, style), graph in graphs.items():
+        for fmt in formats:
+            path = path_of(style=style, fmt=fmt) if key is None else path_of(key, style, fmt)
+            if fmt == "dot":
+                data = graph.source
+            else:
+                data = layout_image(graph.source, fmt, timeout)
+                if data is None:
+                    raise RuntimeError(f"O layout de {path} falhou: verifique se o Graphviz (dot) está instalado.")
+            _write(os.path.join(root, path), data)
+            files += 1
+
+    # As páginas mostram os diagramas do estilo padrão
+    images = "svg" in formats and DEFAULT_STYLE in styles
+    for organ_key in index.organ_keys:
+        _write(os.path.join(root, study_page(index.organ_id(organ_key))), render_study_page(index, organ_key, images))
+    _write(os.path.join(root, "index.html"), render_index_page(index, images))
+    shutil.copyfile(STYLE_SOURCE, os.path.join(root, "style.css"))
+
+    manifest = {
+        "format_version": SITE_FORMAT_VERSION,
+        "fingerprint": index.fingerprint,
+        "root": site_root(index.fingerprint),
+        "formats": list(formats),
+        "styles": list(styles),
+        "diagrams": files,
+        "pages": len(index.organ_keys) + 1,
+    }
+    _write(os.path.join(root, MANIFEST_FILE), json.dumps(manifest, indent=2))
+    return manifest
+
+
+def load_manifest(out_dir, fingerprint):
+    """Manifesto do pacote compilado para o índice indicado, ou None se não houver um válido."""
+    path = os.path.join(out_dir, site_root(fingerprint), MANIFEST_FILE)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format_version") != SITE_FORMAT_VERSION or manifest.get("fingerprint") != fingerprint:
+        return None
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Exporta os fluxogramas e as páginas de estudo como arquivos estáticos.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Gera o pacote estático de cada conjunto de dados.")
+    build.add_argument("--data", nargs="+", default=["data.json"], help="Arquivos JSON com os órgãos.")
+    build.add_argument("--out", default="static_site", help="Diretório de saída.")
+    build.add_argument("--formats", nargs="+", default=["svg"], choices=IMAGE_FORMATS + ("dot",),
+                       help="Formatos dos fluxogramas; as páginas de estudo usam o SVG.")
+    build.add_argument("--styles", nargs="+", default=list(GRAPH_STYLES), choices=list(GRAPH_STYLES))
+    build.add_argument("--timeout", type=float, default=30, help="Tempo limite (s) do layout de cada fluxograma.")
+    args = parser.parse_args(argv)
+
+    for data in args.data:
+        index = load_dataset(data).index
+        try:
+            manifest = build_site(index, args.out, formats=args.formats, styles=args.styles, timeout=args.timeout)
+        except RuntimeError as e:
+            parser.exit(1, f"{e}\n")
+        print(f"{data}: {manifest['diagrams']} fluxogramas e {manifest['pages']} páginas "
+              f"em {os.path.join(args.out, manifest['root'])}")
+
+
+if __name__ == "__main__":
+    main()
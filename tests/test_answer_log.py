@@ -0,0 +1,105 @@
+"""Registro colunar de respostas e sua leitura depois de edições do conjunto de dados."""
+
+import logging
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from answer_log import SCHEMA, AnswerLogWriter, load_answers
+from background import guarded_step
+from drainage_index import compile_index
+
+
+def organs(**routes):
+    """Um órgão por chave, cada um com as vias {nome: trajeto} indicadas."""
+    return {key: {"nome": key, "rotas": [{"Rota": name, "Trajeto": list(t)} for name, t in vias.items()]}
+            for key, vias in routes.items()}
+
+
+def record(writer, index, route_id, steps, student="s1", kind="quiz"):
+    route = index.route(route_id)
+    writer.append(student, kind, int(index.route_organs[route_id]), route_id,
+                  [(step, route[step], correct) for step, correct in steps])
+
+
+def rows(table, index):
+    """Linhas como (órgão, via, etapa, estrutura, acerto) com nomes, para comparar entre índices."""
+    return sorted(
+        (index.organ_keys[o], index.route_names[r], s, index.node_names[n], c)
+        for o, r, s, n, c in zip(*(table[col].to_pylist() for col in ["organ", "route", "step", "node", "correct"]))
+    )
+
+
+def test_same_index(tmp_path):
+    index = compile_index(organs(estomago={"Via 1": "ABCD"}))
+    writer = AnswerLogWriter(str(tmp_path), index, flush_interval=3600)
+    record(writer, index, 0, [(1, True), (2, False)])
+    writer.close()
+
+    table, hidden = load_answers(str(tmp_path), index)
+    assert hidden == 0
+    assert rows(table, index) == [("estomago", "Via 1", 1, "B", True), ("estomago", "Via 1", 2, "C", False)]
+
+
+def test_answers_survive_data_edits(tmp_path):
+    old = compile_index(organs(estomago={"Via 1": "ABCD", "Via 2": "EBF"}, baco={"Via 1": "GH"}))
+    writer = AnswerLogWriter(str(tmp_path), old, flush_interval=3600)
+    record(writer, old, 0, [(1, True), (2, False), (3, True)])
+    record(writer, old, 1, [(2, False)])
+    record(writer, old, 2, [(0, True)])
+    writer.close()
+
+    # Nova organização: um órgão novo antes dos outros, uma estrutura inserida
+    # na Via 1, a Via 2 sem F e o baço removido
+    new = compile_index(organs(figado={"Via 1": "XY"}, estomago={"Via 1": "AXBCD", "Via 2": "EB"}))
+    assert new.fingerprint != old.fingerprint
+    table, hidden = load_answers(str(tmp_path), new)
+    assert hidden == 2
+    assert rows(table, new) == [
+        ("estomago", "Via 1", 2, "B", True),
+        ("estomago", "Via 1", 3, "C", False),
+        ("estomago", "Via 1", 4, "D", True),
+    ]
+
+    # Respostas gravadas com o índice novo se somam às traduzidas
+    writer = AnswerLogWriter(str(tmp_path), new, flush_interval=3600)
+    record(writer, new, 1, [(2, False)])
+    writer.close()
+    table, hidden = load_answers(str(tmp_path), new)
+    assert hidden == 2 and table.num_rows == 4
+    assert rows(table, new).count(("estomago", "Via 1", 2, "B", False)) == 1
+
+
+def test_files_without_keys_are_counted_as_hidden(tmp_path):
+    index = compile_index(organs(estomago={"Via 1": "ABC"}))
+    schema = SCHEMA.with_metadata({"fingerprint": "outra versao"})
+    batch = pa.record_batch([pa.array([0, 0], pa.timestamp("ms")), pa.array(["s", "s"]), pa.array(["quiz"] * 2),
+                             pa.array([0, 0], pa.int16()), pa.array([0, 0], pa.int32()), pa.array([1, 2], pa.int16()),
+                             pa.array([1, 2], pa.int32()), pa.array([True, False])], schema=schema)
+    with open(tmp_path / "answers-antigo.arrows", "wb") as sink:
+        with ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(batch)
+
+    table, hidden = load_answers(str(tmp_path), index)
+    assert table.num_rows == 0 and hidden == 2
+
+
+def test_failed_flush_requeues_rows(tmp_path, monkeypatch):
+    index = compile_index(organs(estomago={"Via 1": "ABCD"}))
+    writer = AnswerLogWriter(str(tmp_path), index, flush_interval=3600)
+    record(writer, index, 0, [(1, True)])
+
+    def fail():
+        raise OSError("disco cheio")
+
+    monkeypatch.setattr(writer, "_open", fail)
+    error = guarded_step(writer, writer.flush, logging.getLogger(__name__), "Falha ao gravar")
+    assert isinstance(error, OSError) and writer.failures == 1
+    record(writer, index, 0, [(2, False)])
+    assert len(writer._pending) == 2
+
+    monkeypatch.undo()
+    writer.close()
+    table, hidden = load_answers(str(tmp_path), index)
+    # As linhas devolvidas à fila mantêm a ordem original
+    assert table["step"].to_pylist() == [1, 2] and hidden == 0
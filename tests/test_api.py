@@ -0,0 +1,147 @@
+"""API ASGI chamada diretamente, sem servidor, e tokens das perguntas."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from api import DrainageAPI
+from dataset import DatasetRegistry
+from question_tokens import InvalidTokenError, QuestionTokens, StaleTokenError
+from questions import QUICK_QUIZ, Question
+
+TTL = 60
+
+
+def write_organs(path, *routes):
+    path.write_text(json.dumps({"estomago": {"nome": "Estômago", "rotas": [
+        {"Rota": f"Via {i}", "Trajeto": list(trajeto)} for i, trajeto in enumerate(routes)
+    ]}}), encoding="utf-8")
+    return str(path)
+
+
+@pytest.fixture
+def api(tmp_path):
+    entries = {
+        "abdome": {"nome": "Abdome", "arquivo": write_organs(tmp_path / "a.json", "ABCDEF", "GBH")},
+        "outro": {"nome": "Outro", "arquivo": write_organs(tmp_path / "b.json", "ABCDEFG")},
+    }
+    registry = DatasetRegistry(entries, poll_interval=0)
+    return DrainageAPI(registry, QuestionTokens(b"segredo", max_age=TTL))
+
+
+def call(app, method, path, query="", body=None):
+    """Executa uma requisição no app ASGI e devolve (status, JSON da resposta)."""
+    raw = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8") if body is not None else b""
+    messages = [{"type": "http.request", "body": raw, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": query.encode("latin-1")}
+    asyncio.run(app(scope, receive, send))
+    start, body = sent
+    assert start["type"] == "http.response.start" and body["type"] == "http.response.body"
+    return start["status"], json.loads(body["body"])
+
+
+def test_token_round_trip():
+    tokens = QuestionTokens("segredo")
+    question = Question(QUICK_QUIZ, 3, 1, 7, (7, 2, 5), patient=())
+    assert tokens.decode(tokens.encode(question, "f" * 64), "f" * 64) == question
+    with pytest.raises(InvalidTokenError):
+        QuestionTokens("outro segredo").decode(tokens.encode(question, "f" * 64), "f" * 64)
+
+
+def test_tampered_token_is_rejected():
+    tokens = QuestionTokens("segredo")
+    token = tokens.encode(Question(QUICK_QUIZ, 0, 0, 1, (1, 2)), "f" * 64)
+    for bad in [token[:-2] + ("AA" if token[-2:] != "AA" else "BB"), token[:10], "", "!!!"]:
+        with pytest.raises(InvalidTokenError):
+            tokens.decode(bad, "f" * 64)
+
+
+def test_expired_and_stale_tokens():
+    tokens = QuestionTokens("segredo", max_age=TTL)
+    question = Question(QUICK_QUIZ, 0, 0, 1, (1, 2))
+    now = int(time.time())
+    token = tokens.encode(question, "f" * 64, now=now)
+    assert tokens.decode(token, "f" * 64, now=now + TTL) == question
+    with pytest.raises(InvalidTokenError) as expired:
+        tokens.decode(token, "f" * 64, now=now + TTL + 1)
+    assert not isinstance(expired.value, StaleTokenError)
+    with pytest.raises(StaleTokenError):
+        tokens.decode(token, "e" * 64, now=now)
+
+
+def test_questions_and_grade(api):
+    status, questions = call(api, "GET", "/v1/questions", "kind=quiz&n=3")
+    assert status == 200 and len(questions) == 3
+    for q in questions:
+        assert "answer" not in q and len(q["options"]) >= 2
+
+    answers = [{"token": q["token"], "answer": o["id"]} for q in questions for o in q["options"]]
+    status, results = call(api, "POST", "/v1/grade", body=answers)
+    assert status == 200 and len(results) == len(answers)
+    # Exatamente uma alternativa certa por pergunta
+    assert sum(r["correct"] for r in results) == len(questions)
+
+    status, (seq,) = call(api, "GET", "/v1/questions", "kind=sequence")
+    status, result = call(api, "POST", "/v1/grade", body={"token": seq["token"], "answer": [i["id"] for i in seq["items"]]})
+    assert status == 200 and 0 <= result["credit"] < 1 and not result["correct"]
+    right = [n["id"] for n in result["correct_sequence"]]
+    status, result = call(api, "POST", "/v1/grade", body={"token": seq["token"], "answer": right})
+    assert status == 200 and result["correct"] and result["credit"] == 1
+
+
+def test_expired_and_stale_tokens_over_http(api):
+    status, (q,) = call(api, "GET", "/v1/questions", "kind=quiz")
+    answer = q["options"][0]["id"]
+    status, body = call(api, "POST", "/v1/grade", "regiao=outro", body={"token": q["token"], "answer": answer})
+    assert status == 409
+
+    index = api.registry.get("abdome").index
+    question = api.tokens.decode(q["token"], index.fingerprint)
+    old = api.tokens.encode(question, index.fingerprint, now=time.time() - TTL - 5)
+    status, body = call(api, "POST", "/v1/grade", body={"token": old, "answer": answer})
+    assert status == 400 and "expirado" in body["error"]
+
+
+def test_boolean_answers_are_rejected(api):
+    status, (q,) = call(api, "GET", "/v1/questions", "kind=quiz")
+    assert call(api, "POST", "/v1/grade", body={"token": q["token"], "answer": True})[0] == 400
+    status, (seq,) = call(api, "GET", "/v1/questions", "kind=sequence")
+    answer = [True] * len(seq["items"])
+    assert call(api, "POST", "/v1/grade", body={"token": seq["token"], "answer": answer})[0] == 400
+
+
+@pytest.mark.parametrize("method, path, query, body, expected", [
+    ("GET", "/v2/organs", "", None, 404),
+    ("GET", "/v1/nada", "", None, 404),
+    ("DELETE", "/v1/grade", "", None, 405),
+    ("GET", "/v1/organs", "regiao=inexistente", None, 404),
+    ("GET", "/v1/routes/999", "", None, 404),
+    ("GET", "/v1/routes/x", "", None, 400),
+    ("GET", "/v1/questions", "kind=outro", None, 400),
+    ("GET", "/v1/questions", "n=muitas", None, 400),
+    ("GET", "/v1/questions", "difficulty=alta", None, 400),
+    ("POST", "/v1/grade", "", b"{nao e json", 400),
+    ("POST", "/v1/grade", "", {"answer": 1}, 400),
+    ("POST", "/v1/grade", "", {"token": "xyz", "answer": 1}, 400),
+])
+def test_error_statuses(api, method, path, query, body, expected):
+    status, payload = call(api, method, path, query, body)
+    assert status == expected and payload["error"]
+
+
+def test_organs_and_routes(api):
+    status, organs = call(api, "GET", "/v1/organs")
+    assert status == 200 and [o["key"] for o in organs] == ["estomago"]
+    assert [r["steps"] for r in organs[0]["routes"]] == [6, 3]
+    status, route = call(api, "GET", "/v1/routes/1")
+    assert status == 200 and [n["name"] for n in route["trajeto"]] == ["G", "B", "H"]
@@ -0,0 +1,146 @@
+"""Validação, recarga automática e registro dos conjuntos de dados."""
+
+import json
+import threading
+
+import pytest
+
+from dataset import DatasetError, DatasetRegistry, DatasetWatcher, validate_organs
+
+
+def organ(*routes):
+    return {"nome": "Órgão", "rotas": [{"Rota": f"Via {i}", "Trajeto": list(t)} for i, t in enumerate(routes)]}
+
+
+def write(path, organs):
+    path.write_text(json.dumps(organs), encoding="utf-8")
+    return str(path)
+
+
+def test_cycle_across_routes_is_rejected():
+    with pytest.raises(DatasetError) as e:
+        validate_organs({"estomago": organ(["A", "B", "C"]), "baco": organ(["C", "D", "A"])})
+    (problem,) = e.value.problems
+    assert "ciclo" in problem and problem.count(" → ") == 4
+
+
+def test_repeated_step_is_rejected():
+    with pytest.raises(DatasetError) as e:
+        validate_organs({"estomago": organ(["A", "B", "A", "C"])})
+    assert e.value.problems == ["órgão 'estomago', via 1: o trajeto passa mais de uma vez por A"]
+
+
+def test_schema_problems_are_all_reported():
+    with pytest.raises(DatasetError) as e:
+        validate_organs({
+            "estomago": {"nome": "", "rotas": [{"Rota": "Via", "Trajeto": []}]},
+            "baco": {"nome": "Baço", "rotas": "A"},
+            "figado": organ(["A", ""]),
+        })
+    assert len(e.value.problems) == 4
+
+
+def test_case_template_warnings():
+    warnings = validate_organs({
+        "estomago": organ(["A", "B"]),
+        "xyz": organ(["C", "D"]),
+        # O caso clínico do intestino grosso cobra a terceira etapa
+        "intestino_grosso": organ(["E", "F"]),
+    })
+    assert len(warnings) == 2
+    assert any("'xyz'" in w and "CASE_TEMPLATES" in w for w in warnings)
+    assert any("'intestino_grosso'" in w and "etapa 3" in w for w in warnings)
+    assert validate_organs({"estomago": organ(["A", "B"]), "intestino_grosso": organ(["E", "F", "G"])}) == []
+
+
+def test_watcher_swaps_versions_atomically(tmp_path):
+    path = write(tmp_path / "data.json", {"estomago": organ(["A", "B", "C"])})
+    watcher = DatasetWatcher(path, poll_interval=0)
+    old = watcher.current
+    assert not watcher.check()
+
+    write(tmp_path / "data.json", {"estomago": organ(["A", "B", "C"], ["D", "B", "E", "F"])})
+    assert watcher.check()
+    new = watcher.current
+    assert (old.version, new.version) == (1, 2)
+    # Quem pegou o instantâneo anterior continua com ele inteiro
+    assert old.index.num_routes == 1 and len(old.organs["estomago"]["rotas"]) == 1
+    assert new.index.num_routes == 2 and len(new.organs["estomago"]["rotas"]) == 2
+    assert old.index.fingerprint != new.index.fingerprint
+
+
+def test_watcher_keeps_previous_version_on_invalid_edit(tmp_path):
+    path = write(tmp_path / "data.json", {"estomago": organ(["A", "B", "C"])})
+    watcher = DatasetWatcher(path, poll_interval=0)
+    current = watcher.current
+
+    write(tmp_path / "data.json", {"estomago": organ(["A", "B", "A"])})
+    assert not watcher.check()
+    assert watcher.current is current and isinstance(watcher.last_error, DatasetError)
+
+    (tmp_path / "data.json").write_text("{", encoding="utf-8")
+    assert not watcher.check()
+    assert watcher.current is current and "JSON" in str(watcher.last_error)
+
+    write(tmp_path / "data.json", {"estomago": organ(["A", "B", "C", "D"])})
+    assert watcher.check() and watcher.last_error is None and watcher.current.version == 2
+
+
+def test_readers_never_see_a_mixed_version(tmp_path):
+    path = write(tmp_path / "data.json", {"estomago": organ(["A", "B"])})
+    watcher = DatasetWatcher(path, poll_interval=0)
+    stop, mixed = threading.Event(), []
+
+    def read():
+        while not stop.is_set():
+            dataset = watcher.current
+            if dataset.index.num_routes != len(dataset.organs["estomago"]["rotas"]):
+                mixed.append(dataset.version)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for n in range(2, 12):
+        write(tmp_path / "data.json", {"estomago": organ(*[["A", f"B{i}"] for i in range(n)])})
+        assert watcher.check()
+    stop.set()
+    for reader in readers:
+        reader.join()
+    assert not mixed and watcher.current.index.num_routes == 11
+
+
+@pytest.fixture
+def registry_files(tmp_path):
+    """Três conjuntos de tamanhos próximos e o tamanho em memória de cada um."""
+    entries = {
+        key: {"nome": key, "arquivo": write(tmp_path / f"{key}.json", {"estomago": organ([f"{key}{i}" for i in range(20)])})}
+        for key in "abc"
+    }
+    sizes = {key: DatasetWatcher(entry["arquivo"], poll_interval=0).current.nbytes for key, entry in entries.items()}
+    return entries, sizes
+
+
+def test_registry_evicts_least_recently_used(registry_files):
+    entries, sizes = registry_files
+    registry = DatasetRegistry(entries, poll_interval=0, max_bytes=sizes["a"] + sizes["b"] + sizes["c"] // 2)
+    a = registry.watcher("a")
+    registry.get("b")
+    registry.get("a")
+    registry.get("c")
+    # "b" era o menos usado
+    assert list(registry.resident()) == ["a", "c"]
+    assert sum(registry.resident().values()) <= registry.max_bytes
+
+    c = registry.watcher("c")
+    registry.get("a")
+    registry.get("b")
+    assert list(registry.resident()) == ["a", "b"]
+    assert c._stopped.is_set() and not a._stopped.is_set()
+
+
+def test_registry_keeps_requested_dataset_over_budget(registry_files):
+    entries, _ = registry_files
+    registry = DatasetRegistry(entries, poll_interval=0, max_bytes=1)
+    registry.get("a")
+    registry.get("b")
+    assert list(registry.resident()) == ["b"]
@@ -0,0 +1,63 @@
+"""Índice compilado do JSON e do DAG com troncos compartilhados."""
+
+import json
+import os
+
+import numpy as np
+
+from drainage_index import DagIndex, OrgansView, compile_dag, compile_index
+from sessions import deep_sizeof
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data.json")
+
+
+def load_organs():
+    with open(DATA, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_index_from_dag_matches_json():
+    organs = load_organs()
+    flat = compile_index(organs)
+    index = compile_dag(organs).compile_index()
+    assert isinstance(index, DagIndex)
+    assert index.fingerprint == flat.fingerprint
+    assert index.num_vertices < len(flat.route_nodes)
+    assert dict(OrgansView(index)) == organs
+    for route_id in range(flat.num_routes):
+        assert list(index.route(route_id)) == list(flat.route(route_id))
+    for node_id in range(flat.num_nodes):
+        assert list(index.routes_containing(node_id)) == list(flat.routes_containing(node_id))
+        assert list(index.near_distractors(node_id)) == list(flat.near_distractors(node_id))
+
+
+def test_nodes_at_matches_routes():
+    organs = load_organs()
+    flat, index = compile_index(organs), compile_dag(organs).compile_index()
+    routes = np.repeat(np.arange(flat.num_routes), 2)
+    steps = np.array([s for r in range(flat.num_routes) for s in (0, len(flat.route(r)) - 1)])
+    expected = [flat.route(r)[s] for r, s in zip(routes, steps)]
+    assert flat.nodes_at(routes, steps).tolist() == expected
+    assert index.nodes_at(routes, steps).tolist() == expected
+
+
+def test_organs_converging():
+    organs = {
+        "a": {"nome": "A", "rotas": [{"Rota": "1", "Trajeto": ["X", "T", "D"]}, {"Rota": "2", "Trajeto": ["Y", "D"]}]},
+        "b": {"nome": "B", "rotas": [{"Rota": "3", "Trajeto": ["Z", "T", "D"]}]},
+        "c": {"nome": "C", "rotas": [{"Rota": "4", "Trajeto": ["W"]}]},
+    }
+    for index in (compile_index(organs), compile_dag(organs).compile_index()):
+        converging = {name: [index.organ_keys[o] for o in index.organs_converging(index.node_ids[name])]
+                      for name in index.node_names}
+        assert converging == {"X": ["a"], "T": ["a", "b"], "D": ["a", "b"], "Y": ["a"], "Z": ["b"], "W": ["c"]}
+
+
+def test_dag_index_keeps_shared_trunks_once():
+    trunk = [f"Tronco {i}" for i in range(40)]
+    organs = {f"o{i}": {"nome": f"Órgão {i}", "rotas": [
+        {"Rota": f"Via {j}", "Trajeto": [f"Linfonodo {i}.{j}"] + trunk} for j in range(5)
+    ]} for i in range(40)}
+    flat, index = compile_index(organs), compile_dag(organs).compile_index()
+    assert index.fingerprint == flat.fingerprint
+    assert deep_sizeof(index) < deep_sizeof(flat) / 2
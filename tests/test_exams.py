@@ -0,0 +1,145 @@
+"""Geração equilibrada, aplicação e correção das provas."""
+
+import csv
+import os
+
+import numpy as np
+import pytest
+
+from dataset import load_dataset
+from exams import (
+    LATE_GRACE, RESULTS_FILE, Exam, ExamClosedError, ExamStartedError, InvalidStudentIdError, _quotas,
+    balanced_items, build_exam, close_exam, grade_exam
+)
+from questions import CLINICAL_CASE, QUICK_QUIZ, SEQUENCE, eligible_questions
+
+DATA = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data.json")
+
+
+@pytest.fixture(scope="module")
+def index():
+    return load_dataset(DATA).index
+
+
+@pytest.fixture
+def exam(tmp_path, index):
+    counts = {QUICK_QUIZ: 6, CLINICAL_CASE: 2, SEQUENCE: 2}
+    build_exam(index, tmp_path, "P1", forms=3, counts=counts, minutes=10, seed=7)
+    return Exam.open(os.path.join(tmp_path, "P1"))
+
+
+def test_quotas_split_evenly_and_rotate():
+    order, sizes = [0, 1, 2], {0: 10, 1: 10, 2: 10}
+    assert _quotas(order, sizes, 7, 0) == {0: 3, 1: 2, 2: 2}
+    assert _quotas(order, sizes, 7, 1) == {1: 3, 2: 2, 0: 2}
+    # Um órgão com poucas perguntas cede a sobra aos demais
+    quotas = _quotas(order, {0: 1, 1: 10, 2: 10}, 9, 0)
+    assert quotas[0] == 1 and sum(quotas.values()) == 9 and abs(quotas[1] - quotas[2]) <= 1
+
+
+@pytest.mark.parametrize("kind, n", [(QUICK_QUIZ, 14), (CLINICAL_CASE, 7), (SEQUENCE, 5)])
+def test_balanced_items(index, kind, n):
+    eligible = eligible_questions(index, kind)
+    items = balanced_items(index, kind, 6, n, np.random.default_rng(0))
+    assert items.shape == (6, n)
+    organs = np.asarray(index.route_organs)[eligible.routes]
+    organ_ids = np.unique(organs)
+    sizes = np.bincount(organs)[organ_ids]
+    for row in items:
+        assert len(set(row.tolist())) == n
+        counts = np.bincount(organs[row], minlength=organs.max() + 1)[organ_ids]
+        # Órgãos com perguntas suficientes diferem no máximo em uma pergunta
+        enough = counts[sizes >= -(-n // len(organ_ids))]
+        assert enough.max() - enough.min() <= 1
+        assert (counts >= np.minimum(n // len(organ_ids), sizes)).all()
+
+    # Dentro de cada órgão, uma pergunta só se repete depois de todas as outras
+    uses = np.bincount(items.ravel(), minlength=len(eligible))
+    for organ in organ_ids:
+        organ_uses = uses[organs == organ]
+        assert organ_uses.max() - organ_uses.min() <= 1
+
+
+def test_balanced_items_rejects_too_many(index):
+    with pytest.raises(ValueError):
+        balanced_items(index, SEQUENCE, 1, len(eligible_questions(index, SEQUENCE)) + 1, np.random.default_rng(0))
+
+
+def test_second_start_is_refused(exam):
+    record = exam.start("aluno1", now=100)
+    assert record["form"] == exam.form_of("aluno1") and record["started"] == 100
+    with pytest.raises(ExamStartedError):
+        exam.start("aluno1", now=200)
+    assert exam.submission("aluno1")["started"] == 100
+
+
+@pytest.mark.parametrize("code", ["a.b", "", "../x", "a b", "a/b"])
+def test_codes_changed_by_sanitizing_are_rejected(exam, code):
+    with pytest.raises(InvalidStudentIdError):
+        exam.start(code)
+    assert exam.submissions() == []
+
+
+def test_distinct_codes_do_not_share_a_submission(exam):
+    exam.start("ab")
+    with pytest.raises(InvalidStudentIdError):
+        exam.start("a.b")
+    exam.start("a-b")
+    assert [r["student"] for r in exam.submissions()] == ["a-b", "ab"]
+
+
+def _right_answers(exam, form):
+    key = exam.key[form]
+    return [[int(n) for n in row if n >= 0] if item["kind"] == SEQUENCE else int(row[0])
+            for item, row in zip(exam.forms[form], key)]
+
+
+def test_grade_exam_partial_credit(exam):
+    form = exam.form_of("perfeito")
+    answers = _right_answers(exam, form)
+    exam.submit("perfeito", answers, now=10)
+
+    # Mesmo formulário, com as sequências invertidas e as outras perguntas em branco
+    student = next(f"aluno{i}" for i in range(1000) if exam.form_of(f"aluno{i}") == form)
+    kinds = [item["kind"] for item in exam.forms[form]]
+    partial = [a[::-1] if kind == SEQUENCE else None for a, kind in zip(answers, kinds)]
+    exam.submit(student, partial, now=10)
+
+    records, forms, correct, credit = grade_exam(exam)
+    by_student = {r["student"]: i for i, r in enumerate(records)}
+    assert correct[by_student["perfeito"]].all() and (credit[by_student["perfeito"]] == 1).all()
+    row = by_student[student]
+    assert not correct[row].any()
+    assert (credit[row] == 0).all()
+
+    # Trocar só as duas primeiras estruturas vale (n - 2) / (n - 1)
+    swapped = list(answers)
+    sequences = [i for i, kind in enumerate(kinds) if kind == SEQUENCE]
+    for i in sequences:
+        swapped[i] = answers[i][1::-1] + answers[i][2:]
+    other = next(f"outro{i}" for i in range(1000) if exam.form_of(f"outro{i}") == form)
+    exam.submit(other, swapped, now=10)
+    records, forms, correct, credit = grade_exam(exam)
+    row = [r["student"] for r in records].index(other)
+    for i in sequences:
+        n = len(answers[i])
+        assert not correct[row, i] and credit[row, i] == pytest.approx((n - 2) / (n - 1))
+    assert correct[row, [i for i in range(len(kinds)) if i not in sequences]].all()
+
+
+def test_close_exam_flags_late_submissions(exam):
+    exam.start("pontual", now=0)
+    exam.submit("pontual", [None] * len(exam.forms[exam.form_of("pontual")]), now=exam.duration + LATE_GRACE)
+    exam.start("atrasado", now=0)
+    exam.submit("atrasado", [None] * len(exam.forms[exam.form_of("atrasado")]), now=exam.duration + LATE_GRACE + 1)
+    exam.start("ausente", now=0)
+
+    rows = {row["aluno"]: row for row in close_exam(exam)}
+    assert not rows["pontual"]["fora_do_prazo"] and rows["atrasado"]["fora_do_prazo"]
+    assert not rows["ausente"]["entregue"] and not rows["ausente"]["fora_do_prazo"]
+    assert all(row["nota"] == 0 for row in rows.values())
+
+    with open(os.path.join(exam.directory, RESULTS_FILE), encoding="utf-8") as f:
+        assert len(list(csv.DictReader(f))) == 3
+    with pytest.raises(ExamClosedError):
+        exam.start("novo")
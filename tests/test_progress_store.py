@@ -0,0 +1,43 @@
+"""Gravação em lote do progresso dos alunos."""
+
+import logging
+
+from background import guarded_step
+from progress_store import SQLiteProgressStore, WriteBehindWriter
+
+logger = logging.getLogger(__name__)
+
+
+class FailingStore(SQLiteProgressStore):
+    """Banco SQLite cuja próxima gravação em lote falha, depois de ``during`` ser chamado."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.fail_next, self.during = False, None
+
+    def save_many(self, snapshots):
+        if self.fail_next:
+            self.fail_next = False
+            if self.during:
+                self.during()
+            raise OSError("disco cheio")
+        super().save_many(snapshots)
+
+
+def test_failed_flush_requeues_snapshots(tmp_path):
+    store = FailingStore(str(tmp_path / "progress.sqlite3"))
+    writer = WriteBehindWriter(store, flush_interval=3600)
+    writer.put("a", {"score": 1})
+    writer.put("b", {"score": 2})
+
+    # Um instantâneo mais novo chega enquanto a gravação falha: ele não é sobrescrito
+    store.fail_next, store.during = True, lambda: writer.put("a", {"score": 3})
+    error = guarded_step(writer, writer.flush, logger, "Falha ao gravar o progresso")
+    assert isinstance(error, OSError) and writer.failures == 1
+    assert writer.pending() == 2
+    assert writer.load("a") == {"score": 3} and writer.load("b") == {"score": 2}
+    assert store.load("a") is None
+
+    assert guarded_step(writer, writer.flush, logger, "Falha ao gravar o progresso") is None
+    assert writer.failures == 1 and writer.pending() == 0
+    assert store.load("a") == {"score": 3} and store.load("b") == {"score": 2}
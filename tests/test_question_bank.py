@@ -0,0 +1,81 @@
+"""Sorteio do banco de perguntas mapeado em memória."""
+
+import pytest
+
+from drainage_index import compile_index
+from question_bank import DIFFICULTY_TIERS, QuestionBank, build_bank
+from questions import CLINICAL_CASE, QUICK_QUIZ, SEQUENCE, NoEligibleQuestionsError, eligible_questions
+
+
+BANK_ORGANS = {"estomago": {"nome": "Estômago", "rotas": [
+    {"Rota": "Via 1", "Trajeto": ["A", "B", "C", "D"]},
+    {"Rota": "Via 2", "Trajeto": ["E", "B", "F"]},
+]}}
+
+
+@pytest.fixture
+def bank(tmp_path):
+    index = compile_index(BANK_ORGANS)
+    build_bank(index, tmp_path, variants=16)
+    return QuestionBank.open(tmp_path, index)
+
+
+@pytest.mark.parametrize("kind", [QUICK_QUIZ, CLINICAL_CASE, SEQUENCE])
+def test_sample_never_repeats_a_question(bank, kind):
+    for seed in range(100):
+        batch = bank.sample(kind, 8, seed=seed)
+        keys = [(q.route_id, q.step) for q in batch]
+        assert batch and len(set(keys)) == len(keys)
+
+
+def _tier_options(bank, kind, tier):
+    rows = bank.tables[kind][bank.tables[kind]["tier"] == tier]
+    return {(int(r["route"]), int(r["step"]), tuple(int(o) for o in r["options"] if o >= 0)) for r in rows}
+
+
+@pytest.mark.parametrize("kind", [QUICK_QUIZ, CLINICAL_CASE])
+def test_sample_draws_from_requested_tier(bank, kind):
+    tiers = bank.tables[kind]["tier"]
+    assert (tiers[:-1] <= tiers[1:]).all()
+    for tier, difficulty in enumerate(DIFFICULTY_TIERS):
+        rows = _tier_options(bank, kind, tier)
+        for seed in range(20):
+            batch = bank.sample(kind, 4, seed=seed, difficulty=difficulty)
+            assert {(q.route_id, q.step, q.options) for q in batch} <= rows
+
+
+@pytest.mark.parametrize("difficulty", [0.0, 0.6, 1.0])
+def test_quiz_variant_matches_scheduled_item(bank, difficulty):
+    index = compile_index(BANK_ORGANS)
+    eligible = eligible_questions(index, QUICK_QUIZ)
+    for item in range(len(eligible)):
+        for seed in range(10):
+            question = bank.quiz_variant(item, seed=seed, difficulty=difficulty)
+            assert (question.route_id, question.step) == (eligible.routes[item], eligible.steps[item])
+    with pytest.raises(IndexError):
+        bank.quiz_variant(len(eligible))
+
+
+def test_kind_without_eligible_items_is_stored_empty(tmp_path):
+    # Nenhum órgão de CASE_TEMPLATES: não há casos clínicos
+    index = compile_index({"xyz": {"nome": "Xyz", "rotas": [{"Rota": "Via 1", "Trajeto": ["A", "B", "C"]}]}})
+    manifest = build_bank(index, tmp_path, variants=4)
+    assert manifest["counts"][CLINICAL_CASE] == 0
+    assert manifest["counts"][QUICK_QUIZ] > 0 and manifest["counts"][SEQUENCE] > 0
+
+    bank = QuestionBank.open(tmp_path, index)
+    with pytest.raises(NoEligibleQuestionsError):
+        bank.sample(CLINICAL_CASE, 4, seed=0)
+    assert bank.sample(QUICK_QUIZ, 4, seed=0)
+
+
+def test_rebuild_leaves_open_bank_readable(tmp_path):
+    index = compile_index(BANK_ORGANS)
+    build_bank(index, tmp_path, variants=16, seed=0)
+    bank = QuestionBank.open(tmp_path, index)
+    before = {kind: table.copy() for kind, table in bank.tables.items()}
+
+    build_bank(index, tmp_path, variants=16, seed=1)
+    for kind, table in bank.tables.items():
+        assert (table == before[kind]).all()
+    assert not list(tmp_path.glob("*.tmp"))
@@ -0,0 +1,202 @@
+"""Geração de perguntas em conjuntos de dados patológicos."""
+
+import gc
+import weakref
+
+import numpy as np
+import pytest
+
+from drainage_index import compile_index
+from questions import (
+    CLINICAL_CASE, NUM_DISTRACTORS, QUICK_QUIZ, SEQUENCE, NoEligibleQuestionsError, Question,
+    draw_options, eligible_questions, generate_batch, generate_for_items, grade, question_payload,
+    sequence_credit, sequence_credits
+)
+
+
+def organs(*routes, key="estomago"):
+    """Dicionário de órgãos com um órgão e as vias (listas de estruturas) indicadas."""
+    return {key: {"nome": "Órgão", "rotas": [
+        {"Rota": f"Via {i}", "Trajeto": list(trajeto)} for i, trajeto in enumerate(routes)
+    ]}}
+
+
+def chain(n, prefix="N"):
+    return [f"{prefix}{i}" for i in range(n)]
+
+
+def check_options(index, questions):
+    """Alternativas distintas, com a resposta e sem a estrutura em que a linfa está."""
+    for q in questions:
+        assert len(set(q.options)) == len(q.options)
+        assert q.answer in q.options
+        assert all(0 <= o < index.num_nodes for o in q.options)
+        if q.kind == QUICK_QUIZ:
+            route = index.route(q.route_id)
+            assert route[q.step] not in q.options
+            assert q.answer == route[q.step + 1]
+
+
+def test_single_node_routes_have_no_quiz_or_sequence():
+    index = compile_index(organs(["A"], ["B"]))
+    for kind in (QUICK_QUIZ, SEQUENCE):
+        with pytest.raises(NoEligibleQuestionsError):
+            eligible_questions(index, kind)
+        with pytest.raises(NoEligibleQuestionsError):
+            generate_batch(index, kind, 5, seed=0)
+
+
+def test_single_node_routes_still_give_clinical_cases():
+    index = compile_index(organs(["A"], ["B"], ["C", "D"]))
+    questions = generate_batch(index, CLINICAL_CASE, 10, seed=0)
+    assert {q.route_id for q in questions} == {0, 1, 2}
+    check_options(index, questions)
+
+
+def test_single_node_routes_are_skipped_among_valid_ones():
+    index = compile_index(organs(["A"], ["B", "C"], ["D"]))
+    assert set(eligible_questions(index, QUICK_QUIZ).routes.tolist()) == {1}
+    assert set(eligible_questions(index, SEQUENCE).routes.tolist()) == {1}
+
+
+def test_organ_without_case_template_has_no_clinical_cases():
+    index = compile_index(organs(["A", "B"], key="apendice"))
+    with pytest.raises(NoEligibleQuestionsError):
+        generate_batch(index, CLINICAL_CASE, 1)
+
+
+@pytest.mark.parametrize("difficulty", [0.0, 1.0])
+def test_two_node_graph(difficulty):
+    index = compile_index(organs(["A", "B"]))
+    quiz = generate_batch(index, QUICK_QUIZ, 5, seed=1, difficulty=difficulty)
+    # A única outra estrutura é a atual: não sobra nenhum distrator
+    assert [q.options for q in quiz] == [(1,)]
+    check_options(index, quiz)
+
+    clinical = generate_batch(index, CLINICAL_CASE, 5, seed=1, difficulty=difficulty)
+    assert sorted(clinical[0].options) == [0, 1]
+    check_options(index, clinical)
+
+    sequence = generate_batch(index, SEQUENCE, 5, seed=1)
+    assert [q.order for q in sequence] == [(1, 0)]
+
+
+@pytest.mark.parametrize("num_nodes", [3, 4])
+@pytest.mark.parametrize("difficulty", [0.0, 0.5, 1.0])
+def test_short_routes_run_out_of_distractors(num_nodes, difficulty):
+    index = compile_index(organs(chain(num_nodes)))
+    eligible = eligible_questions(index, QUICK_QUIZ)
+    for seed in range(50):
+        questions = generate_for_items(index, QUICK_QUIZ, range(len(eligible)), seed=seed, difficulty=difficulty)
+        check_options(index, questions)
+        # Todas as estruturas menos a atual, até o limite de distratores
+        assert all(len(q.options) == min(NUM_DISTRACTORS + 1, num_nodes - 1) for q in questions)
+
+
+@pytest.mark.parametrize("difficulty", [0.0, 0.3, 1.0])
+def test_options_distinct_and_exclude_current_node(difficulty):
+    # Troncos compartilhados e ramificações: muitos distratores próximos em comum
+    routes = [["A", "B", "C", "T1", "T2", "T3"], ["D", "B", "C", "T1", "T2"], ["E", "F", "T1", "T3"],
+              ["G", "F", "C", "T2"], ["H", "I", "J", "K", "L", "T3"]]
+    index = compile_index(organs(*routes))
+    eligible = eligible_questions(index, QUICK_QUIZ)
+    for seed in range(200):
+        batch = generate_batch(index, QUICK_QUIZ, len(eligible), seed=seed, difficulty=difficulty)
+        assert len({(q.route_id, q.step) for q in batch}) == len(batch) == len(eligible)
+        check_options(index, batch)
+        assert all(len(q.options) == NUM_DISTRACTORS + 1 for q in batch)
+
+
+def test_draw_options_when_excluded_equals_answer_pool():
+    rng = np.random.default_rng(0)
+    answers = np.array([0, 1, 2])
+    current = np.array([1, 2, 0])
+    options = draw_options(rng, 3, answers, [current])
+    for answer, cur, row in zip(answers, current, options):
+        assert sorted(row.tolist()) == sorted({0, 1, 2} - {cur})
+        assert answer in row
+
+
+def test_same_seed_same_batch():
+    index = compile_index(organs(chain(8), chain(5, "M")))
+    assert generate_batch(index, QUICK_QUIZ, 6, seed=7, difficulty=0.7) == \
+        generate_batch(index, QUICK_QUIZ, 6, seed=7, difficulty=0.7)
+
+
+def test_caches_do_not_keep_old_indexes_alive():
+    index = compile_index(organs(chain(5)))
+    payload = question_payload(index, generate_batch(index, QUICK_QUIZ, 1, seed=0)[0])
+    same = compile_index(organs(chain(5)))
+    # Mesmo conteúdo, mesmo fingerprint: o resultado já calculado é reaproveitado
+    assert eligible_questions(same, QUICK_QUIZ) is eligible_questions(index, QUICK_QUIZ)
+    assert question_payload(same, generate_batch(same, QUICK_QUIZ, 1, seed=0)[0]) is payload
+
+    ref = weakref.ref(index)
+    del index, same
+    gc.collect()
+    assert ref() is None
+
+
+@pytest.mark.parametrize("answer, credit", [
+    ((0, 1, 2, 3, 4), 1.0),
+    ((4, 3, 2, 1, 0), 0.0),
+    ((1, 0, 2, 3, 4), 0.75),
+    ((), 0.0),
+])
+def test_sequence_credit(answer, credit):
+    route = (0, 1, 2, 3, 4)
+    assert sequence_credit(route, answer) == credit
+    positions = np.array([list(answer) + [-1] * (len(route) - len(answer))])
+    assert sequence_credits(positions, [len(route)])[0] == credit
+
+
+def test_sequence_credits_match_scalar():
+    """Linhas de tamanhos diferentes, completadas com -1, e estruturas faltando no meio."""
+    rng = np.random.default_rng(0)
+    answers, routes = [], []
+    for _ in range(500):
+        length = int(rng.integers(1, 12))
+        answer = list(rng.permutation(length))
+        for i in rng.choice(length, size=int(rng.integers(0, length)), replace=False):
+            answer[i] = -1
+        answers.append(answer)
+        routes.append(tuple(range(length)))
+    width = max(len(a) for a in answers)
+    positions = np.array([a + [-1] * (width - len(a)) for a in answers])
+
+    credits = sequence_credits(positions, [len(r) for r in routes])
+    # Para o cálculo escalar, -1 é uma estrutura que não está na via
+    expected = [sequence_credit(route, answer) for route, answer in zip(routes, answers)]
+    assert np.allclose(credits, expected)
+
+
+def test_grade():
+    index = compile_index(organs(chain(5)))
+    route = tuple(index.route(0))
+
+    quiz = Question(QUICK_QUIZ, 0, step=1, answer=route[2], options=(route[2], route[4]))
+    right, wrong = grade(index, quiz, route[2]), grade(index, quiz, route[4])
+    assert right.correct and right.credit == 1.0
+    assert right.steps == ((2, True),) and right.edges == (((route[1], route[2]), True),)
+    assert not wrong.correct and wrong.credit == 0.0
+    assert wrong.steps == ((2, False),) and wrong.edges == (((route[1], route[2]), False),)
+
+    case = grade(index, Question(CLINICAL_CASE, 0, step=0, answer=route[0], options=(route[0],)), route[0])
+    assert case.correct and case.steps == ((0, True),) and case.edges == ()
+
+    perfect = grade(index, Question(SEQUENCE, 0), route)
+    assert perfect.correct and perfect.credit == 1.0
+    assert all(ok for _, ok in perfect.steps) and all(ok for _, ok in perfect.edges)
+
+    swapped = route[1:2] + route[:1] + route[2:]
+    partial = grade(index, Question(SEQUENCE, 0), swapped)
+    assert not partial.correct and partial.credit == 0.75
+    assert [ok for _, ok in partial.steps] == [False, False, True, True, True]
+    assert [ok for _, ok in partial.edges] == [False, False, True, True]
+
+    reversed_ = grade(index, Question(SEQUENCE, 0), route[::-1])
+    assert reversed_.credit == 0.0 and not any(ok for _, ok in reversed_.edges)
+
+    for answer in [(), route[:-1], route[:-1] + route[:1]]:
+        with pytest.raises(ValueError):
+            grade(index, Question(SEQUENCE, 0), answer)
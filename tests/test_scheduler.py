@@ -0,0 +1,97 @@
+"""Agendador de revisão espaçada (SM-2) do quiz rápido."""
+
+import random
+
+import pytest
+
+from scheduler import LEARNING_STEPS, MASTERED_REPS, RELEARN_DELAY, ReviewScheduler
+
+
+@pytest.mark.parametrize("num_items", [1, 2, 7, 12, 64, 1000])
+@pytest.mark.parametrize("seed", [0, 1, 5, 123456])
+def test_new_items_are_a_permutation(num_items, seed):
+    scheduler = ReviewScheduler(num_items, seed=seed)
+    assert sorted(scheduler._new_item(k) for k in range(num_items)) == list(range(num_items))
+
+
+def test_every_new_item_is_introduced_once():
+    scheduler = ReviewScheduler(50, seed=3)
+    now, seen = 0, []
+    for _ in range(50):
+        item = scheduler.next_item(now)
+        seen.append(item)
+        scheduler.review(item, True, now)
+    assert sorted(seen) == list(range(50)) and scheduler.new_cursor == 50
+
+
+def test_due_reviews_come_out_in_order():
+    scheduler = ReviewScheduler(5, seed=0)
+    for t in range(5):
+        scheduler.review(scheduler.next_item(t), True, t)
+    # Todos vistos e nenhum vencido: a revisão mais próxima é a do primeiro item
+    first = scheduler._new_item(0)
+    assert scheduler.next_item(10) == first
+
+    # Um erro traz o item de volta antes dos outros
+    missed = scheduler._new_item(3)
+    scheduler.review(missed, False, 100)
+    assert scheduler.next_item(100 + RELEARN_DELAY) == missed
+
+    # Depois do reaprendizado, a ordem volta a ser a das datas de revisão
+    scheduler.review(missed, True, 200)
+    due = sorted((state[0], item) for item, state in scheduler._items.items())
+    order = []
+    for _ in range(5):
+        item = scheduler.next_item(10 ** 9)
+        order.append(item)
+        scheduler.review(item, True, 10 ** 9 + 10 ** 8)
+    assert order == [item for _, item in due]
+
+
+def test_learning_steps_and_mastered_count():
+    scheduler = ReviewScheduler(3)
+    now = 0
+    for reps, step in enumerate(LEARNING_STEPS):
+        scheduler.review(0, True, now)
+        assert scheduler._items[0][0] == now + step
+        now += step
+    assert scheduler.mastered() == 0
+    scheduler.review(0, True, now)
+    assert scheduler.mastered() == 1
+    scheduler.review(0, False, now)
+    assert scheduler.mastered() == 0
+
+
+def test_mastered_counter_matches_scan():
+    rng = random.Random(0)
+    scheduler = ReviewScheduler(40, seed=7)
+    now = 0
+    for _ in range(2000):
+        now += rng.randrange(1, 10 ** 6)
+        scheduler.review(scheduler.next_item(now), rng.random() < 0.8, now)
+        assert scheduler.mastered() == sum(state[3] >= MASTERED_REPS for state in scheduler._items.values())
+
+
+def test_bytes_round_trip():
+    rng = random.Random(1)
+    scheduler = ReviewScheduler(30, seed=9)
+    now = 0
+    for _ in range(300):
+        now += rng.randrange(1, 10 ** 5)
+        scheduler.review(scheduler.next_item(now), rng.random() < 0.7, now)
+
+    restored = ReviewScheduler.from_bytes(scheduler.to_bytes())
+    assert (restored.num_items, restored.seed, restored.new_cursor) == (scheduler.num_items, scheduler.seed, scheduler.new_cursor)
+    assert restored.seen == scheduler.seen and restored.mastered() == scheduler.mastered()
+    for item, (due, interval, ease, reps) in scheduler._items.items():
+        assert restored._items[item][0] == due and restored._items[item][3] == reps
+        assert restored._items[item][1] == pytest.approx(interval, rel=1e-6)
+        assert restored._items[item][2] == pytest.approx(ease, abs=0.005)
+    assert restored.to_bytes() == scheduler.to_bytes()
+
+    # Mesmas escolhas a partir do estado restaurado
+    for t in range(now, now + 50 * 10 ** 5, 10 ** 5):
+        item = scheduler.next_item(t)
+        assert restored.next_item(t) == item
+        scheduler.review(item, True, t)
+        restored.review(item, True, t)
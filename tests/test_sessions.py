@@ -0,0 +1,51 @@
+"""Encerramento das sessões ociosas e medida do estado de cada sessão."""
+
+import gc
+import weakref
+
+from sessions import IdleSessionReaper, deep_sizeof
+
+
+class State(dict):
+    """Estado de sessão que aceita referência fraca, para verificar que foi liberado."""
+
+
+def make_reaper(sessions, events):
+    def persist():
+        events.append("persist")
+
+    def close(session_id):
+        events.append(("close", session_id))
+        del sessions[session_id]
+
+    return IdleSessionReaper(60, persist, close, sweep_interval=3600)
+
+
+def test_idle_session_state_is_released():
+    sessions = {"aba-esquecida": State(pool=list(range(1000))), "aluno-ativo": State()}
+    events = []
+    reaper = make_reaper(sessions, events)
+    ref = weakref.ref(sessions["aba-esquecida"])
+    reaper.touch("aba-esquecida", now=0)
+    reaper.touch("aluno-ativo", now=0)
+    reaper.touch("aluno-ativo", now=50)
+
+    assert reaper.sweep(now=100) == ["aba-esquecida"]
+    # O progresso é gravado antes de a sessão ser encerrada
+    assert events == ["persist", ("close", "aba-esquecida")]
+    assert list(sessions) == ["aluno-ativo"] and len(reaper) == 1
+    gc.collect()
+    assert ref() is None
+
+
+def test_nothing_to_release():
+    sessions, events = {"a": State()}, []
+    reaper = make_reaper(sessions, events)
+    reaper.touch("a", now=0)
+    assert reaper.sweep(now=30) == []
+    assert events == [] and "a" in sessions
+
+
+def test_deep_sizeof_counts_shared_objects_once():
+    shared = list(range(100))
+    assert deep_sizeof([shared, shared]) < deep_sizeof([shared, list(range(100))])